@@ -1,7 +1,6 @@
 import json
 import sys
 import os
-import shutil
 from PyQt6.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -24,6 +23,8 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtGui import QIcon, QFont, QMouseEvent, QKeySequence
 from PyQt6.QtCore import Qt, QPoint
 
+import trash
+
 def apply_styles(app):
     """Apply macOS-like styles to the application."""
     app.setStyleSheet("""
@@ -209,7 +210,7 @@ class Sidebar(QWidget):
 
         for folder in os.listdir(self.project_folder):
             folder_path = os.path.join(self.project_folder, folder)
-            if os.path.isdir(folder_path):
+            if os.path.isdir(folder_path) and not folder.startswith("."):  # Skip the trash
                 folder_item = QTreeWidgetItem(root_folder, [folder])
                 for file in os.listdir(folder_path):
                     if file.endswith(".json"):
@@ -330,13 +331,13 @@ class Sidebar(QWidget):
             file_path = os.path.join(self.project_folder, parent_item.text(0), current_item.text(0))
             print(f"Removing file: {file_path}")
             try:
+                # A rename into the trash, so it is instant and can be restored from the main app
                 if os.path.isfile(file_path):
-                    os.chmod(file_path, 0o777)  # Change file permissions to read, write, and execute
-                    os.remove(file_path)
-                    QMessageBox.information(self, "Success", f"File '{current_item.text(0)}' removed successfully.")
+                    trash.move_to_trash(self.project_folder, file_path)
+                    QMessageBox.information(self, "Success", f"File '{current_item.text(0)}' moved to the trash.")
                 elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
-                    QMessageBox.information(self, "Success", f"Folder '{current_item.text(0)}' removed successfully.")
+                    trash.move_to_trash(self.project_folder, file_path)
+                    QMessageBox.information(self, "Success", f"Folder '{current_item.text(0)}' moved to the trash.")
             except OSError as e:
                 QMessageBox.warning(self, "Error", f"Could not remove item: {e}")
         else:
@@ -347,8 +348,8 @@ class Sidebar(QWidget):
             folder_path = os.path.join(self.project_folder, current_item.text(0))
             print(f"Removing folder: {folder_path}")
             try:
-                shutil.rmtree(folder_path)
-                QMessageBox.information(self, "Success", f"Folder '{current_item.text(0)}' removed successfully.")
+                trash.move_to_trash(self.project_folder, folder_path)
+                QMessageBox.information(self, "Success", f"Folder '{current_item.text(0)}' moved to the trash.")
             except OSError as e:
                 QMessageBox.warning(self, "Error", f"Could not remove folder: {e}")
 
@@ -0,0 +1,249 @@
+import hashlib
+import os
+import tempfile
+import zlib
+from collections import Counter, OrderedDict
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BLOB_DIR = ".blobs"
+DICTIONARY_DIR = "dicts"
+DICTIONARY_SIZE = 32 * 1024  # zlib can use at most 32 KiB of preset dictionary
+COMPRESSED_MAGIC = b"\x00SZ"  # Never the start of a plain text body
+
+
+class BlobStore:
+    """Store snippet bodies once, keyed by the SHA-256 of their text.
+
+    Blobs live in sharded directories (``.blobs/ab/cdef...``) so no single
+    directory grows too large. Decoded bodies are kept in a small cache, so
+    every snippet that references the same blob shares one string.
+
+    Once a dictionary has been trained with ``train_dictionary`` each blob
+    is compressed on its own against it, so reading one snippet only
+    decompresses that snippet.
+    """
+
+    def __init__(self, root, cache_bytes=32 * 1024 * 1024):
+        self.root = root
+        self.cache = OrderedDict()
+        self.cache_bytes = cache_bytes
+        self.cached_bytes = 0
+        self.dictionaries = {}  # Dictionary id -> bytes
+        self.current_dictionary = None  # (codec, id) used for new blobs, loaded lazily
+
+    def path_for(self, digest):
+        """Return the file path of a blob."""
+        return os.path.join(self.root, digest[:2], digest[2:])
+
+    def put(self, text):
+        """Store a body if it is not stored yet and return its digest."""
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                file.write(self.encode(data))
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)  # Same content from another writer is harmless
+        self._remember(digest, text)
+        return digest
+
+    def get(self, digest):
+        """Return the body stored under a digest."""
+        text = self.cache.get(digest)
+        if text is not None:
+            self.cache.move_to_end(digest)
+            return text
+        with open(self.path_for(digest), "rb") as file:
+            text = self.decode(file.read()).decode("utf-8")
+        self._remember(digest, text)
+        return text
+
+    def encode(self, data):
+        """Compress a body with the current dictionary if that makes it smaller."""
+        codec, dictionary_id = self.dictionary()
+        if codec is None:
+            return data
+        dictionary = self.load_dictionary(dictionary_id)
+        if codec == "s":
+            compressor = zstandard.ZstdCompressor(level=19, dict_data=zstandard.ZstdCompressionDict(dictionary))
+            payload = compressor.compress(data)
+        else:
+            compressor = zlib.compressobj(9, zdict=dictionary)
+            payload = compressor.compress(data) + compressor.flush()
+        encoded = COMPRESSED_MAGIC + codec.encode("ascii") + dictionary_id.encode("ascii") + payload
+        return encoded if len(encoded) < len(data) else data
+
+    def decode(self, data):
+        """Undo ``encode``. Plain bodies are returned unchanged."""
+        if not data.startswith(COMPRESSED_MAGIC):
+            return data
+        header = len(COMPRESSED_MAGIC)
+        codec = data[header:header + 1].decode("ascii")
+        dictionary_id = data[header + 1:header + 17].decode("ascii")
+        payload = data[header + 17:]
+        dictionary = self.load_dictionary(dictionary_id)
+        if codec == "s":
+            if zstandard is None:
+                raise ValueError("This snippet store is compressed with zstd; install the 'zstandard' package")
+            decompressor = zstandard.ZstdDecompressor(dict_data=zstandard.ZstdCompressionDict(dictionary))
+            return decompressor.decompress(payload)
+        decompressor = zlib.decompressobj(zdict=dictionary)
+        return decompressor.decompress(payload) + decompressor.flush()
+
+    def dictionary(self):
+        """Return (codec, id) of the dictionary for new blobs, or (None, None)."""
+        if self.current_dictionary is None:
+            try:
+                with open(os.path.join(self.root, DICTIONARY_DIR, "current"), "r") as file:
+                    codec, dictionary_id = file.read().strip().split(":")
+                if codec == "s" and zstandard is None:
+                    codec = "z"  # Keep writing with the stdlib; old zstd blobs still need zstandard
+                self.current_dictionary = (codec, dictionary_id)
+            except (OSError, ValueError):
+                self.current_dictionary = (None, None)
+        return self.current_dictionary
+
+    def load_dictionary(self, dictionary_id):
+        """Return the bytes of a trained dictionary."""
+        if dictionary_id not in self.dictionaries:
+            with open(os.path.join(self.root, DICTIONARY_DIR, dictionary_id), "rb") as file:
+                self.dictionaries[dictionary_id] = file.read()
+        return self.dictionaries[dictionary_id]
+
+    def train_dictionary(self):
+        """Train a shared dictionary over all stored bodies and recompress them.
+
+        Uses zstd's trainer when the ``zstandard`` package is installed and
+        otherwise builds a zlib preset dictionary from the most common lines.
+        Returns the number of blobs rewritten.
+        """
+        digests = list(self.digests())
+        samples = [self.decode(self._read_raw(digest)) for digest in digests]
+        if not samples:
+            return 0
+
+        dictionary = None
+        if zstandard is not None:
+            try:
+                dictionary = zstandard.train_dictionary(DICTIONARY_SIZE, samples).as_bytes()
+                codec = "s"
+            except zstandard.ZstdError:
+                dictionary = None  # Too few samples for zstd, fall back to zlib
+        if dictionary is None:
+            dictionary = build_zlib_dictionary(samples)
+            codec = "z"
+
+        dictionary_id = hashlib.sha256(dictionary).hexdigest()[:16]
+        dictionary_dir = os.path.join(self.root, DICTIONARY_DIR)
+        os.makedirs(dictionary_dir, exist_ok=True)
+        with open(os.path.join(dictionary_dir, dictionary_id), "wb") as file:
+            file.write(dictionary)
+        with open(os.path.join(dictionary_dir, "current"), "w") as file:
+            file.write(f"{codec}:{dictionary_id}")
+        self.dictionaries[dictionary_id] = dictionary
+        self.current_dictionary = (codec, dictionary_id)
+
+        for digest, data in zip(digests, samples):
+            path = self.path_for(digest)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".", suffix=".tmp")
+            with os.fdopen(fd, "wb") as file:
+                file.write(self.encode(data))
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, path)
+        return len(digests)
+
+    def _read_raw(self, digest):
+        """Return the bytes of a blob file as stored."""
+        with open(self.path_for(digest), "rb") as file:
+            return file.read()
+
+    def _remember(self, digest, text):
+        """Keep a decoded body in the cache, evicting the oldest ones if needed."""
+        if digest in self.cache:
+            self.cache.move_to_end(digest)
+            return
+        self.cache[digest] = text
+        self.cached_bytes += len(text)
+        while self.cached_bytes > self.cache_bytes and len(self.cache) > 1:
+            _, old_text = self.cache.popitem(last=False)
+            self.cached_bytes -= len(old_text)
+
+    def digests(self):
+        """Yield the digest of every stored blob."""
+        for shard in os.listdir(self.root):
+            shard_path = os.path.join(self.root, shard)
+            if len(shard) == 2 and os.path.isdir(shard_path):
+                for name in os.listdir(shard_path):
+                    if not name.startswith("."):
+                        yield shard + name
+
+
+def build_zlib_dictionary(samples, size=DICTIONARY_SIZE):
+    """Build a zlib preset dictionary from lines shared between bodies.
+
+    zlib finds matches closest to the end of the dictionary most cheaply,
+    so the most common lines go last.
+    """
+    counts = Counter()
+    for sample in samples:
+        counts.update(set(line.strip() + b"\n" for line in sample.splitlines() if len(line.strip()) > 3))
+
+    chosen = []
+    used = 0
+    for line, count in counts.most_common():
+        if count < 2 or used + len(line) > size:
+            break
+        chosen.append(line)
+        used += len(line)
+    return b"".join(reversed(chosen))
+
+
+_stores = {}
+
+
+def store_for(path):
+    """Return the blob store used by a snippet file, or None if the layout is off.
+
+    The layout is on for every file below a directory that contains a
+    ``.blobs`` folder.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    if folder in _stores:
+        return _stores[folder]
+
+    store = None
+    current = folder
+    while True:
+        candidate = os.path.join(current, BLOB_DIR)
+        if os.path.isdir(candidate):
+            store = next((s for s in _stores.values() if s is not None and s.root == candidate), None)
+            store = store or BlobStore(candidate)
+            break
+        parent = os.path.dirname(current)
+        if parent == current:
+            break
+        current = parent
+    _stores[folder] = store
+    return store
+
+
+def forget_stores():
+    """Drop cached lookups, e.g. after a ``.blobs`` folder was created."""
+    _stores.clear()
+
+
+def snippet_files(root):
+    """Yield every snippet JSON file below a folder."""
+    for folder, folders, files in os.walk(root):
+        folders[:] = [name for name in folders if not name.startswith(".")]
+        for name in files:
+            if name.endswith(".json") and not name.startswith("."):
+                yield os.path.join(folder, name)
+
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import snippet_store
+
+HISTORY_FILE = ".clipboard_history.json"
+HISTORY_TAG = "clipboard"
+HISTORY_FOLDER = "Clipboard history"
+
+
+class ClipboardHistory:
+    """Ring of recently copied texts, bounded by count and total size.
+
+    Entries are keyed by a hash of their text, so copying the same text
+    again moves it to the front instead of storing it twice.
+    """
+
+    def __init__(self, root, max_items=200, max_bytes=2 * 1024 * 1024):
+        self.path = os.path.join(root, HISTORY_FILE)
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # Digest -> {"text", "time", "source"}, newest last
+        self.total_bytes = 0
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Read the saved history if there is one."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                saved = json.load(file)
+        except (OSError, ValueError):
+            return
+        for entry in saved:
+            self._insert(entry["text"], entry["time"], entry["source"])
+        self.dirty = False
+
+    def add(self, text, source="app"):
+        """Remember a copied text. Returns True if the history changed."""
+        if not text.strip() or len(text.encode("utf-8")) > self.max_bytes:
+            return False
+        with self.lock:
+            self._insert(text, time.time(), source)
+        return True
+
+    def _insert(self, text, when, source):
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        old = self.entries.pop(digest, None)
+        if old is not None:
+            self.total_bytes -= len(old["text"].encode("utf-8"))
+        self.entries[digest] = {"text": text, "time": when, "source": source}
+        self.total_bytes += len(text.encode("utf-8"))
+        while len(self.entries) > self.max_items or self.total_bytes > self.max_bytes:
+            _, dropped = self.entries.popitem(last=False)
+            self.total_bytes -= len(dropped["text"].encode("utf-8"))
+        self.dirty = True
+
+    def remove(self, snippet_id):
+        """Forget the entry behind a history snippet id. Returns True if there was one."""
+        with self.lock:
+            entry = self.entries.pop(snippet_id[len("clip-"):], None)
+            if entry is not None:
+                self.total_bytes -= len(entry["text"].encode("utf-8"))
+                self.dirty = True
+        return entry is not None
+
+    def as_snippets(self):
+        """Return the history as snippets, newest first, for the library index."""
+        snippets = []
+        for digest, entry in reversed(self.entries.items()):
+            first_line = entry["text"].strip().split("\n", 1)[0][:60]
+            copied = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["time"]))
+            snippets.append({"id": f"clip-{digest}", "title": f"{first_line} ({copied})",
+                             "snippet": entry["text"], "tags": [HISTORY_TAG]})
+        return snippets
+
+    def save(self, progress=None):
+        """Write the history if it changed. Safe to call from a worker thread."""
+        with self.lock:
+            if not self.dirty:
+                return False
+            saved = [dict(entry) for entry in self.entries.values()]
+            self.dirty = False
+        with snippet_store.locked(self.path):
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(saved, file, separators=(",", ":"))
+            os.replace(temp_path, self.path)
+        return True
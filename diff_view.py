@@ -0,0 +1,230 @@
+from bisect import bisect_right
+
+from PyQt6.QtCore import QAbstractTableModel, QModelIndex, Qt
+from PyQt6.QtGui import QColor, QFont
+from PyQt6.QtWidgets import QCheckBox, QHBoxLayout, QHeaderView, QLabel, QTableView, QVBoxLayout, QWidget
+
+import line_diff
+
+CONTEXT = 3  # Unchanged lines shown around each change; longer runs are folded
+COLORS = {
+    "delete": QColor("#4C2F35"),
+    "insert": QColor("#2F4C3A"),
+    "skip": QColor("#3B4252"),
+}
+LINE_NUMBER_COLOR = QColor("#4C566A")
+
+
+class DiffModel(QAbstractTableModel):
+    """Rows of a line diff, worked out only when the view asks for them.
+
+    The diff is stored as blocks of [kind, old start, old count, new start,
+    new count] together with the first row of each block. ``data`` finds the
+    block of a row by bisection, so only the rows on screen are ever
+    formatted, however long the texts are.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.old_lines = []
+        self.new_lines = []
+        self.blocks = []
+        self.starts = []  # First row of each block
+        self.row_total = 0
+        self.side_by_side = True
+        self.added = 0
+        self.removed = 0
+
+    def set_texts(self, old, new):
+        """Diff two texts and fold long runs of unchanged lines."""
+        self.beginResetModel()
+        self.old_lines = old.splitlines()
+        self.new_lines = new.splitlines()
+        opcodes = line_diff.diff_lines(self.old_lines, self.new_lines)
+        blocks = []
+        self.added = self.removed = 0
+        for position, (tag, i1, i2, j1, j2) in enumerate(opcodes):
+            if tag != "equal":
+                blocks.append(["change", i1, i2 - i1, j1, j2 - j1])
+                self.removed += i2 - i1
+                self.added += j2 - j1
+                continue
+            before = CONTEXT if position > 0 else 0
+            after = CONTEXT if position < len(opcodes) - 1 else 0
+            if i2 - i1 > before + after + 1:
+                if before:
+                    blocks.append(["equal", i1, before, j1, before])
+                hidden = i2 - i1 - before - after
+                blocks.append(["skip", i1 + before, hidden, j1 + before, hidden])
+                if after:
+                    blocks.append(["equal", i2 - after, after, j2 - after, after])
+            else:
+                blocks.append(["equal", i1, i2 - i1, j1, j2 - j1])
+        self.blocks = blocks
+        self.layout_rows()
+        self.endResetModel()
+
+    def block_rows(self, block):
+        kind, _, old_count, _, new_count = block
+        if kind == "skip":
+            return 1
+        if kind == "equal":
+            return old_count
+        return max(old_count, new_count) if self.side_by_side else old_count + new_count
+
+    def layout_rows(self):
+        self.starts = []
+        row = 0
+        for block in self.blocks:
+            self.starts.append(row)
+            row += self.block_rows(block)
+        self.row_total = row
+
+    def set_side_by_side(self, side_by_side):
+        """Show old and new lines next to each other, or one after the other."""
+        self.beginResetModel()
+        self.side_by_side = side_by_side
+        self.layout_rows()
+        self.endResetModel()
+
+    def expand(self, row):
+        """Unfold the unchanged lines hidden behind a folded row."""
+        index = bisect_right(self.starts, row) - 1
+        if index < 0 or self.blocks[index][0] != "skip":
+            return
+        count = self.blocks[index][2]
+        if count > 1:
+            self.beginInsertRows(QModelIndex(), row + 1, row + count - 1)
+        self.blocks[index][0] = "equal"
+        self.layout_rows()
+        if count > 1:
+            self.endInsertRows()
+        self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.row_total
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else (4 if self.side_by_side else 3)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if orientation == Qt.Orientation.Horizontal and role == Qt.ItemDataRole.DisplayRole:
+            if self.side_by_side:
+                return ("", "Before", "", "After")[section]
+            return ("", "", "Change")[section]
+        return None
+
+    def row_cells(self, row):
+        """Return (old number, new number, old text, new text, kind) of a row; None where a side is empty."""
+        index = bisect_right(self.starts, row) - 1
+        kind, old_start, old_count, new_start, new_count = self.blocks[index]
+        offset = row - self.starts[index]
+        if kind == "skip":
+            return None, None, f"... {old_count} unchanged line(s), double-click to show ...", None, "skip"
+        if kind == "equal":
+            return (old_start + offset, new_start + offset, self.old_lines[old_start + offset],
+                    self.new_lines[new_start + offset], "equal")
+        if self.side_by_side:
+            old = old_start + offset if offset < old_count else None
+            new = new_start + offset if offset < new_count else None
+            return (old, new, self.old_lines[old] if old is not None else None,
+                    self.new_lines[new] if new is not None else None, "change")
+        if offset < old_count:
+            return old_start + offset, None, self.old_lines[old_start + offset], None, "delete"
+        new = new_start + offset - old_count
+        return None, new, None, self.new_lines[new], "insert"
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        old, new, old_text, new_text, kind = self.row_cells(index.row())
+        column = index.column()
+        if self.side_by_side:
+            number, text, side = ((old, old_text, "delete"), (old, old_text, "delete"),
+                                  (new, new_text, "insert"), (new, new_text, "insert"))[column]
+            if kind in ("equal", "skip"):
+                side = kind
+            elif text is None:
+                side = None
+            is_number = column in (0, 2)
+        else:
+            number = (old, new, None)[column]
+            text = old_text if old_text is not None else new_text
+            side = kind
+            is_number = column in (0, 1)
+            if column == 2 and kind in ("delete", "insert"):
+                text = ("- " if kind == "delete" else "+ ") + text
+            elif column == 2 and kind == "equal":
+                text = "  " + text
+
+        if role == Qt.ItemDataRole.DisplayRole:
+            if is_number:
+                return str(number + 1) if number is not None else ""
+            if kind == "skip" and column != (1 if self.side_by_side else 2):
+                return ""
+            return text or ""
+        if role == Qt.ItemDataRole.BackgroundRole:
+            return COLORS.get(side)
+        if role == Qt.ItemDataRole.ForegroundRole and is_number:
+            return LINE_NUMBER_COLOR
+        if role == Qt.ItemDataRole.TextAlignmentRole and is_number:
+            return Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter
+        return None
+
+
+class DiffView(QWidget):
+    """Side-by-side or inline view of the differences between two texts."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.model = DiffModel(self)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        top_layout = QHBoxLayout()
+        self.summary_label = QLabel(self)
+        top_layout.addWidget(self.summary_label)
+        top_layout.addStretch()
+        self.side_by_side_box = QCheckBox("Side by side", self)
+        self.side_by_side_box.setChecked(True)
+        self.side_by_side_box.toggled.connect(self.set_side_by_side)
+        top_layout.addWidget(self.side_by_side_box)
+        layout.addLayout(top_layout)
+
+        self.table = QTableView(self)
+        self.table.setModel(self.model)
+        self.table.setFont(QFont("Courier New", 10))
+        self.table.setShowGrid(False)
+        self.table.setWordWrap(False)
+        self.table.setSelectionBehavior(QTableView.SelectionBehavior.SelectRows)
+        self.table.verticalHeader().hide()
+        # Fixed row heights and column widths, so Qt never measures rows that are off screen
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(self.table.fontMetrics().height() + 2)
+        self.table.doubleClicked.connect(lambda index: self.model.expand(index.row()))
+        layout.addWidget(self.table)
+        self.setLayout(layout)
+        self.update_columns()
+
+    def set_texts(self, old, new):
+        """Show the differences between an old and a new text."""
+        self.model.set_texts(old, new)
+        self.summary_label.setText(f"{self.model.added} line(s) added, {self.model.removed} removed")
+        self.update_columns()
+
+    def set_side_by_side(self, side_by_side):
+        self.model.set_side_by_side(side_by_side)
+        self.update_columns()
+
+    def update_columns(self):
+        """Size line number columns for the longest number and let text columns share the rest."""
+        digits = len(str(max(len(self.model.old_lines), len(self.model.new_lines), 1)))
+        number_width = self.table.fontMetrics().horizontalAdvance("9" * digits) + 12
+        header = self.table.horizontalHeader()
+        number_columns = (0, 2) if self.model.side_by_side else (0, 1)
+        for column in range(self.model.columnCount()):
+            if column in number_columns:
+                header.setSectionResizeMode(column, QHeaderView.ResizeMode.Fixed)
+                header.resizeSection(column, number_width)
+            else:
+                header.setSectionResizeMode(column, QHeaderView.ResizeMode.Stretch)
@@ -0,0 +1,224 @@
+import hashlib
+import multiprocessing
+import os
+import re
+import struct
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import blob_store
+import snippet_store
+from language_detect import body_hash
+
+CACHE_FILE = ".minhash_cache"
+CACHE_MAGIC = b"SMH1"
+NUM_BINS = 64  # Signature length
+BANDS = 16  # LSH bands of NUM_BINS // BANDS bins each; pairs sharing a band are compared
+SHINGLE_SIZE = 3  # Tokens per shingle
+TOKEN = re.compile(r"\w+|[^\w\s]")
+
+_known_hashes = frozenset()  # Body hashes the cache already has, set in each worker process
+
+
+def shingles(body):
+    """Yield the overlapping token n-grams of a body, ignoring whitespace differences."""
+    tokens = TOKEN.findall(body)
+    if len(tokens) <= SHINGLE_SIZE:
+        if tokens:
+            yield " ".join(tokens)
+        return
+    for start in range(len(tokens) - SHINGLE_SIZE + 1):
+        yield " ".join(tokens[start:start + SHINGLE_SIZE])
+
+
+def signature(body):
+    """Return the MinHash signature of a body as bytes, or None if it has no tokens.
+
+    Uses one-permutation hashing: every shingle is hashed once and the hash
+    both picks a bin and competes for that bin's minimum, instead of
+    hashing every shingle NUM_BINS times. Empty bins borrow from the next
+    filled bin so short bodies still compare well.
+    """
+    minimums = [None] * NUM_BINS
+    for shingle in set(shingles(body)):
+        value = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "little")
+        index = value % NUM_BINS
+        value = (value // NUM_BINS) & 0xFFFFFFFF
+        if minimums[index] is None or value < minimums[index]:
+            minimums[index] = value
+    if all(value is None for value in minimums):
+        return None
+    for index in range(NUM_BINS):
+        distance = 1
+        while minimums[index] is None:
+            borrowed = minimums[(index + distance) % NUM_BINS]
+            if borrowed is not None:
+                minimums[index] = (borrowed + distance * 0x9E3779B1) & 0xFFFFFFFF
+            distance += 1
+    return array("I", minimums).tobytes()
+
+
+def similarity(first, second):
+    """Estimate the Jaccard similarity of two bodies from their signatures."""
+    first, second = array("I", first), array("I", second)
+    return sum(a == b for a, b in zip(first, second)) / NUM_BINS
+
+
+def load_cache(root):
+    """Return the cached signatures of a tree as {body hash: signature}."""
+    signatures = {}
+    record_size = 8 + NUM_BINS * 4
+    try:
+        with open(os.path.join(root, CACHE_FILE), "rb") as file:
+            data = file.read()
+    except OSError:
+        return signatures
+    if data[:4] != CACHE_MAGIC or struct.unpack_from("<H", data, 4)[0] != NUM_BINS:
+        return signatures  # Written with other settings; start over
+    for offset in range(6, len(data) - record_size + 1, record_size):
+        signatures[data[offset:offset + 8].hex()] = data[offset + 8:offset + record_size]
+    return signatures
+
+
+def save_cache(root, signatures):
+    """Write the signatures of a tree, replacing the old cache."""
+    path = os.path.join(root, CACHE_FILE)
+    with snippet_store.locked(path):
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(CACHE_MAGIC + struct.pack("<H", NUM_BINS))
+            for key, value in signatures.items():
+                if value is not None:  # Bodies without tokens are not worth keeping
+                    file.write(bytes.fromhex(key) + value)
+        os.replace(temp_path, path)
+
+
+def _set_known_hashes(known):
+    global _known_hashes
+    _known_hashes = known
+
+
+def sign_file(path):
+    """Read a snippet file and sign the bodies the cache does not have.
+
+    Returns (path, [(snippet id, title, body hash)], {body hash: signature}, error).
+    """
+    try:
+        snippets, _ = snippet_store.read_snippets(path)
+    except (OSError, ValueError) as e:
+        return path, [], {}, str(e)
+    entries = []
+    signatures = {}
+    for snippet in snippets:
+        key = body_hash(snippet["snippet"])
+        entries.append((snippet["id"], snippet["title"], key))
+        if key not in _known_hashes and key not in signatures:
+            signatures[key] = signature(snippet["snippet"])
+    return path, entries, signatures, None
+
+
+def find_duplicates(root, threshold=0.7, progress=None, max_workers=None):
+    """Find clusters of identical and near-identical snippets below a folder.
+
+    Files are signed in parallel; bodies whose signature is cached are not
+    read twice. Candidate pairs come from LSH banding, so only bodies that
+    share a whole band of their signature are ever compared. Returns a
+    list of clusters, each a list of {"path", "id", "title", "similarity"}
+    dicts sorted by how similar they are to the first member.
+    """
+    cache = load_cache(root)
+    files = sorted(blob_store.snippet_files(root))
+    if progress:
+        progress(0, len(files))
+
+    members = defaultdict(list)  # Body hash -> (path, snippet id, title)
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context,
+                             initializer=_set_known_hashes, initargs=(frozenset(cache),)) as executor:
+        chunksize = max(1, len(files) // ((max_workers or os.cpu_count() or 1) * 8))
+        for done, (path, entries, signatures, error) in enumerate(
+                executor.map(sign_file, files, chunksize=chunksize), 1):
+            cache.update(signatures)
+            for snippet_id, title, key in entries:
+                members[key].append((path, snippet_id, title))
+            if progress:
+                progress(done, len(files))
+
+    # Keep only the signatures of bodies that still exist
+    cache = {key: value for key, value in cache.items() if key in members}
+    save_cache(root, cache)
+
+    parents = {}  # Union-find over body hashes; roots are not in it
+
+    def find(key):
+        while key in parents:
+            parent = parents[key]
+            if parent in parents:
+                parents[key] = parents[parent]  # Path halving
+            key = parent
+        return key
+
+    buckets = defaultdict(list)
+    band_size = NUM_BINS * 4 // BANDS
+    for key, value in cache.items():
+        if value is None:
+            continue
+        for band in range(BANDS):
+            buckets[band, value[band * band_size:(band + 1) * band_size]].append(key)
+    compared = set()
+    for keys in buckets.values():
+        for index, first in enumerate(keys):
+            for second in keys[index + 1:]:
+                if (first, second) in compared:
+                    continue
+                compared.add((first, second))
+                if find(first) != find(second) and similarity(cache[first], cache[second]) >= threshold:
+                    parents[find(second)] = find(first)
+
+    groups = defaultdict(list)
+    for key in members:
+        groups[find(key)].append(key)
+    clusters = []
+    for keys in groups.values():
+        snippets = [(key, member) for key in keys for member in members[key]]
+        if len(snippets) < 2:
+            continue
+        first_key = snippets[0][0]
+        cluster = []
+        for key, (path, snippet_id, title) in snippets:
+            score = 1.0 if key == first_key else similarity(cache[first_key], cache[key])
+            cluster.append({"path": path, "id": snippet_id, "title": title, "similarity": score})
+        cluster.sort(key=lambda member: member["similarity"], reverse=True)
+        clusters.append(cluster)
+    clusters.sort(key=len, reverse=True)
+    return clusters
+
+
+def merge_duplicates(keep, others):
+    """Return the changes that keep one snippet of a cluster and delete the others.
+
+    ``keep`` and ``others`` are cluster members. Tags of the deleted
+    snippets are added to the kept one. Nothing is written; the result maps
+    a path to (before, after) snippet pairs, after being None for a deleted
+    snippet, so it can be written as one transaction and undone.
+    """
+    deletes = defaultdict(set)
+    for member in others:
+        deletes[member["path"]].add(member["id"])
+    changes = defaultdict(list)
+    tags = []
+    for path, ids in deletes.items():
+        snippets, _ = snippet_store.read_snippets(path)
+        for snippet in snippets:
+            if snippet["id"] in ids:
+                tags.extend(tag for tag in snippet.get("tags", ()) if tag not in tags)
+                changes[path].append((snippet, None))
+
+    kept, _ = snippet_store.read_snippets(keep["path"])
+    for snippet in kept:
+        if snippet["id"] == keep["id"]:
+            new_tags = snippet.get("tags", []) + [tag for tag in tags if tag not in snippet.get("tags", [])]
+            if new_tags != snippet.get("tags", []):
+                changes[keep["path"]].append((snippet, dict(snippet, tags=new_tags)))
+    return dict(changes)
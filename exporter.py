@@ -0,0 +1,220 @@
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from xml.sax.saxutils import quoteattr
+
+import blob_store
+import snippet_store
+import templates
+
+FORMATS = ("vscode", "sublime", "jetbrains", "plain")
+
+# File extension used by the plain format for a snippet's language
+LANGUAGE_EXTENSIONS = {
+    "python": ".py", "javascript": ".js", "typescript": ".ts", "java": ".java", "c": ".c", "cpp": ".cpp",
+    "csharp": ".cs", "go": ".go", "rust": ".rs", "ruby": ".rb", "php": ".php", "shell": ".sh", "sql": ".sql",
+    "html": ".html", "css": ".css", "kotlin": ".kt", "swift": ".swift", "lua": ".lua",
+}
+# JetBrains functions that fill the variables our templates know
+LIVE_TEMPLATE_EXPRESSIONS = {"DATE": "date()", "TIME": "time()", "FILENAME": "fileName()", "CLIPBOARD": "clipboard()"}
+
+
+def slugify(text):
+    """Turn a title into something safe to use as a file name."""
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "-", text).strip("-.")
+    return slug[:80] or "snippet"
+
+
+def unique_name(name, used):
+    """Return ``name`` or ``name-2``, ``name-3``... so it is not in ``used``."""
+    candidate = name
+    counter = 2
+    while candidate in used:
+        candidate = f"{name}-{counter}"
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+
+def escape_xml(text):
+    """Escape text for use inside an XML element."""
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def matches(snippet, query):
+    """Return True if a snippet passes the export filter."""
+    if not query:
+        return True
+    query = query.lower()
+    return query in snippet["title"].lower() or query in snippet["snippet"].lower()
+
+
+def iter_snippets(path, query=None):
+    """Yield the snippets of one file that pass the filter."""
+    snippets, _ = snippet_store.read_snippets(path)
+    for snippet in snippets:
+        if matches(snippet, query):
+            yield snippet
+
+
+def write_vscode(path, snippets, out_dir, name):
+    """Write one ``.code-snippets`` file, one entry at a time."""
+    used = set()
+    count = 0
+    with open(os.path.join(out_dir, name + ".code-snippets"), "w", encoding="utf-8") as file:
+        file.write("{")
+        for snippet in snippets:
+            entry = {"prefix": slugify(snippet["title"]).lower(), "body": snippet["snippet"].split("\n"),
+                     "description": snippet["title"]}
+            if snippet.get("language"):
+                entry["scope"] = snippet["language"]
+            separator = "," if count else ""
+            file.write(f"{separator}\n    {json.dumps(unique_name(snippet['title'], used))}: {json.dumps(entry)}")
+            count += 1
+        file.write("\n}\n")
+    return count
+
+
+def write_sublime(path, snippets, out_dir, name):
+    """Write one ``.sublime-snippet`` file per snippet."""
+    folder = os.path.join(out_dir, name)
+    os.makedirs(folder, exist_ok=True)
+    used = set()
+    count = 0
+    for snippet in snippets:
+        content = snippet["snippet"].replace("]]>", "]]]]><![CDATA[>")
+        file_name = unique_name(slugify(snippet["title"]), used) + ".sublime-snippet"
+        with open(os.path.join(folder, file_name), "w", encoding="utf-8") as file:
+            file.write("<snippet>\n")
+            file.write(f"    <content><![CDATA[{content}]]></content>\n")
+            file.write(f"    <tabTrigger>{escape_xml(slugify(snippet['title']).lower())}</tabTrigger>\n")
+            file.write(f"    <description>{escape_xml(snippet['title'])}</description>\n")
+            if snippet.get("language"):
+                file.write(f"    <scope>source.{escape_xml(snippet['language'])}</scope>\n")
+            file.write("</snippet>\n")
+        count += 1
+    return count
+
+
+def to_live_template(body):
+    """Convert fields and variables of a snippet template to JetBrains syntax.
+
+    Returns (text, variables) where variables is a list of
+    (name, expression, default).
+    """
+    variables = {}
+    pieces = []
+    for part in templates.compile_template(body).parts:
+        if part[0] == "text":
+            pieces.append(part[1].replace("$", "$$"))
+        elif part[0] == "field" and part[1] == 0:
+            pieces.append("$END$")
+        elif part[0] == "field":
+            name = f"P{part[1]}"
+            variables.setdefault(name, ("", part[2]))
+            pieces.append(f"${name}$")
+        else:
+            variables.setdefault(part[1], (LIVE_TEMPLATE_EXPRESSIONS[part[1]], part[2]))
+            pieces.append(f"${part[1]}$")
+    return "".join(pieces), [(name, expression, default) for name, (expression, default) in variables.items()]
+
+
+def write_jetbrains(path, snippets, out_dir, name):
+    """Write one live-template set XML file, one template at a time."""
+    used = set()
+    count = 0
+    with open(os.path.join(out_dir, name + ".xml"), "w", encoding="utf-8") as file:
+        file.write(f"<templateSet group={quoteattr(name)}>\n")
+        for snippet in snippets:
+            text, variables = to_live_template(snippet["snippet"])
+            abbreviation = unique_name(slugify(snippet["title"]).lower(), used)
+            file.write(f"  <template name={quoteattr(abbreviation)} value={quoteattr(text)} "
+                       f"description={quoteattr(snippet['title'])} toReformat=\"false\" toShortenFQNames=\"true\">\n")
+            for variable, expression, default in variables:
+                file.write(f"    <variable name={quoteattr(variable)} expression={quoteattr(expression)} "
+                           f"defaultValue={quoteattr(json.dumps(default))} alwaysStopAt=\"{str(not expression).lower()}\" />\n")
+            file.write("    <context>\n      <option name=\"OTHER\" value=\"true\" />\n    </context>\n")
+            file.write("  </template>\n")
+            count += 1
+        file.write("</templateSet>\n")
+    return count
+
+
+def write_plain(path, snippets, out_dir, name):
+    """Write every snippet body to a file of its own."""
+    folder = os.path.join(out_dir, name)
+    os.makedirs(folder, exist_ok=True)
+    used = set()
+    count = 0
+    for snippet in snippets:
+        extension = LANGUAGE_EXTENSIONS.get(snippet.get("language"), ".txt")
+        file_name = unique_name(slugify(snippet["title"]), used) + extension
+        with open(os.path.join(folder, file_name), "w", encoding="utf-8") as file:
+            file.write(snippet["snippet"] + "\n")
+        count += 1
+    return count
+
+
+WRITERS = {"vscode": write_vscode, "sublime": write_sublime, "jetbrains": write_jetbrains, "plain": write_plain}
+
+
+def export_list(snippets, output, export_format, name="snippets"):
+    """Export a list of snippets as one file (or folder) called ``name``. Returns the count."""
+    if export_format not in WRITERS:
+        raise ValueError(f"Unknown export format '{export_format}', use one of {', '.join(FORMATS)}")
+    os.makedirs(output, exist_ok=True)
+    return WRITERS[export_format](None, snippets, output, name)
+
+
+def export_folder(root, folder, output, export_format, query=None):
+    """Export the snippet files of one folder. Runs in a worker process.
+
+    Returns (folder, snippets written).
+    """
+    writer = WRITERS[export_format]
+    source = os.path.join(root, folder)
+    count = 0
+    for path in sorted(blob_store.snippet_files(source)):
+        relative = os.path.relpath(path, root)
+        out_dir = os.path.join(output, os.path.dirname(relative))
+        os.makedirs(out_dir, exist_ok=True)
+        name = os.path.splitext(os.path.basename(relative))[0]
+        count += writer(path, iter_snippets(path, query), out_dir, name)
+    return folder, count
+
+
+def export_snippets(root, output, export_format, folders=None, query=None, progress=None, max_workers=None):
+    """Export a snippet tree to an editor snippet format.
+
+    Each top-level folder is exported by its own worker process and every
+    output is written while its snippets are read, so only one snippet file
+    is in memory per worker. Returns the number of snippets exported.
+    """
+    if export_format not in WRITERS:
+        raise ValueError(f"Unknown export format '{export_format}', use one of {', '.join(FORMATS)}")
+
+    if folders is None:
+        folders = [name for name in sorted(os.listdir(root))
+                   if not name.startswith(".") and os.path.isdir(os.path.join(root, name))]
+    os.makedirs(output, exist_ok=True)
+
+    # Loose files at the top of the tree are exported like a folder of their own
+    total = 0
+    for name in sorted(os.listdir(root)):
+        path = os.path.join(root, name)
+        if name.endswith(".json") and not name.startswith(".") and os.path.isfile(path):
+            total += WRITERS[export_format](path, iter_snippets(path, query), output, os.path.splitext(name)[0])
+
+    if progress:
+        progress(0, len(folders))
+    if folders:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+            jobs = [executor.submit(export_folder, root, folder, output, export_format, query) for folder in folders]
+            for done, job in enumerate(jobs, 1):
+                total += job.result()[1]
+                if progress:
+                    progress(done, len(folders))
+    return total
@@ -0,0 +1,186 @@
+import re
+
+from PyQt6.QtGui import QColor, QFont, QSyntaxHighlighter, QTextCharFormat
+
+PLAIN_TEXT = "Plain text"
+
+# Keywords, line comment and multi-line (open, close, kind) delimiters per language
+C_KEYWORDS = ("if else for while do switch case break continue return goto struct union enum typedef "
+              "static const extern void int char short long float double unsigned signed sizeof")
+LANGUAGES = {
+    "python": {
+        "keywords": "and as assert async await break class continue def del elif else except False finally for "
+                    "from global if import in is lambda None nonlocal not or pass raise return True try while "
+                    "with yield self",
+        "line_comment": "#",
+        "multiline": [('"""', '"""', "string"), ("'''", "'''", "string")],
+    },
+    "javascript": {
+        "keywords": "async await break case catch class const continue debugger default delete do else export "
+                    "extends false finally for function if import in instanceof let new null return super switch "
+                    "this throw true try typeof undefined var void while with yield of",
+        "line_comment": "//",
+        "multiline": [("/*", "*/", "comment"), ("`", "`", "string")],
+    },
+    "typescript": {
+        "keywords": "abstract any as async await boolean break case catch class const continue declare default "
+                    "delete do else enum export extends false finally for from function if implements import in "
+                    "instanceof interface keyof let namespace never new null number private protected public "
+                    "readonly return string super switch this throw true try type typeof undefined var void while",
+        "line_comment": "//",
+        "multiline": [("/*", "*/", "comment"), ("`", "`", "string")],
+    },
+    "java": {
+        "keywords": "abstract boolean break byte case catch char class const continue default do double else enum "
+                    "extends final finally float for if implements import instanceof int interface long new null "
+                    "package private protected public return short static super switch this throw throws true "
+                    "false try void volatile while var",
+        "line_comment": "//",
+        "multiline": [("/*", "*/", "comment"), ('"""', '"""', "string")],
+    },
+    "c": {"keywords": C_KEYWORDS, "line_comment": "//", "multiline": [("/*", "*/", "comment")]},
+    "cpp": {
+        "keywords": C_KEYWORDS + " auto bool catch class constexpr delete false friend inline namespace new "
+                                 "nullptr operator private protected public template this throw true try "
+                                 "typename using virtual",
+        "line_comment": "//",
+        "multiline": [("/*", "*/", "comment")],
+    },
+    "csharp": {
+        "keywords": "abstract as async await base bool break case catch class const continue decimal default "
+                    "delegate do double else enum event false finally float for foreach if in int interface "
+                    "internal is lock long namespace new null object out override private protected public "
+                    "readonly ref return sealed static string struct switch this throw true try using var "
+                    "virtual void while",
+        "line_comment": "//",
+        "multiline": [("/*", "*/", "comment")],
+    },
+    "go": {
+        "keywords": "break case chan const continue default defer else fallthrough for func go goto if import "
+                    "interface map package range return select struct switch type var nil true false",
+        "line_comment": "//",
+        "multiline": [("/*", "*/", "comment"), ("`", "`", "string")],
+    },
+    "rust": {
+        "keywords": "as async await break const continue crate else enum extern false fn for if impl in let loop "
+                    "match mod move mut pub ref return self Self static struct super trait true type unsafe use "
+                    "where while",
+        "line_comment": "//",
+        "multiline": [("/*", "*/", "comment")],
+    },
+    "shell": {
+        "keywords": "if then else elif fi case esac for while until do done in function return local export",
+        "line_comment": "#",
+        "multiline": [],
+    },
+    "sql": {
+        "keywords": "select from where insert into values update set delete create table drop alter join left "
+                    "right inner outer on group by order having limit and or not null as distinct union",
+        "line_comment": "--",
+        "multiline": [("/*", "*/", "comment")],
+        "ignore_case": True,
+    },
+}
+
+
+def make_format(color, bold=False, italic=False):
+    """Return a text format with the given color."""
+    text_format = QTextCharFormat()
+    text_format.setForeground(QColor(color))
+    if bold:
+        text_format.setFontWeight(QFont.Weight.Bold)
+    text_format.setFontItalic(italic)
+    return text_format
+
+
+# Colors from the Nord palette used by the application styles
+FORMATS = {
+    "keyword": make_format("#81A1C1", bold=True),
+    "string": make_format("#A3BE8C"),
+    "comment": make_format("#616E88", italic=True),
+    "number": make_format("#B48EAD"),
+}
+
+_compiled = {}
+
+
+def compile_language(language):
+    """Build the token pattern of a language once and reuse it."""
+    if language not in _compiled:
+        spec = LANGUAGES[language]
+        parts = [f"(?P<open{index}>{re.escape(opening)})"
+                 for index, (opening, _, _) in enumerate(spec["multiline"])]
+        parts.append(f"(?P<comment>{re.escape(spec['line_comment'])}.*$)")
+        parts.append(r'(?P<string>"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')')
+        parts.append(r"(?P<number>\b(?:0[xX][0-9a-fA-F]+|\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)\b)")
+        parts.append(r"(?P<keyword>\b(?:" + "|".join(spec["keywords"].split()) + r")\b)")
+        flags = re.IGNORECASE if spec.get("ignore_case") else 0
+        _compiled[language] = (re.compile("|".join(parts), flags), spec["multiline"])
+    return _compiled[language]
+
+
+class CodeHighlighter(QSyntaxHighlighter):
+    """Syntax highlighter for the snippet editor.
+
+    Each block stores the multi-line construct it ends inside (block
+    comment, triple-quoted string...) as its block state. Qt only calls
+    ``highlightBlock`` for the edited block and keeps going to the next
+    blocks only while their starting state changes, so typing costs the
+    same no matter how long the snippet is.
+    """
+
+    def __init__(self, document, language=PLAIN_TEXT):
+        super().__init__(document)
+        self.language = None
+        self.set_language(language)
+
+    def set_language(self, language):
+        """Switch language and highlight the document again."""
+        language = language if language in LANGUAGES else PLAIN_TEXT
+        if language != self.language:
+            self.language = language
+            self.rehighlight()
+
+    def highlightBlock(self, text):
+        if self.language == PLAIN_TEXT:
+            return
+        pattern, multiline = compile_language(self.language)
+
+        position = 0
+        state = self.previousBlockState()
+        if state > 0:
+            # This block starts inside a construct opened by an earlier block
+            position = self.close_multiline(text, 0, state - 1, multiline)
+            if position is None:
+                return
+
+        while position < len(text):
+            match = pattern.search(text, position)
+            if match is None:
+                break
+            kind = match.lastgroup
+            if kind.startswith("open"):
+                position = self.close_multiline(text, match.start(), int(kind[4:]), multiline,
+                                                search_from=match.end())
+                if position is None:
+                    return
+            else:
+                self.setFormat(match.start(), match.end() - match.start(), FORMATS[kind])
+                position = match.end()
+        self.setCurrentBlockState(0)
+
+    def close_multiline(self, text, start, index, multiline, search_from=None):
+        """Format a multi-line construct from ``start`` up to its closing delimiter.
+
+        Returns the position after the delimiter, or None if the construct
+        continues into the next block.
+        """
+        _, closing, kind = multiline[index]
+        end = text.find(closing, start if search_from is None else search_from)
+        if end == -1:
+            self.setFormat(start, len(text) - start, FORMATS[kind])
+            self.setCurrentBlockState(index + 1)
+            return None
+        end += len(closing)
+        self.setFormat(start, end - start, FORMATS[kind])
+        return end
@@ -0,0 +1,228 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import line_diff
+import snippet_store
+
+HISTORY_DIR = ".history"
+MAX_HISTORY_BYTES = 16 * 1024 * 1024  # Disk budget for all version histories together
+MAX_VERSIONS = 100  # Versions kept per snippet, the current one included
+MAX_UNDO_BYTES = 32 * 1024 * 1024  # Memory budget for snippets held by the undo stack
+
+
+class UndoStack:
+    """Actions that were done and can be undone, then redone.
+
+    An action is pushed after it was carried out, with a function for each
+    direction and an estimate of the memory it holds on to. The oldest
+    actions are dropped once the total goes over ``max_bytes``.
+    """
+
+    def __init__(self, max_bytes=MAX_UNDO_BYTES):
+        self.max_bytes = max_bytes
+        self.done = deque()  # (text, undo, redo, size), oldest first
+        self.undone = []  # Same, most recently undone last
+        self.total_bytes = 0
+
+    def push(self, text, undo, redo, size=0):
+        """Remember an action that was just done."""
+        for command in self.undone:
+            self.total_bytes -= command[3]
+        self.undone = []
+        self.done.append((text, undo, redo, size))
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes and len(self.done) > 1:
+            self.total_bytes -= self.done.popleft()[3]
+
+    def can_undo(self):
+        return bool(self.done)
+
+    def can_redo(self):
+        return bool(self.undone)
+
+    def undo(self):
+        """Undo the last action and return its text. It stays on the stack if undoing fails."""
+        command = self.done.pop()
+        try:
+            command[1]()
+        except Exception:
+            self.done.append(command)
+            raise
+        self.undone.append(command)
+        return command[0]
+
+    def redo(self):
+        """Redo the last undone action and return its text."""
+        command = self.undone.pop()
+        try:
+            command[2]()
+        except Exception:
+            self.undone.append(command)
+            raise
+        self.done.append(command)
+        return command[0]
+
+
+def make_delta(newer, older):
+    """Return the changes that turn the text ``newer`` back into ``older``.
+
+    A delta is a list of [start, end] line ranges copied from ``newer`` and
+    strings of lines only ``older`` has, so unchanged lines cost a pair of
+    numbers rather than a copy.
+    """
+    newer_lines = newer.splitlines(keepends=True)
+    older_lines = older.splitlines(keepends=True)
+    delta = []
+    for tag, i1, i2, j1, j2 in line_diff.diff_lines(newer_lines, older_lines):
+        if tag == "equal":
+            delta.append([i1, i2])
+        elif j2 > j1:
+            delta.append("".join(older_lines[j1:j2]))
+    return delta
+
+
+def apply_delta(newer, delta):
+    """Rebuild the older text from a newer text and the delta between them."""
+    newer_lines = newer.splitlines(keepends=True)
+    pieces = []
+    for part in delta:
+        if isinstance(part, list):
+            pieces.extend(newer_lines[part[0]:part[1]])
+        else:
+            pieces.append(part)
+    return "".join(pieces)
+
+
+class VersionHistory:
+    """Earlier versions of every snippet, kept as reverse deltas on disk.
+
+    Each snippet has one file holding its latest body in full and, newest
+    first, one delta per older version against the version after it. The
+    latest version is read without any work and older ones by applying
+    deltas in turn. Dropping the oldest versions is just cutting the list
+    short, which is how the disk budget is kept.
+
+    ``record`` only queues a version; ``flush`` (run from a worker thread)
+    writes the queue out.
+    """
+
+    def __init__(self, root, max_bytes=MAX_HISTORY_BYTES, max_versions=MAX_VERSIONS):
+        self.root = os.path.join(root, HISTORY_DIR)
+        self.max_bytes = max_bytes
+        self.max_versions = max_versions
+        self.pending = []  # (snippet, time) not written yet
+        self.lock = threading.Lock()
+        self.total_bytes = None  # Size of all history files, once measured
+
+    def path_for(self, snippet_id):
+        return os.path.join(self.root, snippet_id[:2], f"{snippet_id}.json")
+
+    def record(self, snippet, when=None):
+        """Queue the current version of a snippet."""
+        with self.lock:
+            self.pending.append((dict(snippet), time.time() if when is None else when))
+
+    def load(self, snippet_id):
+        try:
+            with open(self.path_for(snippet_id), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def flush(self, progress=None):
+        """Write queued versions, then prune if over budget. Safe to call from a worker thread."""
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if not pending:
+            return 0
+
+        by_snippet = {}
+        for snippet, when in pending:
+            by_snippet.setdefault(snippet["id"], []).append((snippet, when))
+        written = 0
+        for snippet_id, versions in by_snippet.items():
+            path = self.path_for(snippet_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with snippet_store.locked(path):
+                entry = self.load(snippet_id)
+                old_size = os.path.getsize(path) if entry is not None else 0
+                for snippet, when in versions:
+                    if entry is None:
+                        entry = {"title": snippet["title"], "snippet": snippet["snippet"], "time": when,
+                                 "versions": []}
+                    elif entry["snippet"] != snippet["snippet"] or entry["title"] != snippet["title"]:
+                        older = {"title": entry["title"], "time": entry["time"],
+                                 "delta": make_delta(snippet["snippet"], entry["snippet"])}
+                        entry.update(title=snippet["title"], snippet=snippet["snippet"], time=when)
+                        entry["versions"] = [older] + entry["versions"][:self.max_versions - 2]
+                    else:
+                        continue
+                    written += 1
+                temp_path = path + ".tmp"
+                with open(temp_path, "w", encoding="utf-8") as file:
+                    json.dump(entry, file, separators=(",", ":"))
+                os.replace(temp_path, path)
+                if self.total_bytes is not None:
+                    self.total_bytes += os.path.getsize(path) - old_size
+        # Only look at every history file when the budget may have been reached
+        if self.total_bytes is None or self.total_bytes > self.max_bytes:
+            self.prune()
+        return written
+
+    def versions(self, snippet_id):
+        """Return [(time, title, body)] of a snippet, newest first."""
+        entry = self.load(snippet_id)
+        if entry is None:
+            return []
+        body = entry["snippet"]
+        versions = [(entry["time"], entry["title"], body)]
+        for older in entry["versions"]:
+            body = apply_delta(body, older["delta"])
+            versions.append((older["time"], older["title"], body))
+        return versions
+
+    def prune(self):
+        """Drop the oldest versions of any snippet until the histories fit the disk budget."""
+        files = []
+        total = 0
+        for folder, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith(".json"):
+                    path = os.path.join(folder, name)
+                    size = os.path.getsize(path)
+                    files.append(path)
+                    total += size
+        self.total_bytes = total
+        if total <= self.max_bytes:
+            return 0
+
+        # Older versions from every file, oldest first, with what dropping each saves
+        candidates = []
+        for path in files:
+            with open(path, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+            for index, older in enumerate(entry["versions"]):
+                candidates.append((older["time"], path, index, len(json.dumps(older, separators=(",", ":")))))
+        candidates.sort()
+        keep = {}  # Path -> number of older versions to keep
+        excess = total - self.max_bytes
+        for when, path, index, size in candidates:
+            if excess <= 0:
+                break
+            keep[path] = min(keep.get(path, index), index)
+            excess -= size
+            self.total_bytes -= size
+
+        for path, count in keep.items():
+            with snippet_store.locked(path):
+                with open(path, "r", encoding="utf-8") as file:
+                    entry = json.load(file)
+                entry["versions"] = entry["versions"][:count]
+                temp_path = path + ".tmp"
+                with open(temp_path, "w", encoding="utf-8") as file:
+                    json.dump(entry, file, separators=(",", ":"))
+                os.replace(temp_path, path)
+        return len(keep)
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ProcessPoolExecutor
+
+import snippet_store
+
+# Source files imported whole, one snippet per file
+SOURCE_EXTENSIONS = {
+    ".py": "python", ".js": "javascript", ".ts": "typescript", ".jsx": "javascript", ".tsx": "typescript",
+    ".java": "java", ".c": "c", ".h": "c", ".cpp": "cpp", ".hpp": "cpp", ".cs": "csharp", ".go": "go",
+    ".rs": "rust", ".rb": "ruby", ".php": "php", ".sh": "shell", ".sql": "sql", ".html": "html",
+    ".css": "css", ".kt": "kotlin", ".swift": "swift", ".lua": "lua",
+}
+MAX_SOURCE_BYTES = 256 * 1024  # Bigger files are not snippets
+SKIPPED_FOLDERS = {".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", "venv"}
+
+# Strings first so comment markers inside them are kept
+JSONC_TOKENS = re.compile(r'"(?:\\.|[^"\\])*"|//[^\n]*|/\*.*?\*/', re.DOTALL)
+TRAILING_COMMAS = re.compile(r',(\s*[}\]])')
+
+
+def find_importable_files(paths):
+    """Yield every file below the given paths that the importer understands."""
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for folder, folders, files in os.walk(path):
+            folders[:] = [name for name in folders if name not in SKIPPED_FOLDERS]
+            for name in files:
+                extension = os.path.splitext(name)[1].lower()
+                if extension in (".code-snippets", ".sublime-snippet") or extension in SOURCE_EXTENSIONS:
+                    yield os.path.join(folder, name)
+
+
+def normalize_body(body):
+    """Normalize line endings and surrounding whitespace of a snippet body."""
+    lines = body.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+def parse_code_snippets(path):
+    """Parse a VS Code ``.code-snippets`` file (JSON with comments)."""
+    with open(path, "r", encoding="utf-8") as file:
+        text = file.read()
+    text = JSONC_TOKENS.sub(lambda match: match.group(0) if match.group(0).startswith('"') else "", text)
+    data = json.loads(TRAILING_COMMAS.sub(r"\1", text))
+    if not isinstance(data, dict):
+        raise ValueError("expected an object mapping snippet names to snippets")
+
+    snippets = []
+    for name, entry in data.items():
+        if not isinstance(entry, dict) or "body" not in entry:
+            continue
+        body = entry["body"]
+        snippet = {"title": name, "snippet": "\n".join(map(str, body)) if isinstance(body, list) else str(body)}
+        scope = entry.get("scope")
+        if isinstance(scope, str) and scope.strip():
+            snippet["language"] = scope.split(",")[0].strip()
+        snippets.append(snippet)
+    return snippets
+
+
+def parse_sublime_snippet(path):
+    """Parse a Sublime Text ``.sublime-snippet`` XML file."""
+    root = ElementTree.parse(path).getroot()
+    content = root.findtext("content")
+    if content is None:
+        return []
+    title = root.findtext("description") or root.findtext("tabTrigger") or os.path.splitext(os.path.basename(path))[0]
+    snippet = {"title": title.strip(), "snippet": content}
+    scope = root.findtext("scope")
+    if scope:
+        snippet["language"] = scope.split(".")[-1].split(",")[0].strip()
+    return [snippet]
+
+
+def parse_source_file(path):
+    """Turn a whole source file into one snippet titled after the file."""
+    if os.path.getsize(path) > MAX_SOURCE_BYTES:
+        return []
+    with open(path, "rb") as file:
+        data = file.read()
+    if b"\0" in data:
+        return []  # Binary
+    snippet = {"title": os.path.basename(path), "snippet": data.decode("utf-8", errors="replace")}
+    language = SOURCE_EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if language:
+        snippet["language"] = language
+    return [snippet]
+
+
+def parse_file(path):
+    """Parse one input file into normalized snippets. Runs in a worker process.
+
+    Returns (path, snippets, error).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    try:
+        if extension == ".code-snippets":
+            snippets = parse_code_snippets(path)
+        elif extension == ".sublime-snippet":
+            snippets = parse_sublime_snippet(path)
+        else:
+            snippets = parse_source_file(path)
+    except (OSError, ValueError, ElementTree.ParseError) as e:
+        return path, [], str(e)
+
+    normalized = []
+    for snippet in snippets:
+        snippet["title"] = " ".join(snippet["title"].split())
+        snippet["snippet"] = normalize_body(snippet["snippet"])
+        if snippet["title"] and snippet["snippet"]:
+            snippet["hash"] = hashlib.sha256(snippet["snippet"].encode("utf-8")).hexdigest()
+            normalized.append(snippet)
+    return path, normalized, None
+
+
+def import_snippets(paths, target_file, progress=None, max_workers=None):
+    """Import snippets from files and folders into one snippet file.
+
+    Inputs are parsed in parallel, bodies already in the target or seen
+    earlier in the batch are skipped, and everything is written with a
+    single locked write. Returns (added, duplicates, errors, written)
+    where errors is a list of (path, message) and written maps the target
+    to its snippets after the write, or is empty if nothing was added.
+    """
+    files = sorted(set(find_importable_files(paths)))
+    if progress:
+        progress(0, len(files))
+
+    parsed = []
+    errors = []
+    if files:
+        # Spawned workers do not inherit the GUI's threads or Qt state
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+            chunksize = max(1, len(files) // ((max_workers or os.cpu_count() or 1) * 8))
+            for done, (path, snippets, error) in enumerate(executor.map(parse_file, files, chunksize=chunksize), 1):
+                if error:
+                    errors.append((path, error))
+                parsed.extend(snippets)
+                if progress:
+                    progress(done, len(files))
+
+    os.makedirs(os.path.dirname(os.path.abspath(target_file)), exist_ok=True)
+    existing, _ = snippet_store.read_snippets(target_file)
+    seen = {hashlib.sha256(snippet["snippet"].encode("utf-8")).hexdigest() for snippet in existing}
+    new_snippets = []
+    for snippet in parsed:
+        body_hash = snippet.pop("hash")
+        if body_hash not in seen:
+            seen.add(body_hash)
+            snippet["id"] = snippet_store.new_snippet_id()
+            new_snippets.append(snippet)
+
+    written = {}
+    if new_snippets:
+        written[target_file], _ = snippet_store.update_snippets(target_file, upserts=new_snippets)
+    return len(new_snippets), len(parsed) - len(new_snippets), errors, written
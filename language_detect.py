@@ -0,0 +1,122 @@
+import hashlib
+import math
+import re
+
+import blob_store
+import snippet_store
+
+# Tokens and idioms that point to a language, with how strongly they do
+FEATURES = {
+    "python": [
+        (r"^\s*def \w+\(.*\)\s*(->\s*[\w\[\], .]+)?:\s*$", 3), (r"^\s*(from [\w.]+ )?import \w+", 2),
+        (r"\bself\.", 2), (r"\belif\b", 3), (r"\b(None|True|False)\b", 1), (r"^\s*class \w+(\(.*\))?:\s*$", 3),
+        (r"\bprint\(", 1), (r"^\s*#(?!include|!)", 1), (r"\blambda\b", 2), (r"__\w+__", 2),
+        (r":\s*$", 1), (r'"""|\'\'\'', 2),
+    ],
+    "javascript": [
+        (r"\bfunction\s*\w*\s*\(", 2), (r"\b(const|let)\s+\w+\s*=", 2), (r"=>", 2), (r"\bconsole\.log\(", 3),
+        (r"===|!==", 3), (r"\brequire\(", 3), (r"\bdocument\.", 3), (r"\bmodule\.exports\b", 3),
+        (r"\bundefined\b", 2), (r";\s*$", 1), (r"^\s*//", 1), (r"\basync\s+function\b", 2),
+    ],
+    "typescript": [
+        (r"\binterface\s+\w+\s*\{", 3), (r":\s*(string|number|boolean|any|void)\b", 3), (r"\btype\s+\w+\s*=", 3),
+        (r"\b(const|let)\s+\w+\s*:", 3), (r"\bimport\s+.*\bfrom\s+['\"]", 1), (r"=>", 1), (r"\bexport\s+", 1),
+        (r"<\w+>", 1), (r"\bpublic|private|readonly\b", 1),
+    ],
+    "java": [
+        (r"\bpublic\s+(static\s+)?(class|void|final)\b", 3), (r"\bSystem\.out\.print", 3), (r"\bString\[\]", 3),
+        (r"^\s*import\s+java\.", 3), (r"@Override\b", 3), (r"\bnew\s+\w+(<.*>)?\(", 1), (r";\s*$", 1),
+        (r"\bprivate\s+\w+\s+\w+;", 2), (r"^\s*package\s+[\w.]+;", 3),
+    ],
+    "c": [
+        (r"^\s*#include\s*<\w+\.h>", 3), (r"\bprintf\(", 2), (r"\bmalloc\(|\bfree\(", 3), (r"\bint\s+main\s*\(", 2),
+        (r"\b(struct|typedef)\b", 1), (r"->", 1), (r";\s*$", 1), (r"\bchar\s*\*", 2),
+    ],
+    "cpp": [
+        (r"^\s*#include\s*<\w+>", 3), (r"\bstd::", 3), (r"\bcout\s*<<|\bcin\s*>>", 3), (r"\btemplate\s*<", 3),
+        (r"\bnamespace\s+\w+", 2), (r"\busing\s+namespace\b", 3), (r"::", 1), (r"\bauto\b", 1), (r";\s*$", 1),
+    ],
+    "csharp": [
+        (r"^\s*using\s+System", 3), (r"\bConsole\.Write", 3), (r"\bnamespace\s+[\w.]+", 2),
+        (r"\bpublic\s+(static\s+)?(class|void|async)\b", 2), (r"\{\s*get;\s*set;\s*\}", 3), (r"\bvar\s+\w+\s*=", 1),
+        (r"\bstring\b", 1), (r";\s*$", 1),
+    ],
+    "go": [
+        (r"^\s*package\s+\w+\s*$", 3), (r"\bfunc\s+(\(\w+ \*?\w+\)\s*)?\w+\(", 3), (r":=", 3), (r"\bfmt\.", 3),
+        (r"\berr\s*!=\s*nil\b", 3), (r"\bchan\b|\bgo\s+func\b|\bdefer\b", 2),
+    ],
+    "rust": [
+        (r"\bfn\s+\w+", 3), (r"\blet\s+mut\b", 3), (r"\bimpl\b", 2), (r"\bprintln!\(", 3), (r"&str\b|\bString::", 2),
+        (r"\bmatch\b.*\{", 1), (r"->\s*\w+", 1), (r"\buse\s+\w+::", 3), (r"\bOption<|\bResult<", 3),
+    ],
+    "shell": [
+        (r"^#!/bin/(ba)?sh", 5), (r"^\s*(if|while)\s+\[", 3), (r"\bfi\b|\bdone\b|\besac\b", 3), (r"\$\{?\w+\}?", 1),
+        (r"^\s*echo\s", 2), (r"\|\s*(grep|awk|sed|xargs)\b", 2), (r"^\s*export\s+\w+=", 2),
+    ],
+    "sql": [
+        (r"(?i)\bselect\b.+\bfrom\b", 4), (r"(?i)\binsert\s+into\b", 4), (r"(?i)\bcreate\s+table\b", 4),
+        (r"(?i)\bwhere\b", 1), (r"(?i)\b(inner|left|right)\s+join\b", 3), (r"(?i)\bgroup\s+by\b|\border\s+by\b", 2),
+        (r"(?i)\bupdate\s+\w+\s+set\b", 4),
+    ],
+}
+MIN_SCORE = 3  # Below this the snippet is left without a language
+
+_compiled = [(language, [(re.compile(pattern, re.MULTILINE), weight) for pattern, weight in features])
+             for language, features in FEATURES.items()]
+
+
+def detect_language(text):
+    """Return the most likely language of a snippet body, or None."""
+    best_language = None
+    best_score = MIN_SCORE - 1
+    for language, features in _compiled:
+        score = 0.0
+        for pattern, weight in features:
+            count = len(pattern.findall(text))
+            if count:
+                score += weight * (1 + math.log(count))
+        if score > best_score:
+            best_language, best_score = language, score
+    return best_language
+
+
+def body_hash(text):
+    """Return the short hash used to tell if a body changed since detection."""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def needs_detection(snippet):
+    """Return True if a snippet was never classified or its body changed since."""
+    return snippet.get("detected_hash") != body_hash(snippet["snippet"])
+
+
+def detect_tree(root, progress=None):
+    """Classify every snippet below a folder whose body changed since its last run.
+
+    Returns {path: snippets} of the files that were written.
+    """
+    return detect_files(sorted(blob_store.snippet_files(root)), progress)
+
+
+def detect_files(paths, progress=None):
+    """Classify the snippets of some files whose body changed since their last run.
+
+    Results are stored on the snippets as ``detected_language`` and
+    ``detected_hash``. Returns {path: snippets} of the files that were written.
+    """
+    written = {}
+    for done, path in enumerate(paths, 1):
+        try:
+            snippets, _ = snippet_store.read_snippets(path)
+        except (OSError, ValueError):
+            continue
+        fields = {}
+        for snippet in snippets:
+            if needs_detection(snippet):
+                fields[snippet["id"]] = {"detected_language": detect_language(snippet["snippet"]),
+                                         "detected_hash": body_hash(snippet["snippet"])}
+        if fields:
+            written[path], _ = snippet_store.update_fields(path, fields)
+        if progress:
+            progress(done, len(paths))
+    return written
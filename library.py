@@ -0,0 +1,255 @@
+import json
+import os
+
+import blob_store
+import snapshot
+import snippet_store
+
+CHUNK_BITS = 16  # Record ids are split into a chunk key and a 16-bit offset
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+FACETS = ("tag", "language", "folder")
+SNAPSHOT_FILE = ".library_snapshot"
+SNAPSHOT_KIND = "library-1"
+
+
+class Bitmap:
+    """Set of record ids stored as one bit mask per 65536-id chunk.
+
+    Chunks without any member are not stored, so sparse facet values stay
+    small, and ``&`` only has to AND the chunks both sides have.
+    """
+
+    __slots__ = ("chunks",)
+
+    def __init__(self, chunks=None):
+        self.chunks = chunks or {}
+
+    def add(self, record_id):
+        key = record_id >> CHUNK_BITS
+        self.chunks[key] = self.chunks.get(key, 0) | (1 << (record_id & CHUNK_MASK))
+
+    def discard(self, record_id):
+        key = record_id >> CHUNK_BITS
+        bits = self.chunks.get(key, 0) & ~(1 << (record_id & CHUNK_MASK))
+        if bits:
+            self.chunks[key] = bits
+        else:
+            self.chunks.pop(key, None)
+
+    def __contains__(self, record_id):
+        return bool(self.chunks.get(record_id >> CHUNK_BITS, 0) >> (record_id & CHUNK_MASK) & 1)
+
+    def __and__(self, other):
+        small, large = sorted((self.chunks, other.chunks), key=len)
+        chunks = {}
+        for key, bits in small.items():
+            both = bits & large.get(key, 0)
+            if both:
+                chunks[key] = both
+        return Bitmap(chunks)
+
+    def __or__(self, other):
+        chunks = dict(self.chunks)
+        for key, bits in other.chunks.items():
+            chunks[key] = chunks.get(key, 0) | bits
+        return Bitmap(chunks)
+
+    def __len__(self):
+        return sum(bits.bit_count() for bits in self.chunks.values())
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def __iter__(self):
+        for key in sorted(self.chunks):
+            base = key << CHUNK_BITS
+            # Clearing bits one by one copies the whole int each time; scanning
+            # the reversed binary string is linear
+            digits = bin(self.chunks[key])[:1:-1]
+            position = digits.find("1")
+            while position != -1:
+                yield base + position
+                position = digits.find("1", position + 1)
+
+
+def snippet_language(snippet):
+    """Return the language a snippet is shown as: chosen, else detected."""
+    return snippet.get("language") or snippet.get("detected_language")
+
+
+class SnippetLibrary:
+    """Every snippet of the snippets/ tree with bitmap indexes per facet value.
+
+    Records are numbered in load order. When a file changes only its
+    records are replaced; their old numbers are retired rather than
+    reused so the bitmaps never need renumbering.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.records = []  # Record id -> (path, snippet), None once retired
+        self.search_texts = []  # Record id -> lower-cased title and body, for text search
+        self.by_file = {}  # Path -> record ids
+        self.by_snippet_id = {}  # Snippet id -> record id
+        self.folder_names = {}  # Path -> folder facet value, for files outside the tree layout
+        self.folders = {}  # Path -> folder facet value worked out from the path
+        self.file_stats = {}  # Path -> (mtime_ns, size) the loaded snippets were read at
+        self.alive = Bitmap()
+        self.facets = {facet: {} for facet in FACETS}
+
+    def load(self, progress=None):
+        """Read every snippet file below the root.
+
+        Files that did not change since the last load are taken from the
+        library snapshot, which is memory-mapped, instead of being read and
+        resolved again. The snapshot is rewritten if any file was not.
+        """
+        snapshot_path = os.path.join(self.root, SNAPSHOT_FILE)
+        old = snapshot.open_snapshot(snapshot_path, SNAPSHOT_KIND)
+        paths = sorted(blob_store.snippet_files(self.root))
+        entries = {}
+        stale = 0
+        for done, path in enumerate(paths, 1):
+            key = snapshot.file_key(self.root, path)
+            try:
+                # Taken before reading: if the file changes meanwhile, it only looks stale next time
+                info = os.stat(path)
+                sections = old.get(key, info.st_mtime_ns, info.st_size) if old is not None else None
+                if sections is not None:
+                    data = sections["records"]
+                    snippets = json.loads(bytes(data))
+                else:
+                    snippets, _ = snippet_store.read_snippets(path)
+                    data = json.dumps(snippets, separators=(",", ":")).encode("utf-8")
+                    stale += 1
+            except (OSError, ValueError):
+                continue
+            self.set_file(path, snippets, stat=(info.st_mtime_ns, info.st_size))
+            entries[key] = (info.st_mtime_ns, info.st_size, {"records": data})
+            if progress:
+                progress(done, len(paths))
+        if stale or old is None or len(old.files) != len(entries):
+            snapshot.write_snapshot(snapshot_path, SNAPSHOT_KIND, entries)
+        return self
+
+    def folder_of(self, path):
+        """Return the folder of a snippet file relative to the root."""
+        if path in self.folder_names:
+            return self.folder_names[path]
+        if path not in self.folders:
+            folder = os.path.relpath(os.path.dirname(os.path.abspath(path)), os.path.abspath(self.root))
+            self.folders[path] = "" if folder == "." else folder.replace(os.sep, "/")
+        return self.folders[path]
+
+    def facet_values_of(self, path, snippet):
+        """Yield (facet, value) pairs a snippet is indexed under."""
+        for tag in snippet.get("tags", ()):
+            yield "tag", tag
+        language = snippet_language(snippet)
+        if language:
+            yield "language", language
+        yield "folder", self.folder_of(path)
+
+    def set_file(self, path, snippets, folder=None, stat=None):
+        """Replace the records of one file with its current snippets.
+
+        ``folder`` overrides the folder facet value the snippets get.
+        ``stat`` is the (mtime_ns, size) the snippets were read at, if known.
+        """
+        path = os.path.abspath(path)
+        self.remove_file(path)
+        if folder is not None:
+            self.folder_names[path] = folder
+        if stat is not None:
+            self.file_stats[path] = stat
+        else:
+            self.file_stats.pop(path, None)  # Written since it was read; the snapshot cannot vouch for it
+        ids = []
+        for snippet in snippets:
+            record_id = len(self.records)
+            self.records.append((path, snippet))
+            self.search_texts.append(f"{snippet['title']}\n{snippet['snippet']}".lower())
+            self.alive.add(record_id)
+            self.by_snippet_id[snippet["id"]] = record_id
+            for facet, value in self.facet_values_of(path, snippet):
+                self.facets[facet].setdefault(value, Bitmap()).add(record_id)
+            ids.append(record_id)
+        self.by_file[path] = ids
+
+        # Retired ids only cost memory; renumber once they outnumber live ones
+        if len(self.records) > 2 * len(self.alive) + 1024:
+            self.compact()
+
+    def compact(self):
+        """Renumber the records so no retired ids are left."""
+        files = [(path, [self.records[record_id][1] for record_id in ids]) for path, ids in self.by_file.items()]
+        folder_names = self.folder_names
+        file_stats = dict(self.file_stats)
+        self.records = []
+        self.search_texts = []
+        self.by_file = {}
+        self.by_snippet_id = {}
+        self.alive = Bitmap()
+        self.facets = {facet: {} for facet in FACETS}
+        for path, snippets in files:
+            self.set_file(path, snippets, folder_names.get(path), file_stats.get(path))
+
+    def remove_file(self, path):
+        """Forget the records of a file."""
+        path = os.path.abspath(path)
+        for record_id in self.by_file.pop(path, ()):
+            _, snippet = self.records[record_id]
+            for facet, value in self.facet_values_of(path, snippet):
+                bitmap = self.facets[facet].get(value)
+                if bitmap is not None:
+                    bitmap.discard(record_id)
+                    if not bitmap:
+                        del self.facets[facet][value]
+            self.alive.discard(record_id)
+            if self.by_snippet_id.get(snippet["id"]) == record_id:
+                del self.by_snippet_id[snippet["id"]]
+            self.records[record_id] = None
+            self.search_texts[record_id] = None
+
+    def facet_values(self, facet):
+        """Return the sorted values of a facet with their snippet counts."""
+        return sorted((value, len(bitmap)) for value, bitmap in self.facets[facet].items())
+
+    def matching(self, **selected):
+        """Return the bitmap of records having every selected facet value."""
+        result = self.alive
+        for facet, value in selected.items():
+            if value is None:
+                continue
+            bitmap = self.facets[facet].get(value)
+            if bitmap is None:
+                return Bitmap()
+            result = result & bitmap
+        return result
+
+    def search(self, query="", within=None, **selected):
+        """Return the record ids matching the facets and containing the query text.
+
+        ``within`` limits the search to earlier results, which is how a
+        query that only grew is narrowed without scanning everything again.
+        """
+        query = query.lower()
+        if within is not None:
+            candidates = within
+        elif any(value is not None for value in selected.values()):
+            candidates = self.matching(**selected)
+        else:
+            candidates = range(len(self.search_texts))  # Retired ids are skipped below
+        if not query:
+            return [record_id for record_id in candidates if self.search_texts[record_id] is not None]
+        search_texts = self.search_texts
+        return [record_id for record_id in candidates
+                if search_texts[record_id] is not None and query in search_texts[record_id]]
+
+    def find(self, snippet_id):
+        """Return the record id of a snippet, or None if it is not in the library."""
+        return self.by_snippet_id.get(snippet_id)
+
+    def record(self, record_id):
+        """Return (path, snippet) of a record."""
+        return self.records[record_id]
@@ -0,0 +1,160 @@
+TOO_EXPENSIVE = 256  # Edit distance at which one search settles for a good split over the best
+MAX_WORK = 1000000  # Diagonals searched over a whole diff; past it the ranges left are just replaced
+
+
+def hash_lines(old_lines, new_lines):
+    """Number the distinct lines of both texts, so comparing lines compares ints."""
+    numbers = {}
+    old = [numbers.setdefault(line, len(numbers)) for line in old_lines]
+    new = [numbers.setdefault(line, len(numbers)) for line in new_lines]
+    return old, new
+
+
+def _middle_snake(a, alo, ahi, b, blo, bhi, work):
+    """Return the point (x, y) a shortest edit script of the two ranges passes through.
+
+    Searches forward from the start and backward from the end at the same
+    time until the paths meet, keeping only one diagonal array per
+    direction (Myers' linear-space refinement). Returns None if the ranges
+    have nothing in common.
+
+    Texts that differ almost everywhere would take quadratic time, so after
+    TOO_EXPENSIVE steps the furthest point the forward search reached is
+    used instead. ``work`` is a one-item list holding what is left of the
+    search budget of the whole diff; the search also settles once it runs
+    out, so many splits cannot add up to quadratic time either. The diff is
+    then still correct, just not always minimal.
+    """
+    n = ahi - alo
+    m = bhi - blo
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    size = 2 * max_d + 2
+    forward = [-1] * size
+    forward[offset + 1] = 0
+    backward = forward[:]
+    delta = n - m
+    front = delta % 2 != 0
+    k1_start = k1_end = k2_start = k2_end = 0
+    for d in range(max_d):
+        for k1 in range(-d + k1_start, d + 1 - k1_end, 2):
+            index = offset + k1
+            if k1 == -d or (k1 != d and forward[index - 1] < forward[index + 1]):
+                x1 = forward[index + 1]
+            else:
+                x1 = forward[index - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            forward[index] = x1
+            if x1 > n:
+                k1_end += 2
+            elif y1 > m:
+                k1_start += 2
+            elif front:
+                other = offset + delta - k1
+                if 0 <= other < size and backward[other] != -1 and x1 >= n - backward[other]:
+                    return alo + x1, blo + y1
+        for k2 in range(-d + k2_start, d + 1 - k2_end, 2):
+            index = offset + k2
+            if k2 == -d or (k2 != d and backward[index - 1] < backward[index + 1]):
+                x2 = backward[index + 1]
+            else:
+                x2 = backward[index - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - x2 - 1] == b[bhi - y2 - 1]:
+                x2 += 1
+                y2 += 1
+            backward[index] = x2
+            if x2 > n:
+                k2_end += 2
+            elif y2 > m:
+                k2_start += 2
+            elif not front:
+                other = offset + delta - k2
+                if 0 <= other < size and forward[other] != -1:
+                    x1 = forward[other]
+                    y1 = offset + x1 - other
+                    if x1 >= n - x2:
+                        return alo + x1, blo + y1
+        work[0] -= 2 * d + 2
+        if d >= TOO_EXPENSIVE or work[0] <= 0:
+            best = max(range(-d, d + 1, 2), key=lambda k: 2 * forward[offset + k] - k
+                       if forward[offset + k] != -1 else -1)
+            x1 = min(forward[offset + best], n)
+            y1 = min(x1 - best, m)
+            if 0 < x1 + y1 < n + m:
+                return alo + x1, blo + y1
+            return None
+    return None
+
+
+def matching_runs(a, b, max_work=MAX_WORK):
+    """Yield (i, j, length) runs of equal items of a short edit script, in order."""
+    work = [max_work]
+    ranges = [(0, len(a), 0, len(b))]
+    while ranges:
+        alo, ahi, blo, bhi = ranges.pop()
+        # Common ends need no searching
+        start = 0
+        while alo + start < ahi and blo + start < bhi and a[alo + start] == b[blo + start]:
+            start += 1
+        if start:
+            yield alo, blo, start
+            alo += start
+            blo += start
+        end = 0
+        while alo < ahi - end and blo < bhi - end and a[ahi - end - 1] == b[bhi - end - 1]:
+            end += 1
+        if end:
+            # Yielded after everything in between, which is on the stack below it
+            ranges.append((ahi - end, ahi - end, bhi - end, -end))
+        ahi -= end
+        bhi -= end
+        if alo < ahi and blo < bhi:
+            split = _middle_snake(a, alo, ahi, b, blo, bhi, work)
+            if split is not None:
+                x, y = split
+                ranges.append((x, ahi, y, bhi))
+                ranges.append((alo, x, blo, y))
+                continue
+        while ranges and ranges[-1][3] < 0:
+            i, _, j, length = ranges.pop()
+            yield i, j, -length
+
+
+def diff_lines(old_lines, new_lines):
+    """Return difflib-style opcodes turning one list of lines into another.
+
+    Lines are hashed to ints first. Lines that only one side has can only
+    be deleted or inserted, so they are left out of the search. The search
+    as a whole stops after MAX_WORK steps, so texts that share many lines in
+    a different order still take well under a second.
+    """
+    a, b = hash_lines(old_lines, new_lines)
+    in_b = set(b)
+    in_a = set(a)
+    a_kept = [i for i, line in enumerate(a) if line in in_b]
+    b_kept = [j for j, line in enumerate(b) if line in in_a]
+    matches = []
+    for i, j, length in matching_runs([a[i] for i in a_kept], [b[j] for j in b_kept]):
+        for step in range(length):
+            matches.append((a_kept[i + step], b_kept[j + step]))
+
+    opcodes = []
+    i = j = 0
+    for match_i, match_j in matches + [(len(a), len(b))]:
+        if match_i > i and match_j > j:
+            opcodes.append(("replace", i, match_i, j, match_j))
+        elif match_i > i:
+            opcodes.append(("delete", i, match_i, j, j))
+        elif match_j > j:
+            opcodes.append(("insert", i, i, j, match_j))
+        if match_i < len(a):
+            if opcodes and opcodes[-1][0] == "equal" and opcodes[-1][2] == match_i:
+                opcodes[-1] = ("equal", opcodes[-1][1], match_i + 1, opcodes[-1][3], match_j + 1)
+            else:
+                opcodes.append(("equal", match_i, match_i + 1, match_j, match_j + 1))
+        i, j = match_i + 1, match_j + 1
+    return opcodes
@@ -1,13 +1,18 @@
+import argparse
+import contextlib
+import copy
+import csv
 import json
 import sys
 import os
-import shutil
+import time
 from PyQt6.QtWidgets import (
     QApplication,
     QMainWindow,
     QVBoxLayout,
     QPushButton,
     QListWidget,
+    QListWidgetItem,
     QMessageBox,
     QDialog,
     QPlainTextEdit,
@@ -19,10 +24,42 @@ from PyQt6.QtWidgets import (
     QFileDialog,
     QTreeWidget,
     QTreeWidgetItem,
-    QInputDialog
+    QInputDialog,
+    QProgressDialog,
+    QComboBox,
+    QCheckBox,
+    QTabWidget,
+    QMenu,
+    QAbstractItemView,
+    QHeaderView
 )
-from PyQt6.QtGui import QIcon, QFont, QMouseEvent, QKeySequence
-from PyQt6.QtCore import Qt, QPoint
+from PyQt6.QtGui import QIcon, QFont, QMouseEvent, QKeySequence, QShortcut
+from PyQt6.QtCore import Qt, QPoint, QTimer, pyqtSignal
+
+import blob_store
+import duplicates
+import exporter
+import importer
+import language_detect
+import paged_file
+import related
+import snippet_store
+import templates
+import trash
+import tree_scan
+import tree_stats
+from clipboard_history import ClipboardHistory, HISTORY_FOLDER
+from diff_view import DiffView
+from highlighter import CodeHighlighter, LANGUAGES, PLAIN_TEXT
+from history import UndoStack, VersionHistory
+from library import SnippetLibrary
+from quick_picker import QuickPicker
+from single_instance import SingleInstance
+from tree_stats import TreeStats
+from usage import UsageTracker
+from workers import StreamWorker, Worker
+
+FILE_ROLE = Qt.ItemDataRole.UserRole + 1  # Snippet file a list item belongs to
 
 def apply_styles(app):
     """Apply macOS-like styles to the application."""
@@ -96,12 +133,25 @@ class AddSnippetDialog(QDialog):
         self.title_edit.setPlaceholderText("Enter snippet title here...")
         layout.addWidget(self.title_edit)
 
+        # Language used for syntax highlighting
+        self.language_combo = QComboBox(self)
+        self.language_combo.addItems([PLAIN_TEXT] + sorted(LANGUAGES))
+        layout.addWidget(self.language_combo)
+
+        # Tags for the faceted filter
+        self.tags_edit = QLineEdit(self)
+        self.tags_edit.setPlaceholderText("Tags, separated by commas...")
+        layout.addWidget(self.tags_edit)
+
         # Code snippet editor
         self.text_edit = QPlainTextEdit(self)
         self.text_edit.setPlaceholderText("Enter your code snippet here...")
         self.text_edit.setFont(QFont("Courier New", 10))  # Monospace font for code
         layout.addWidget(self.text_edit)
 
+        self.highlighter = CodeHighlighter(self.text_edit.document())
+        self.language_combo.currentTextChanged.connect(self.highlighter.set_language)
+
         # Buttons
         button_layout = QHBoxLayout()
 
@@ -124,6 +174,310 @@ class AddSnippetDialog(QDialog):
         snippet = self.text_edit.toPlainText().strip()
         return title, snippet
 
+    def get_language(self):
+        """Return the selected language, or None for plain text."""
+        language = self.language_combo.currentText()
+        return None if language == PLAIN_TEXT else language
+
+    def set_language(self, language):
+        """Select a language in the dialog, adding one the highlighter does not know so it is kept."""
+        if language and self.language_combo.findText(language) < 0:
+            self.language_combo.addItem(language)
+        self.language_combo.setCurrentText(language or PLAIN_TEXT)
+
+    def get_tags(self):
+        """Return the entered tags without duplicates, in the order given."""
+        tags = [tag.strip() for tag in self.tags_edit.text().split(",")]
+        return list(dict.fromkeys(tag for tag in tags if tag))
+
+    def set_tags(self, tags):
+        """Show a snippet's tags in the dialog."""
+        self.tags_edit.setText(", ".join(tags))
+
+class DuplicatesDialog(QDialog):
+    """Review clusters of duplicate snippets and merge each into one."""
+
+    def __init__(self, clusters, snippet_manager, parent=None):
+        super().__init__(parent)
+        self.clusters = clusters
+        self.snippet_manager = snippet_manager
+
+        self.setWindowTitle("Duplicate Snippets")
+        self.setGeometry(300, 300, 800, 500)
+
+        layout = QVBoxLayout()
+        lists_layout = QHBoxLayout()
+
+        self.cluster_list = QListWidget(self)
+        self.cluster_list.currentRowChanged.connect(self.show_cluster)
+        lists_layout.addWidget(self.cluster_list)
+
+        # Checked copies are merged into the selected one
+        self.member_list = QListWidget(self)
+        self.member_list.currentItemChanged.connect(self.show_member)
+        lists_layout.addWidget(self.member_list)
+        layout.addLayout(lists_layout)
+
+        self.preview = QPlainTextEdit(self)
+        self.preview.setReadOnly(True)
+        self.preview.setFont(QFont("Courier New", 10))
+        layout.addWidget(self.preview)
+
+        button_layout = QHBoxLayout()
+        merge_button = QPushButton("Keep Selected, Remove Checked", self)
+        merge_button.clicked.connect(self.merge_cluster)
+        button_layout.addWidget(merge_button)
+
+        close_button = QPushButton("Close", self)
+        close_button.clicked.connect(self.accept)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        self.fill_clusters()
+
+    def fill_clusters(self):
+        """List the clusters, biggest first."""
+        self.cluster_list.clear()
+        for cluster in self.clusters:
+            self.cluster_list.addItem(f"{len(cluster)} copies: {cluster[0]['title']}")
+        self.cluster_list.setCurrentRow(0)
+
+    def show_cluster(self, row):
+        """List the copies in a cluster, all checked except the one to keep."""
+        self.member_list.clear()
+        if row < 0:
+            self.preview.clear()
+            return
+        folder = self.snippet_manager.sidebar.project_folder
+        for member in self.clusters[row]:
+            item = QListWidgetItem(f"{member['title']} - {os.path.relpath(member['path'], folder)} "
+                                   f"({member['similarity']:.0%})")
+            item.setData(Qt.ItemDataRole.UserRole, member)
+            item.setCheckState(Qt.CheckState.Checked)
+            self.member_list.addItem(item)
+        self.member_list.setCurrentRow(0)
+
+    def show_member(self, current, previous=None):
+        """Show the body of a copy and keep it out of the ones to remove."""
+        if previous is not None:
+            previous.setCheckState(Qt.CheckState.Checked)
+        if current is None:
+            self.preview.clear()
+            return
+        current.setCheckState(Qt.CheckState.Unchecked)
+        member = current.data(Qt.ItemDataRole.UserRole)
+        library = self.snippet_manager.library
+        record_id = library.find(member["id"]) if library is not None else None
+        self.preview.setPlainText(library.record(record_id)[1]["snippet"] if record_id is not None else "")
+
+    def merge_cluster(self):
+        """Remove the checked copies, moving their tags to the selected one."""
+        keep_item = self.member_list.currentItem()
+        if keep_item is None:
+            return
+        keep = keep_item.data(Qt.ItemDataRole.UserRole)
+        others = [self.member_list.item(i).data(Qt.ItemDataRole.UserRole) for i in range(self.member_list.count())
+                  if self.member_list.item(i) is not keep_item
+                  and self.member_list.item(i).checkState() == Qt.CheckState.Checked]
+        if not others:
+            return
+        try:
+            changes = duplicates.merge_duplicates(keep, others)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Error", f"Failed to merge snippets: {e}")
+            return
+        # One transaction for every file, undoable like a delete
+        if changes and not self.snippet_manager.run_batch(f"Merge {len(others) + 1} copies of '{keep['title']}'",
+                                                          changes):
+            return
+
+        row = self.cluster_list.currentRow()
+        removed = {member["id"] for member in others}
+        remaining = [member for member in self.clusters[row] if member["id"] not in removed]
+        if len(remaining) > 1:
+            self.clusters[row] = remaining
+        else:
+            del self.clusters[row]
+        self.fill_clusters()
+        self.cluster_list.setCurrentRow(min(row, len(self.clusters) - 1))
+
+class HistoryDialog(QDialog):
+    """Browse the saved versions of a snippet and pick one to restore."""
+
+    def __init__(self, versions, parent=None):
+        super().__init__(parent)
+        self.versions = versions
+
+        self.setWindowTitle("Snippet History")
+        self.setGeometry(300, 300, 900, 600)
+
+        layout = QVBoxLayout()
+        self.version_list = QListWidget(self)
+        for index, (when, title, _) in enumerate(versions):
+            label = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(when))
+            self.version_list.addItem(f"{label}  {title}" + ("  (current)" if index == 0 else ""))
+        self.version_list.currentRowChanged.connect(self.show_version)
+        layout.addWidget(self.version_list)
+
+        self.compare_box = QCheckBox("Compare with the current version", self)
+        self.compare_box.toggled.connect(lambda: self.show_version(self.version_list.currentRow()))
+        layout.addWidget(self.compare_box)
+
+        # What the version changed, and the version as it was
+        self.tabs = QTabWidget(self)
+        self.diff_view = DiffView(self)
+        self.tabs.addTab(self.diff_view, "Changes")
+        self.preview = QPlainTextEdit(self)
+        self.preview.setReadOnly(True)
+        self.preview.setFont(QFont("Courier New", 10))
+        self.tabs.addTab(self.preview, "Text")
+        layout.addWidget(self.tabs)
+
+        button_layout = QHBoxLayout()
+        restore_button = QPushButton("Restore", self)
+        restore_button.clicked.connect(self.accept)
+        button_layout.addWidget(restore_button)
+
+        close_button = QPushButton("Close", self)
+        close_button.clicked.connect(self.reject)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        self.version_list.setCurrentRow(0)
+
+    def show_version(self, row):
+        """Show a version and what changed in it, or since it when comparing with the current one."""
+        if row < 0:
+            self.preview.clear()
+            self.diff_view.set_texts("", "")
+            return
+        body = self.versions[row][2]
+        self.preview.setPlainText(body)
+        if self.compare_box.isChecked():
+            self.diff_view.set_texts(body, self.versions[0][2])
+        else:
+            self.diff_view.set_texts(self.versions[row + 1][2] if row + 1 < len(self.versions) else "", body)
+
+    def selected_version(self):
+        """Return (time, title, body) of the chosen version."""
+        return self.versions[self.version_list.currentRow()]
+
+class TrashDialog(QDialog):
+    """Deleted files and folders, to restore them or delete them for good."""
+
+    def __init__(self, sidebar, parent=None):
+        super().__init__(parent)
+        self.sidebar = sidebar
+        self.entries = []
+
+        self.setWindowTitle("Trash")
+        self.setGeometry(300, 300, 600, 400)
+
+        layout = QVBoxLayout()
+        self.entry_list = QListWidget(self)
+        self.entry_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        layout.addWidget(self.entry_list)
+
+        button_layout = QHBoxLayout()
+        restore_button = QPushButton("Restore", self)
+        restore_button.clicked.connect(self.restore_selected)
+        button_layout.addWidget(restore_button)
+
+        self.empty_button = QPushButton("Empty Trash", self)
+        self.empty_button.clicked.connect(self.empty_trash)
+        button_layout.addWidget(self.empty_button)
+
+        close_button = QPushButton("Close", self)
+        close_button.clicked.connect(self.reject)
+        button_layout.addWidget(close_button)
+        layout.addLayout(button_layout)
+        self.setLayout(layout)
+
+        self.fill_entries()
+
+    def fill_entries(self):
+        self.entries = trash.entries(self.sidebar.project_folder)
+        self.entry_list.clear()
+        for _, path, when in self.entries:
+            label = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(when))
+            self.entry_list.addItem(f"{label}  {path}")
+        self.empty_button.setEnabled(bool(self.entries))
+
+    def restore_selected(self):
+        """Put the selected items back where they were deleted from."""
+        rows = sorted(index.row() for index in self.entry_list.selectedIndexes())
+        if not rows:
+            QMessageBox.warning(self, "No Selection", "Please select an item to restore.")
+            return
+        for row in rows:
+            entry_id, path, _ = self.entries[row]
+            try:
+                trash.restore(self.sidebar.project_folder, entry_id)
+            except OSError as e:
+                QMessageBox.warning(self, "Error", f"Could not restore {path}: {e}")
+        self.sidebar.refresh_tree()
+        self.fill_entries()
+
+    def empty_trash(self):
+        """Delete everything in the trash for good, in the background."""
+        answer = QMessageBox.question(self, "Empty Trash", "Delete everything in the trash for good?")
+        if answer != QMessageBox.StandardButton.Yes:
+            return
+        self.empty_button.setEnabled(False)
+        self.entry_list.clear()
+        self.sidebar.reclaim_trash(None, self.fill_entries)
+
+
+class SnippetTree(QTreeWidget):
+    """Folder tree that takes snippets dragged from the snippet list and files dragged between folders.
+
+    Qt does not move anything itself; the drops are handed on as signals.
+    """
+
+    snippets_dropped = pyqtSignal(object)  # Item dropped on
+    files_dropped = pyqtSignal(list, object)  # Dragged items, item dropped on
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.snippet_source = None  # Widget snippets are dragged from
+        self.setDragEnabled(True)
+        self.setAcceptDrops(True)
+        self.setDropIndicatorShown(True)
+        self.setDragDropMode(QAbstractItemView.DragDropMode.DragDrop)
+
+    def accepts(self, event):
+        source = event.source()
+        return source is self or (source is not None and source is self.snippet_source)
+
+    def dragEnterEvent(self, event):
+        if self.accepts(event):
+            event.acceptProposedAction()
+        else:
+            event.ignore()
+
+    def dragMoveEvent(self, event):
+        target = self.itemAt(event.position().toPoint())
+        if not self.accepts(event) or target is None or (event.source() is self and target in self.selectedItems()):
+            event.ignore()
+        else:
+            event.acceptProposedAction()
+
+    def dropEvent(self, event):
+        target = self.itemAt(event.position().toPoint())
+        if not self.accepts(event) or target is None:
+            event.ignore()
+            return
+        if event.source() is self:
+            self.files_dropped.emit(self.selectedItems(), target)
+        else:
+            self.snippets_dropped.emit(target)
+        # Reported as a copy so the source view does not remove the dragged items itself
+        event.setDropAction(Qt.DropAction.CopyAction)
+        event.accept()
+
+
 class Sidebar(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -165,11 +519,36 @@ class Sidebar(QWidget):
         layout = QVBoxLayout()
 
         # Add a tree widget to display folders and files
-        self.tree_widget = QTreeWidget(self)
+        self.tree_widget = SnippetTree(self)
         self.tree_widget.setHeaderHidden(True)  # Hide the header
+        self.tree_widget.setColumnCount(2)  # Name, then snippet count and size
+        self.tree_widget.header().setStretchLastSection(False)
+        self.tree_widget.header().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.tree_widget.header().setSectionResizeMode(1, QHeaderView.ResizeMode.ResizeToContents)
         self.tree_widget.itemClicked.connect(self.on_item_clicked)  # Connect item click event
+        self.tree_widget.snippets_dropped.connect(self.drop_snippets)
+        self.tree_widget.files_dropped.connect(self.drop_files)
         layout.addWidget(self.tree_widget)
 
+        # Finish any move a crash interrupted before showing the files
+        os.makedirs(self.project_folder, exist_ok=True)
+        snippet_store.recover(self.project_folder)
+
+        # Deleted items go to the trash; their space is given back later in the background
+        self.reclaim_worker = None
+        QTimer.singleShot(0, self.reclaim_trash)
+
+        # The tree is filled by a background scan; see populate_tree
+        self.folder_items = {}
+        self.expanded_folders = set()
+        self.scan_generation = 0
+        self.tree_worker = None
+
+        # Counts and sizes come from a cache and are brought up to date in the background
+        self.tree_stats = TreeStats(self.project_folder)
+        self.stats_worker = None
+        QTimer.singleShot(0, self.scan_stats)
+
         # Populate the tree widget with folders and files
         self.populate_tree()
 
@@ -189,33 +568,114 @@ class Sidebar(QWidget):
         refresh_button = QPushButton("Delete")
         refresh_button.clicked.connect(self.remove_selected)
 
+        import_button = QPushButton("Import...")
+        import_button.clicked.connect(self.import_snippets)
+
+        duplicates_button = QPushButton("Find Duplicates")
+        duplicates_button.clicked.connect(self.find_duplicates)
+
+        trash_button = QPushButton("Trash...")
+        trash_button.clicked.connect(self.show_trash)
+
         # Add buttons to the layout
         layout.addWidget(load_button)
         layout.addWidget(save_button)
         layout.addWidget(refresh_button)
+        layout.addWidget(import_button)
+        layout.addWidget(duplicates_button)
+        layout.addWidget(trash_button)
 
     def set_snippet_manager(self, snippet_manager):
         """Set the snippet manager for the sidebar."""
         self.snippet_manager = snippet_manager
 
     def populate_tree(self):
-        """Populate the tree widget with folders and JSON files."""
+        """Fill the tree with the folders and JSON files below the project folder, at any depth.
+
+        The folders are listed by a background scan and show up as they are found.
+        """
         if not os.path.exists(self.project_folder):
             os.makedirs(self.project_folder)
 
         root_folder = QTreeWidgetItem(self.tree_widget, ["Snippets"])
         self.tree_widget.addTopLevelItem(root_folder)
-
-        for folder in os.listdir(self.project_folder):
-            folder_path = os.path.join(self.project_folder, folder)
-            if os.path.isdir(folder_path):
-                folder_item = QTreeWidgetItem(root_folder, [folder])
-                for file in os.listdir(folder_path):
-                    if file.endswith(".json"):
-                        file_item = QTreeWidgetItem(folder_item, [file])
-
-        # Expand the root folder by default
-        root_folder.setExpanded(True)
+        root_folder.setExpanded(True)  # Expand the root folder by default
+        self.folder_items = {"": root_folder}  # Folder path relative to the project folder, with / -> item
+
+        self.scan_generation += 1
+        generation = self.scan_generation  # Results of an older scan are dropped
+        self.tree_worker = StreamWorker(tree_scan.scan_tree, self.project_folder, parent=self)
+        self.tree_worker.partial.connect(lambda batch: self.add_scanned(batch, generation))
+        self.tree_worker.result.connect(lambda _: self.show_stats() if generation == self.scan_generation else None)
+        self.tree_worker.error.connect(
+            lambda error: QMessageBox.warning(self, "Error", f"Could not list folders: {error}"))
+        self.tree_worker.start()
+
+    def add_scanned(self, batch, generation):
+        """Add folders found by the tree scan, keeping open the ones that were open before a refresh."""
+        if generation != self.scan_generation:
+            return
+        for relative, folders, files in batch:
+            parent = self.folder_items.get(relative)
+            if parent is None:
+                continue
+            for name in folders:
+                child = f"{relative}/{name}" if relative else name
+                self.folder_items[child] = QTreeWidgetItem(parent, [name])
+                if child in self.expanded_folders:
+                    self.folder_items[child].setExpanded(True)
+            for name in files:
+                QTreeWidgetItem(parent, [name])
+
+    def refresh_tree(self):
+        """Re-read the folder tree from disk."""
+        self.expanded_folders = {relative for relative, item in self.folder_items.items() if item.isExpanded()}
+        self.tree_widget.clear()
+        self.populate_tree()
+        self.scan_stats()
+
+    def show_stats(self):
+        """Show the snippet count, size and last change of every file and folder in the tree."""
+        totals = self.tree_stats.folder_totals()
+        items = [self.tree_widget.topLevelItem(index) for index in range(self.tree_widget.topLevelItemCount())]
+        while items:
+            item = items.pop()
+            items.extend(item.child(index) for index in range(item.childCount()))
+            path = self.item_path(item)
+            if item.text(0).endswith(".json"):
+                stats = self.tree_stats.file_stats(path)
+            else:
+                stats = totals.get(self.tree_stats.folder_key(path), (0, 0, 0))
+            if stats is None:
+                continue
+            count, size, mtime = stats
+            item.setText(1, f"{count} · {tree_stats.format_size(size)}")
+            item.setTextAlignment(1, Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+            changed = time.strftime("%Y-%m-%d %H:%M", time.localtime(mtime)) if mtime else "never"
+            tooltip = f"{count} snippet(s), {tree_stats.format_size(size)}, last changed {changed}"
+            item.setToolTip(0, tooltip)
+            item.setToolTip(1, tooltip)
+
+    def scan_stats(self):
+        """Re-count the files that changed on disk in the background."""
+        if self.stats_worker is not None and self.stats_worker.isRunning():
+            self.stats_pending = True
+            return
+        self.stats_pending = False
+        self.stats_worker = Worker(self.tree_stats.scanned, parent=self)
+        self.stats_worker.result.connect(self.on_stats_scanned)
+        self.stats_worker.start()
+
+    def on_stats_scanned(self, files):
+        self.tree_stats.install(files)
+        self.show_stats()
+        if self.stats_pending:
+            self.scan_stats()
+
+    def file_changed(self, path, count=None):
+        """Update the stats of a snippet file that was just written, moved or deleted."""
+        self.tree_stats.set_file(path, count)
+        self.show_stats()
 
     def refresh_sidebar(self):
         """Placeholder for refreshing the sidebar."""
@@ -225,32 +685,18 @@ class Sidebar(QWidget):
 
     def on_item_clicked(self, item):
         """Handle item click event to load JSON files."""
-        if item.childCount() == 0:  # Check if the item is a file (no children)
-            file_name = item.text(0)
-            if item.parent() is not None:  # Check if the item has a parent
-                folder_name = item.parent().text(0)
-                file_path = os.path.join(self.project_folder, folder_name, file_name)
-            else:  # If the item is a top-level item, do not try to open a file
-                return
+        file_path = self.item_path(item)
+        if not os.path.isfile(file_path):  # Folders only open and close
+            return
+        if not file_path.endswith('.json'):
+            QMessageBox.warning(self, "Error", f"'{item.text(0)}' is not a JSON file.")
+            return
+        if self.snippet_manager:
+            self.snippet_manager.open_snippet_file(file_path)
 
-            if os.path.isfile(file_path):  # Check if the file_path is a file
-                if file_path.endswith('.json'):  # Check if the file is a JSON file
-                    try:
-                        with open(file_path, "r") as file:
-                            data = json.load(file)
-                            if self.snippet_manager:
-                                self.snippet_manager.handle_loaded_json(data)
-                    except (FileNotFoundError, json.JSONDecodeError) as e:
-                        QMessageBox.warning(self, "Error", f"Could not load file: {file_name}")
-                else:
-                    QMessageBox.warning(self, "Error", f"'{file_name}' is not a JSON file.")
-            else:
-                if os.path.isdir(file_path):  # Check if the file_path is a directory
-                    pass
-                else:
-                    pass
-        else:
-            pass
+    def folder_item_of(self, item):
+        """Return the item itself if it is a folder, otherwise the folder it is in."""
+        return item if os.path.isdir(self.item_path(item)) or item.parent() is None else item.parent()
 
     def add_folder(self):
         """Add a new folder to the tree."""
@@ -259,71 +705,215 @@ class Sidebar(QWidget):
             QMessageBox.warning(self, "No Selection", "Please select a folder to add a sub-folder.")
             return
 
+        current_item = self.folder_item_of(current_item)
         folder_name, ok = QInputDialog.getText(self, "Add Folder", "Enter folder name:")
         if ok and folder_name.strip():
             new_folder = QTreeWidgetItem(current_item, [folder_name])
             current_item.setExpanded(True)  # Expand the parent folder
 
             # Create the new folder in the project folder
-            folder_path = os.path.join(self.project_folder, current_item.text(0), folder_name)
+            folder_path = os.path.join(self.item_path(current_item), folder_name)
+            self.folder_items[os.path.relpath(folder_path, self.project_folder).replace(os.sep, "/")] = new_folder
             if not os.path.exists(folder_path):
                 os.makedirs(folder_path)
+                self.push_tree_change(f"Add folder '{folder_name}'", lambda: os.rmdir(folder_path),
+                                      lambda: os.makedirs(folder_path))
 
     def add_file(self):
         """Add a new JSON file to the tree."""
         current_item = self.tree_widget.currentItem()
-        if not current_item or current_item.childCount() > 0:
+        if not current_item:
             QMessageBox.warning(self, "Invalid Selection", "Please select a folder to add a file.")
             return
 
+        current_item = self.folder_item_of(current_item)
         file_name, ok = QInputDialog.getText(self, "Add File", "Enter file name (with .json extension):")
         if ok and file_name.strip().endswith(".json"):
             QTreeWidgetItem(current_item, [file_name])
             current_item.setExpanded(True)  # Expand the parent folder
 
             # Create the new JSON file in the project folder
-            folder_path = os.path.join(self.project_folder, current_item.text(0))
+            folder_path = self.item_path(current_item)
             if not os.path.exists(folder_path):
                 os.makedirs(folder_path)
 
             file_path = os.path.join(folder_path, file_name)
             with open(file_path, 'w') as file:
                 json.dump([], file)  # Initialize with an empty list
+            self.push_tree_change(f"Add file '{file_name}'", lambda: os.remove(file_path),
+                                  lambda: self.restore_path(file_path, b"[]"))
 
         else:
             QMessageBox.warning(self, "Invalid File Name", "File name must end with '.json'.")
 
 
+    def selected_file_path(self):
+        """Return the path of the selected snippet file, or None if no file is selected."""
+        item = self.tree_widget.currentItem()
+        if item is None or not item.text(0).endswith(".json") or not os.path.isfile(self.item_path(item)):
+            return None
+        return self.item_path(item)
+
+    def item_path(self, item):
+        """Return the path of the folder or file a tree item stands for."""
+        names = []
+        while item.parent() is not None:
+            names.append(item.text(0))
+            item = item.parent()
+        return os.path.join(self.project_folder, *reversed(names))
+
+    def drop_snippets(self, target):
+        """Move the snippets dragged from the list into the file or folder they were dropped on."""
+        if self.snippet_manager:
+            self.snippet_manager.move_snippets_to(self.item_path(target))
+
+    def drop_files(self, items, target):
+        """Move snippet files dragged in the tree into the folder they were dropped on."""
+        folder = self.item_path(target)
+        if os.path.isfile(folder):
+            folder = os.path.dirname(folder)  # Dropped on a file: use the folder it is in
+        moves = []
+        for item in items:
+            source = self.item_path(item)
+            if os.path.isfile(source) and os.path.dirname(source) != folder:
+                moves.append((source, os.path.join(folder, os.path.basename(source))))
+        taken = [os.path.basename(target) for _, target in moves if os.path.exists(target)]
+        if taken:
+            QMessageBox.warning(self, "Error", f"'{os.path.basename(folder)}' already has {', '.join(taken)}.")
+            return
+        if moves and self.snippet_manager:
+            self.snippet_manager.start_transaction(f"Move {len(moves)} file(s)", {}, moves)
+
+    def import_snippets(self):
+        """Import snippets from a folder of source files or editor snippet files."""
+        source = QFileDialog.getExistingDirectory(self, "Import Snippets From")
+        if not source:
+            return
+
+        # Import into the selected file, or into a file of its own
+        target = self.selected_file_path() or os.path.join(self.project_folder, "Imported", "imported.json")
+
+        progress_dialog = QProgressDialog("Importing snippets...", None, 0, 0, self)
+        progress_dialog.setWindowTitle("Import")
+        progress_dialog.setMinimumDuration(0)
+
+        def update_progress(done, total):
+            progress_dialog.setMaximum(total)
+            progress_dialog.setValue(done)
+
+        def finished(result):
+            progress_dialog.close()
+            added, skipped, errors, written = result
+            self.refresh_tree()
+            if written and self.snippet_manager:
+                self.snippet_manager.files_changed(written)
+            message = f"Imported {added} snippet(s) into {os.path.relpath(target, self.project_folder)}."
+            if skipped:
+                message += f" Skipped {skipped} duplicate(s)."
+            if errors:
+                message += f" {len(errors)} file(s) could not be read."
+            QMessageBox.information(self, "Import", message)
+
+        def failed(error):
+            progress_dialog.close()
+            QMessageBox.warning(self, "Error", f"Import failed: {error}")
+
+        self.import_worker = Worker(importer.import_snippets, [source], target, parent=self)
+        self.import_worker.progress.connect(update_progress)
+        self.import_worker.result.connect(finished)
+        self.import_worker.error.connect(failed)
+        self.import_worker.start()
+
+    def find_duplicates(self):
+        """Look for duplicate snippets across the tree and open them for review."""
+        progress_dialog = QProgressDialog("Looking for duplicate snippets...", None, 0, 0, self)
+        progress_dialog.setWindowTitle("Find Duplicates")
+        progress_dialog.setMinimumDuration(0)
+
+        def update_progress(done, total):
+            progress_dialog.setMaximum(total)
+            progress_dialog.setValue(done)
+
+        def finished(clusters):
+            progress_dialog.close()
+            if not clusters:
+                QMessageBox.information(self, "Find Duplicates", "No duplicate snippets found.")
+                return
+            DuplicatesDialog(clusters, self.snippet_manager, self).exec()
+
+        def failed(error):
+            progress_dialog.close()
+            QMessageBox.warning(self, "Error", f"Looking for duplicates failed: {error}")
+
+        self.duplicates_worker = Worker(duplicates.find_duplicates, self.project_folder, parent=self)
+        self.duplicates_worker.progress.connect(update_progress)
+        self.duplicates_worker.result.connect(finished)
+        self.duplicates_worker.error.connect(failed)
+        self.duplicates_worker.start()
+
     def remove_selected(self):
-        """Remove the selected folder or file."""
+        """Move the selected folder or file to the trash; its space is reclaimed in the background."""
         current_item = self.tree_widget.currentItem()
         if not current_item:
             QMessageBox.warning(self, "No Selection", "Please select an item to remove.")
             return
+        if current_item.parent() is None:
+            QMessageBox.warning(self, "Error", "The snippets folder itself cannot be removed.")
+            return
 
-        parent_item = current_item.parent()
-        if parent_item:
-            index = parent_item.indexOfChild(current_item)
-            parent_item.takeChild(index)
-
-            # Remove the corresponding file from the project folder
-            file_path = os.path.join(self.project_folder, parent_item.text(0), current_item.text(0))
-            if os.path.exists(file_path):
+        path = self.item_path(current_item)
+        kind = "folder" if os.path.isdir(path) else "file"
+        if os.path.exists(path):
+            try:
+                with snippet_store.locked(path) if kind == "file" else contextlib.nullcontext():
+                    entry_id = trash.move_to_trash(self.project_folder, path)
+            except OSError as e:
+                QMessageBox.warning(self, "Error", f"Could not remove {kind}: {e}")
+                return
+            entry = [entry_id]  # Redoing trashes it again under a new entry
+
+            def redo():
+                entry[0] = trash.move_to_trash(self.project_folder, path)
+
+            self.push_tree_change(f"Delete {kind} '{current_item.text(0)}'",
+                                  lambda: trash.restore(self.project_folder, entry[0]), redo)
+            self.reclaim_trash()
+        current_item.parent().removeChild(current_item)
+        relative = os.path.relpath(path, self.project_folder).replace(os.sep, "/")
+        for key in [key for key in self.folder_items if key == relative or key.startswith(relative + "/")]:
+            del self.folder_items[key]
+        self.scan_stats()
+
+    def reclaim_trash(self, max_age=trash.KEEP_DAYS * 24 * 60 * 60, finished=None):
+        """Delete trash entries older than ``max_age`` seconds (all if None) in the background."""
+        if self.reclaim_worker is not None and self.reclaim_worker.isRunning():
+            return
+        self.reclaim_worker = Worker(trash.reclaim, self.project_folder, max_age, parent=self)
+        if finished:
+            self.reclaim_worker.finished.connect(finished)
+        self.reclaim_worker.start()
+
+    def show_trash(self):
+        """List deleted files and folders to restore them or empty the trash."""
+        TrashDialog(self, self).exec()
+
+    def restore_path(self, path, contents):
+        """Write a file back with the given bytes."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as file:
+            file.write(contents)
+
+    def push_tree_change(self, text, undo, redo, size=0):
+        """Make a change to the folder tree undoable, refreshing the tree after either step."""
+        def refreshed(action):
+            def run():
                 try:
-                    os.remove(file_path)
-                except OSError as e:
-                    QMessageBox.warning(self, "Error", f"Could not remove file: {e}")
-        else:
-            index = self.tree_widget.indexOfTopLevelItem(current_item)
-            self.tree_widget.takeTopLevelItem(index)
+                    action()
+                finally:
+                    self.refresh_tree()
+            return run
 
-            # Remove the corresponding folder from the project folder
-            folder_path = os.path.join(self.project_folder, current_item.text(0))
-            if os.path.exists(folder_path):
-                try:
-                    shutil.rmtree(folder_path)
-                except OSError as e:
-                    QMessageBox.warning(self, "Error", f"Could not remove folder: {e}")
+        self.snippet_manager.undo_stack.push(text, refreshed(undo), refreshed(redo), size)
 
 class SnippetManager(QMainWindow):
     def __init__(self):
@@ -405,11 +995,54 @@ class SnippetManager(QMainWindow):
         self.search_bar.textChanged.connect(self.filter_snippets)
         content_layout.addWidget(self.search_bar)
 
+        # Facet filters search the whole library instead of the open file
+        facet_layout = QHBoxLayout()
+        self.facet_filters = {}
+        for facet, label_text in (("tag", "All tags"), ("language", "All languages"), ("folder", "All folders")):
+            combo = QComboBox(self)
+            combo.addItem(label_text, None)
+            combo.currentIndexChanged.connect(self.apply_filters)
+            facet_layout.addWidget(combo)
+            self.facet_filters[facet] = combo
+        content_layout.addLayout(facet_layout)
+
         self.snippet_list = QListWidget()
+        self.snippet_list.setSelectionMode(QAbstractItemView.SelectionMode.ExtendedSelection)
+        # Snippets can be dragged onto files and folders in the sidebar
+        self.snippet_list.setDragEnabled(True)
+        self.snippet_list.setDragDropMode(QAbstractItemView.DragDropMode.DragOnly)
+        self.sidebar.tree_widget.snippet_source = self.snippet_list
         self.snippet_list.itemDoubleClicked.connect(self.edit_snippet)
+        self.snippet_list.currentItemChanged.connect(self.show_related)
+        # Big files are shown a page at a time, fetched as the list is scrolled
+        self.snippet_list.setUniformItemSizes(True)
+        self.snippet_list.verticalScrollBar().valueChanged.connect(self.on_list_scrolled)
         content_layout.addWidget(self.snippet_list)
 
+        # Snippets similar to the selected one anywhere in the library; needs NumPy
+        self.related_label = QLabel("Related snippets:")
+        self.related_label.setStyleSheet("color: #D8DEE9;")
+        content_layout.addWidget(self.related_label)
+        self.related_list = QListWidget()
+        self.related_list.setMaximumHeight(120)
+        self.related_list.itemDoubleClicked.connect(
+            lambda item: self.copy_to_clipboard(item.data(Qt.ItemDataRole.UserRole)))
+        content_layout.addWidget(self.related_list)
+        self.related_label.setVisible(related.available())
+        self.related_list.setVisible(related.available())
+
         self.current_file = None  # Track the currently loaded JSON file
+        self.library = None  # Index over every snippet file, loaded in the background
+        self.library_worker = None
+        self.showing_library = False  # True while facet filters replace the file view
+        self.loaded_snippets = []  # Snippets as they were on disk when the file was loaded
+        self.current_version = None  # Version of the file the list is based on
+        self.paged_file = None  # PagedFile of the open file when it is too big to show at once
+        self.paged_first = self.paged_last = 0  # Pages of it in the list, last one excluded
+        self.related_index = None  # TF-IDF index for related snippets, built after the library
+        self.related_build_worker = None
+        self.related_merge_worker = None
+        self.related_pending = {}  # Path -> snippets written while the index was being built
 
         button_layout = QHBoxLayout()
         button_layout.setContentsMargins(0, 0, 0, 0)
@@ -438,6 +1071,32 @@ class SnippetManager(QMainWindow):
         self.copy_button.setShortcut(QKeySequence("Ctrl+C"))  # Keyboard shortcut
         button_layout.addWidget(self.copy_button)
 
+        self.record_clipboard_button = QPushButton("Record Clipboard")
+        self.record_clipboard_button.setCheckable(True)
+        self.record_clipboard_button.setToolTip("Also keep text copied in other applications in the history")
+        button_layout.addWidget(self.record_clipboard_button)
+
+        self.most_used_button = QPushButton("Most Used")
+        self.most_used_button.setCheckable(True)
+        self.most_used_button.toggled.connect(self.apply_filters)
+        button_layout.addWidget(self.most_used_button)
+
+        # Operations on every selected snippet at once
+        self.selection_button = QPushButton("Selected")
+        selection_menu = QMenu(self.selection_button)
+        selection_menu.addAction("Move to File...", self.move_selected)
+        selection_menu.addAction("Copy to File...", self.copy_selected)
+        selection_menu.addAction("Tag...", self.tag_selected)
+        selection_menu.addAction("Export...", self.export_selected)
+        selection_menu.addAction("Delete", self.delete_snippet)
+        self.selection_button.setMenu(selection_menu)
+        button_layout.addWidget(self.selection_button)
+
+        self.history_button = QPushButton("History")
+        self.history_button.setToolTip("Earlier versions of the selected snippet")
+        self.history_button.clicked.connect(self.show_history)
+        button_layout.addWidget(self.history_button)
+
         self.load_button = QPushButton("Load Snippets")
         self.load_button.setIcon(QIcon("assets/load_icon.png"))
         self.load_button.clicked.connect(self.load_snippets)
@@ -461,33 +1120,439 @@ class SnippetManager(QMainWindow):
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
 
+        # Undo covers snippet and folder tree changes; earlier snippet versions are kept on disk
+        self.undo_stack = UndoStack()
+        self.version_history = VersionHistory(self.sidebar.project_folder)
+        self.transaction_worker = None
+        QShortcut(QKeySequence.StandardKey.Undo, self, self.undo)
+        QShortcut(QKeySequence.StandardKey.Redo, self, self.redo)
+
+        # Usage and clipboard history are kept in memory and written in the background now and then
+        self.usage = UsageTracker(self.sidebar.project_folder)
+        self.clipboard_history = ClipboardHistory(self.sidebar.project_folder)
+        self.last_copied_text = None
+        QApplication.clipboard().dataChanged.connect(self.on_clipboard_changed)
+        self.state_worker = None
+        self.state_timer = QTimer(self)
+        self.state_timer.timeout.connect(self.save_state_in_background)
+        self.state_timer.start(30 * 1000)
+
+        # Built now and kept hidden so it pops up instantly when asked for
+        self.quick_picker = QuickPicker()
+        self.quick_picker.snippet_chosen.connect(self.copy_to_clipboard)
+
+        # Classify new and changed snippets in the background once the window is up
+        self.detection_worker = None
+        self.detection_pending = set()  # Files written while detection was running
+        QTimer.singleShot(0, self.start_language_detection)
+
     def load_snippets(self):
         """Open a file dialog to select a JSON file and load snippets."""
         file_name, _ = QFileDialog.getOpenFileName(self, "Open Snippet File", "", "JSON Files (*.json)")
         if file_name:
-            self.current_file = file_name
-            try:
-                with open(self.current_file, "r") as file:
-                    snippets = json.load(file)
-                    self.snippet_list.clear()
-                    self.snippet_list.addItems([f"{item['title']}: {item['snippet']}" for item in snippets])
-            except (FileNotFoundError, json.JSONDecodeError):
-                self.snippet_list.clear()
-                QMessageBox.warning(self, "Error", "Failed to load snippets from the selected file.")
+            self.open_snippet_file(file_name)
+
+    def open_snippet_file(self, file_name):
+        """Load snippets from the given JSON file into the list."""
+        try:
+            if os.path.getsize(file_name) >= paged_file.PAGED_MIN_BYTES:
+                self.open_paged(file_name)
+                return
+            snippets, version = snippet_store.read_snippets(file_name)
+        except (OSError, ValueError):
+            self.snippet_list.clear()
+            QMessageBox.warning(self, "Error", "Failed to load snippets from the selected file.")
+            return
+        self.handle_loaded_json(snippets, file_name, version)
+
+    def open_paged(self, file_name):
+        """Show the first page of a big file; later pages are read as the list is scrolled to them."""
+        paged = paged_file.PagedFile(file_name)
+        self.handle_loaded_json([], file_name)
+        self.paged_file = paged
+        self.paged_first = self.paged_last = 0
+        self.add_page(append=True)
+        self.status_bar.showMessage(
+            f"{paged.count} snippets; showing them {paged_file.PAGE_SIZE} at a time as you scroll.", 4000)
+
+    def add_page(self, append):
+        """Read the page after or before the ones in the list, dropping a page at the other end
+        once more than RESIDENT_PAGES are in it.
+
+        The item at the top of the view stays there, so scrolling goes on smoothly.
+        """
+        anchor = self.snippet_list.itemAt(0, 0)
+        number = self.paged_last if append else self.paged_first - 1
+        row = self.snippet_list.count() if append else 0
+        text = self.search_bar.text().lower()
+        for snippet in self.paged_file.page(number):
+            item = self.make_snippet_item(snippet, self.paged_file.path)
+            self.snippet_list.insertItem(row, item)
+            item.setHidden(text not in item.text().lower())  # Only takes effect once the item is in the list
+            row += 1
+        if append:
+            self.paged_last += 1
+        else:
+            self.paged_first -= 1
+
+        if self.paged_last - self.paged_first > paged_file.RESIDENT_PAGES:
+            # Pages are full except the last page of the file, which is only ever dropped from the end
+            extra = self.snippet_list.count() - paged_file.RESIDENT_PAGES * paged_file.PAGE_SIZE
+            for _ in range(paged_file.PAGE_SIZE if append else extra):
+                self.snippet_list.takeItem(0 if append else self.snippet_list.count() - 1)
+            if append:
+                self.paged_first += 1
+            else:
+                self.paged_last -= 1
+        if anchor is not None and self.snippet_list.row(anchor) >= 0:
+            self.snippet_list.scrollToItem(anchor, QAbstractItemView.ScrollHint.PositionAtTop)
+
+    def on_list_scrolled(self, value):
+        """Fetch the next or previous page of a paged file when the list is scrolled near its end."""
+        if self.paged_file is None or self.showing_library:
+            return
+        bar = self.snippet_list.verticalScrollBar()
+        margin = bar.pageStep()
+        try:
+            if value >= bar.maximum() - margin and self.paged_last < self.paged_file.page_count():
+                self.add_page(append=True)
+            elif value <= bar.minimum() + margin and self.paged_first > 0:
+                self.add_page(append=False)
+        except (OSError, ValueError) as e:
+            # Paging goes on; the next scroll tries again
+            self.status_bar.showMessage(f"Could not read more snippets: {e}", 4000)
 
     def save_snippets(self):
-        """Open a file dialog to save snippets to a JSON file."""
+        """Save the snippets to the current file, merging changes made by other instances.
+
+        Returns True if they were saved.
+        """
+        if self.paged_file is not None:
+            return True  # Each change to a paged file is written on its own
         if not self.current_file:
             file_name, _ = QFileDialog.getSaveFileName(self, "Save Snippet File", "", "JSON Files (*.json)")
             if file_name:
                 self.current_file = file_name
 
         if self.current_file:
-            snippets = [{"title": self.snippet_list.item(i).text().split(":")[0].strip(), 
-                        "snippet": self.snippet_list.item(i).text().split(":")[1].strip()} for i in range(self.snippet_list.count())]
-            with open(self.current_file, "w") as file:
-                json.dump(snippets, file, indent=4)
-            self.status_bar.showMessage("Snippets saved successfully.", 2000)
+            snippets = [self.snippet_list.item(i).data(Qt.ItemDataRole.UserRole)
+                        for i in range(self.snippet_list.count())]
+            try:
+                merged, version, conflicts = snippet_store.save_snippets(
+                    self.current_file, snippets, self.loaded_snippets, self.current_version)
+            except (OSError, ValueError) as e:
+                QMessageBox.warning(self, "Error", f"Failed to save snippets: {e}")
+                return False
+
+            if merged != snippets:
+                self.apply_merged_snippets(merged)
+            self.loaded_snippets = copy.deepcopy(merged)
+            self.current_version = version
+            self.library_changed(self.current_file, copy.deepcopy(merged))
+
+            if conflicts:
+                self.status_bar.showMessage(
+                    f"Snippets saved. {conflicts} snippet(s) were also changed elsewhere; kept this version.", 4000)
+            else:
+                self.status_bar.showMessage("Snippets saved successfully.", 2000)
+            return True
+        return False
+
+    def start_language_detection(self, paths=None):
+        """Detect the language of snippets that are new or changed since the last run.
+
+        Looks at every file of the tree, or only at ``paths`` if given.
+        """
+        if self.detection_worker is not None and self.detection_worker.isRunning():
+            return
+        if paths is None:
+            self.detection_worker = Worker(language_detect.detect_tree, self.sidebar.project_folder, parent=self)
+            self.detection_worker.result.connect(self.on_languages_detected)
+        else:
+            self.detection_worker = Worker(language_detect.detect_files, paths, parent=self)
+            self.detection_worker.result.connect(self.on_files_detected)
+        self.detection_worker.start()
+
+    def on_languages_detected(self, written):
+        """Pick up detection results for the file that is open, then index the library."""
+        if written:
+            self.reload_current_file()
+        self.start_library_load()
+        self.detect_pending()
+
+    def on_files_detected(self, written):
+        """Pick up detection results for files written since the app started."""
+        self.files_changed(written)
+        self.detect_pending()
+
+    def detect_pending(self):
+        """Detect languages in the files written while detection was running."""
+        if self.detection_pending:
+            paths = sorted(self.detection_pending)
+            self.detection_pending = set()
+            self.start_language_detection(paths)
+
+    def start_library_load(self):
+        """Index the whole snippet library in the background."""
+        if self.library_worker is not None and self.library_worker.isRunning():
+            return
+        self.library_worker = Worker(lambda root, progress: SnippetLibrary(root).load(progress),
+                                     self.sidebar.project_folder, parent=self)
+        self.library_worker.result.connect(self.on_library_loaded)
+        self.library_worker.start()
+
+    def on_library_loaded(self, library):
+        """Start using a freshly built library index."""
+        self.library = library
+        self.library.set_file(self.clipboard_history.path, self.clipboard_history.as_snippets(), HISTORY_FOLDER)
+        self.quick_picker.set_index(library, self.usage)
+        self.update_facet_filters()
+        self.apply_filters()
+        self.start_related_build()
+
+    def start_related_build(self):
+        """Build the related snippets index from the library in the background."""
+        if not related.available() or self.library is None:
+            return
+        if self.related_build_worker is not None and self.related_build_worker.isRunning():
+            return
+        # Hand the worker a snapshot; the library keeps changing on this thread
+        history_path = os.path.abspath(self.clipboard_history.path)
+        files = [(path, [self.library.record(record_id)[1] for record_id in ids], self.library.file_stats.get(path))
+                 for path, ids in self.library.by_file.items() if path != history_path]
+        self.related_pending = {}
+        self.related_build_worker = Worker(related.build_related, files, root=self.sidebar.project_folder,
+                                           parent=self)
+        self.related_build_worker.result.connect(self.on_related_built)
+        self.related_build_worker.start()
+
+    def on_related_built(self, index):
+        """Start using a freshly built related snippets index."""
+        for path, snippets in self.related_pending.items():
+            index.set_file(path, snippets)
+        self.related_pending = {}
+        self.related_index = index
+        self.show_related(self.snippet_list.currentItem())
+
+    def update_related(self, path, snippets):
+        """Re-index the changed snippets of a file for related snippets."""
+        if self.related_build_worker is not None and self.related_build_worker.isRunning():
+            self.related_pending[os.path.abspath(path)] = snippets
+            return
+        if self.related_index is None:
+            return
+        self.related_index.set_file(os.path.abspath(path), snippets)
+        if self.related_index.needs_merge() and not (
+                self.related_merge_worker is not None and self.related_merge_worker.isRunning()):
+            # Fold the new rows into the postings without blocking the window
+            self.related_merge_worker = Worker(self.related_index.merged_base, parent=self)
+            self.related_merge_worker.result.connect(self.related_index.install)
+            self.related_merge_worker.start()
+
+    def show_related(self, current, previous=None):
+        """List the snippets most similar to the selected one."""
+        self.related_list.clear()
+        if self.related_index is None or current is None or self.library is None:
+            return
+        for snippet_id, similarity in self.related_index.related(current.data(Qt.ItemDataRole.UserRole), 8):
+            record_id = self.library.find(snippet_id)
+            if record_id is None:
+                continue
+            path, snippet = self.library.record(record_id)
+            item = self.make_snippet_item(snippet, path)
+            item.setText(f"{snippet['title']} ({similarity:.0%})")
+            self.related_list.addItem(item)
+
+    def library_changed(self, path, snippets):
+        """Keep the library index and tree stats in step with a file that was just written."""
+        self.sidebar.file_changed(path, len(snippets))
+        if any(language_detect.needs_detection(snippet) for snippet in snippets):
+            self.detection_pending.add(path)
+            if self.detection_worker is None or not self.detection_worker.isRunning():
+                self.detect_pending()
+        if self.library is not None:
+            self.library.set_file(path, snippets)
+            self.quick_picker.set_index(self.library, self.usage)
+            self.update_facet_filters()
+            self.update_related(path, snippets)
+
+    def files_changed(self, changed):
+        """Pick up snippet files written outside the list, given as {path: snippets}."""
+        for path, snippets in changed.items():
+            self.library_changed(path, snippets)
+        if self.showing_library:
+            self.apply_filters()
+        elif self.current_file and os.path.abspath(self.current_file) in map(os.path.abspath, changed):
+            self.reload_current_file()
+
+    def history_changed(self):
+        """Re-index the clipboard history after it changed."""
+        if self.library is not None:
+            self.library.set_file(self.clipboard_history.path, self.clipboard_history.as_snippets(), HISTORY_FOLDER)
+            self.quick_picker.set_index(self.library, self.usage)
+            self.update_facet_filters()
+
+    def on_clipboard_changed(self):
+        """Keep text copied in other applications when recording is on."""
+        if not self.record_clipboard_button.isChecked():
+            return
+        text = QApplication.clipboard().text()
+        if text and text != self.last_copied_text and self.clipboard_history.add(text, source="system"):
+            self.history_changed()
+
+    def update_facet_filters(self):
+        """Refill the facet filters with the values in the library, keeping the selection."""
+        for facet, combo in self.facet_filters.items():
+            selected = combo.currentData()
+            combo.blockSignals(True)
+            while combo.count() > 1:
+                combo.removeItem(1)
+            for value, count in self.library.facet_values(facet):
+                combo.addItem(f"{value or 'Snippets'} ({count})", value)
+            index = combo.findData(selected)
+            combo.setCurrentIndex(index if index >= 0 else 0)
+            combo.blockSignals(False)
+
+    def selected_facets(self):
+        """Return the selected facet values, leaving out facets set to 'All'."""
+        return {facet: combo.currentData() for facet, combo in self.facet_filters.items()
+                if combo.currentData() is not None}
+
+    def apply_filters(self):
+        """Show library-wide facet results, or filter the open file by text."""
+        text = self.search_bar.text()
+        facets = self.selected_facets()
+        if self.most_used_button.isChecked() and self.library is not None:
+            self.showing_library = True
+            self.paged_file = None
+            self.snippet_list.clear()
+            for snippet_id in self.usage.most_used():
+                record_id = self.library.find(snippet_id)
+                if record_id is None:
+                    continue
+                path, snippet = self.library.record(record_id)
+                if text.lower() in f"{snippet['title']}: {snippet['snippet']}".lower():
+                    self.snippet_list.addItem(self.make_snippet_item(snippet, path))
+            return
+
+        if facets and self.library is not None:
+            self.showing_library = True
+            self.paged_file = None
+            self.snippet_list.clear()
+            # Matches are equally good, so the most used ones go first
+            now = time.time()
+            results = [self.library.record(record_id) for record_id in self.library.search(text, **facets)]
+            results.sort(key=lambda result: self.usage.frecency(result[1]["id"], now), reverse=True)
+            for path, snippet in results:
+                self.snippet_list.addItem(self.make_snippet_item(snippet, path))
+            self.status_bar.showMessage(f"{self.snippet_list.count()} matching snippet(s) in the library.", 2000)
+            return
+
+        if self.showing_library:
+            # Back from the library view to the open file
+            self.showing_library = False
+            self.snippet_list.clear()
+            if self.current_file and os.path.isfile(self.current_file):
+                self.open_snippet_file(self.current_file)
+        for i in range(self.snippet_list.count()):
+            item = self.snippet_list.item(i)
+            item.setHidden(text.lower() not in item.text().lower())
+
+    def store_item_change(self, item, deleted=False):
+        """Write the change to one snippet item to its file.
+
+        Returns the path written, or None if nothing was written to a snippet file.
+        """
+        path = item.data(FILE_ROLE)
+        if path is not None and path == os.path.abspath(self.clipboard_history.path):
+            if deleted:
+                self.clipboard_history.remove(item.data(Qt.ItemDataRole.UserRole)["id"])
+                self.history_changed()
+            return None
+        if not self.showing_library and self.paged_file is None:
+            return self.current_file if self.save_snippets() else None
+        snippet = item.data(Qt.ItemDataRole.UserRole)
+        try:
+            if deleted:
+                snippets, _ = snippet_store.update_snippets(path, deletes=[snippet["id"]])
+            else:
+                snippets, _ = snippet_store.update_snippets(path, upserts=[snippet])
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Error", f"Failed to save snippets: {e}")
+            return None
+        self.library_changed(path, snippets)
+        if self.paged_file is not None:
+            self.reload_pages()  # Keep the list lined up with the pages of the file
+        self.status_bar.showMessage(f"Saved to {os.path.relpath(path, self.sidebar.project_folder)}.", 2000)
+        return path
+
+    def reload_current_file(self):
+        """Refresh the list from disk, updating only the snippets that changed."""
+        if not self.current_file or not os.path.isfile(self.current_file):
+            return
+        if self.paged_file is not None:
+            self.reload_pages()
+            return
+        try:
+            snippets, version = snippet_store.read_snippets(self.current_file)
+        except (OSError, ValueError):
+            return
+        self.apply_merged_snippets(snippets)
+        self.loaded_snippets = copy.deepcopy(snippets)
+        self.current_version = version
+
+    def reload_pages(self):
+        """Refresh the pages of a paged file in the list; the file may have moved or changed length."""
+        try:
+            if os.path.abspath(self.paged_file.path) != os.path.abspath(self.current_file):
+                self.paged_file = paged_file.PagedFile(self.current_file)
+            elif self.paged_file.changed():
+                self.paged_file.reindex()
+            self.paged_last = max(1, min(self.paged_last, self.paged_file.page_count()))
+            self.paged_first = max(0, min(self.paged_first, self.paged_last - 1))
+            snippets = []
+            for number in range(self.paged_first, self.paged_last):
+                snippets.extend(self.paged_file.page(number))
+        except (OSError, ValueError):
+            return
+        self.apply_merged_snippets(snippets, self.paged_file.path)
+
+    def make_snippet_item(self, snippet, path=None):
+        """Create a list item showing a snippet and carrying its data."""
+        item = QListWidgetItem(f"{snippet['title']}: {snippet['snippet']}")
+        item.setData(Qt.ItemDataRole.UserRole, snippet)
+        if path is not None:
+            item.setData(FILE_ROLE, path)
+            item.setToolTip(os.path.relpath(path, self.sidebar.project_folder))
+        return item
+
+    def apply_merged_snippets(self, merged, path=None):
+        """Update the list to match merged snippets, touching only the rows that changed.
+
+        Rows added or changed are hidden if they do not match the search text, like the rest.
+        """
+        text = self.search_bar.text().lower()
+        merged_by_id = {snippet["id"]: snippet for snippet in merged}
+        for row in reversed(range(self.snippet_list.count())):
+            snippet = self.snippet_list.item(row).data(Qt.ItemDataRole.UserRole)
+            if snippet["id"] not in merged_by_id:
+                self.snippet_list.takeItem(row)
+
+        rows_by_id = {self.snippet_list.item(row).data(Qt.ItemDataRole.UserRole)["id"]: row
+                      for row in range(self.snippet_list.count())}
+        for position, snippet in enumerate(merged):
+            row = rows_by_id.get(snippet["id"])
+            if row is None:
+                item = self.make_snippet_item(snippet, path)
+                self.snippet_list.insertItem(position, item)
+                item.setHidden(text not in item.text().lower())
+                rows_by_id = {key: value + 1 if value >= position else value
+                              for key, value in rows_by_id.items()}
+            elif self.snippet_list.item(row).data(Qt.ItemDataRole.UserRole) != snippet:
+                item = self.snippet_list.item(row)
+                item.setText(f"{snippet['title']}: {snippet['snippet']}")
+                item.setData(Qt.ItemDataRole.UserRole, snippet)
+                item.setHidden(text not in item.text().lower())
 
     # Other methods (add_snippet, edit_snippet, delete_snippet, copy_snippet, etc.) remain unchanged
 
@@ -497,50 +1562,400 @@ class SnippetManager(QMainWindow):
         if dialog.exec():
             title, snippet = dialog.get_snippet()
             if title and snippet:
-                self.snippet_list.addItem(f"{title}: {snippet}")
-                self.save_snippets()
+                snippet = {"id": snippet_store.new_snippet_id(), "title": title, "snippet": snippet}
+                if dialog.get_language():
+                    snippet["language"] = dialog.get_language()
+                if dialog.get_tags():
+                    snippet["tags"] = dialog.get_tags()
+                if self.showing_library or self.paged_file is not None:
+                    if not self.current_file:
+                        QMessageBox.warning(self, "No File", "Open a snippet file to add snippets to.")
+                        return
+                    item = self.make_snippet_item(snippet, self.current_file)
+                else:
+                    item = self.make_snippet_item(snippet)
+                self.snippet_list.addItem(item)
+                path = self.store_item_change(item)
+                if path:
+                    self.push_snippet_change(f"Add '{title}'", path, None, snippet)
                 self.status_bar.showMessage("Snippet added successfully.", 2000)
 
     def edit_snippet(self):
         """Open dialog to edit the selected snippet."""
         selected_item = self.snippet_list.currentItem()
         if selected_item:
+            if selected_item.data(FILE_ROLE) == os.path.abspath(self.clipboard_history.path):
+                QMessageBox.information(self, "Clipboard History", "Clipboard history entries can't be edited.")
+                return
             dialog = AddSnippetDialog(self)
-            title, snippet = selected_item.text().split(":", 1)
-            dialog.title_edit.setText(title.strip())
-            dialog.text_edit.setPlainText(snippet.strip())
+            snippet = selected_item.data(Qt.ItemDataRole.UserRole)
+            dialog.title_edit.setText(snippet["title"])
+            dialog.set_language(snippet.get("language") or snippet.get("detected_language"))
+            dialog.set_tags(snippet.get("tags", []))
+            dialog.text_edit.setPlainText(snippet["snippet"])
             if dialog.exec():
                 new_title, new_snippet = dialog.get_snippet()
                 if new_title and new_snippet:
+                    language = dialog.get_language()
+                    # Only store a language the user picked, not one that was detected
+                    chosen = "language" in snippet or language != snippet.get("detected_language")
+                    old_snippet = snippet
+                    snippet = dict(snippet, title=new_title, snippet=new_snippet)
+                    snippet.pop("language", None)
+                    if language and chosen:
+                        snippet["language"] = language
+                    snippet.pop("tags", None)
+                    if dialog.get_tags():
+                        snippet["tags"] = dialog.get_tags()
                     selected_item.setText(f"{new_title}: {new_snippet}")
-                    self.save_snippets()
+                    selected_item.setData(Qt.ItemDataRole.UserRole, snippet)
+                    path = self.store_item_change(selected_item)
+                    if path:
+                        self.push_snippet_change(f"Edit '{new_title}'", path, old_snippet, snippet)
                     self.status_bar.showMessage("Snippet edited successfully.", 2000)
         else:
             QMessageBox.warning(self, "No Selection", "Please select a snippet to edit.")
 
     def delete_snippet(self):
-        """Delete the selected snippet."""
-        selected_item = self.snippet_list.currentItem()
-        if selected_item:
-            self.snippet_list.takeItem(self.snippet_list.row(selected_item))
-            self.save_snippets()
-            self.status_bar.showMessage("Snippet deleted successfully.", 2000)
-        else:
+        """Delete the selected snippets, writing each affected file once."""
+        items = self.selected_snippet_items()
+        if not items:
             QMessageBox.warning(self, "No Selection", "Please select a snippet to delete.")
+            return
+        history_path = os.path.abspath(self.clipboard_history.path)
+        changes = {}
+        history_removed = False
+        for item in items:
+            snippet = item.data(Qt.ItemDataRole.UserRole)
+            if item.data(FILE_ROLE) == history_path:
+                history_removed = self.clipboard_history.remove(snippet["id"]) or history_removed
+            elif self.item_path(item):
+                changes.setdefault(self.item_path(item), []).append((snippet, None))
+            self.snippet_list.takeItem(self.snippet_list.row(item))
+        if history_removed:
+            self.history_changed()
+        if changes:
+            title = items[0].data(Qt.ItemDataRole.UserRole)["title"]
+            self.run_batch(f"Delete '{title}'" if len(items) == 1 else f"Delete {len(items)} snippets", changes)
+        self.status_bar.showMessage(f"{len(items)} snippet(s) deleted.", 2000)
+
+    def selected_snippet_items(self):
+        """Return the selected items, or the current one if none is selected."""
+        items = self.snippet_list.selectedItems()
+        if not items and self.snippet_list.currentItem() is not None:
+            items = [self.snippet_list.currentItem()]
+        return items
+
+    def item_path(self, item):
+        """Return the file a snippet item belongs to, or None if it was never saved."""
+        return item.data(FILE_ROLE) or self.current_file
+
+    def selected_file_snippets(self, action):
+        """Return [(path, snippet)] of the selected snippets stored in snippet files.
+
+        Warns and returns [] if there are none. Clipboard history entries are left out.
+        """
+        history_path = os.path.abspath(self.clipboard_history.path)
+        selected = [(self.item_path(item), item.data(Qt.ItemDataRole.UserRole))
+                    for item in self.selected_snippet_items()]
+        selected = [(path, snippet) for path, snippet in selected if path and path != history_path]
+        if not selected:
+            QMessageBox.warning(self, "No Selection", f"Please select saved snippets to {action}.")
+        return selected
+
+    def choose_target_file(self, title):
+        """Ask for a snippet file to put snippets in; it may be a new one."""
+        file_name, _ = QFileDialog.getSaveFileName(
+            self, title, self.sidebar.project_folder, "JSON Files (*.json)",
+            options=QFileDialog.Option.DontConfirmOverwrite)
+        if file_name and not file_name.endswith(".json"):
+            file_name += ".json"
+        return os.path.abspath(file_name) if file_name else None
+
+    def run_batch(self, text, changes):
+        """Write a batch of snippet changes, one write per file, and make it undoable."""
+        try:
+            self.write_changes(changes)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Error", f"Failed to save snippets: {e}")
+            return False
+        self.push_changes(text, changes)
+        return True
+
+    def move_selected(self):
+        """Move the selected snippets into another file."""
+        selected = self.selected_file_snippets("move")
+        target = self.choose_target_file("Move Snippets to File") if selected else None
+        if not target:
+            return
+        changes = {}
+        for path, snippet in selected:
+            if os.path.abspath(path) != target:
+                changes.setdefault(path, []).append((snippet, None))
+                changes.setdefault(target, []).append((None, snippet))
+        if changes and self.run_batch(f"Move {len(changes[target])} snippet(s)", changes):
+            self.sidebar.refresh_tree()
+            self.status_bar.showMessage(f"Moved {len(changes[target])} snippet(s) to {os.path.basename(target)}.", 2000)
+
+    def copy_selected(self):
+        """Copy the selected snippets into another file."""
+        selected = self.selected_file_snippets("copy")
+        target = self.choose_target_file("Copy Snippets to File") if selected else None
+        if not target:
+            return
+        copies = [(None, dict(snippet, id=snippet_store.new_snippet_id())) for _, snippet in selected]
+        if self.run_batch(f"Copy {len(copies)} snippet(s)", {target: copies}):
+            self.sidebar.refresh_tree()
+            self.status_bar.showMessage(f"Copied {len(copies)} snippet(s) to {os.path.basename(target)}.", 2000)
+
+    def tag_selected(self):
+        """Add tags to, or with a leading '-' remove tags from, the selected snippets."""
+        selected = self.selected_file_snippets("tag")
+        if not selected:
+            return
+        text, ok = QInputDialog.getText(self, "Tag Snippets",
+                                        "Tags to add, separated by commas (prefix with - to remove):")
+        if not ok:
+            return
+        tags = [tag.strip() for tag in text.split(",") if tag.strip()]
+        added = [tag for tag in tags if not tag.startswith("-")]
+        removed = {tag[1:].strip() for tag in tags if tag.startswith("-")}
+        changes = {}
+        for path, snippet in selected:
+            old_tags = snippet.get("tags", [])
+            new_tags = [tag for tag in dict.fromkeys(old_tags + added) if tag not in removed]
+            if new_tags != old_tags:
+                updated = dict(snippet, tags=new_tags)
+                if not new_tags:
+                    del updated["tags"]
+                changes.setdefault(path, []).append((snippet, updated))
+        count = sum(len(pairs) for pairs in changes.values())
+        if changes and self.run_batch(f"Tag {count} snippet(s)", changes):
+            self.status_bar.showMessage(f"Tagged {count} snippet(s).", 2000)
+
+    def export_selected(self):
+        """Export the selected snippets to an editor snippet format."""
+        selected = [item.data(Qt.ItemDataRole.UserRole) for item in self.selected_snippet_items()]
+        if not selected:
+            QMessageBox.warning(self, "No Selection", "Please select snippets to export.")
+            return
+        export_format, ok = QInputDialog.getItem(self, "Export Snippets", "Format:", exporter.FORMATS, 0, False)
+        if not ok:
+            return
+        output = QFileDialog.getExistingDirectory(self, "Export Snippets To")
+        if not output:
+            return
+        try:
+            count = exporter.export_list(selected, output, export_format)
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Error", f"Export failed: {e}")
+            return
+        self.status_bar.showMessage(f"Exported {count} snippet(s) to {output}.", 2000)
+
+    def push_snippet_change(self, text, path, before, after):
+        """Make a change to one snippet that was just written undoable."""
+        self.push_changes(text, {path: [(before, after)]})
+
+    def push_changes(self, text, changes, moves=()):
+        """Make snippet changes and file moves that were just written undoable and keep their versions.
+
+        ``changes`` maps a path to (before, after) pairs of snippets; before
+        is None for an added snippet and after is None for a deleted one.
+        ``moves`` is a list of (source, target) file paths.
+        """
+        changes = {path: [(copy.deepcopy(before), copy.deepcopy(after)) for before, after in pairs]
+                   for path, pairs in changes.items()}
+        reverse = {path: [(after, before) for before, after in pairs] for path, pairs in changes.items()}
+        moves = list(moves)
+        reverse_moves = [(target, source) for source, target in reversed(moves)]
+        size = 0
+        for pairs in changes.values():
+            for snippet in (snippet for pair in pairs for snippet in pair if snippet is not None):
+                self.version_history.record(snippet)
+                size += len(snippet["title"]) + len(snippet["snippet"])
+        self.undo_stack.push(text, lambda: self.write_changes(reverse, reverse_moves),
+                             lambda: self.write_changes(changes, moves), size)
+
+    def transaction_updates(self, changes):
+        """Turn (before, after) snippet pairs into the (upserts, deletes) of each file."""
+        updates = {}
+        for path, pairs in changes.items():
+            upserts = [copy.deepcopy(after) for _, after in pairs if after is not None]
+            deletes = [before["id"] for before, after in pairs if after is None]
+            updates[path] = (upserts, deletes)
+            for snippet in upserts:
+                self.version_history.record(snippet)
+        return updates
+
+    def write_changes(self, changes, moves=()):
+        """Write (before, after) snippet pairs and file moves as one transaction."""
+        written = snippet_store.apply_transaction(self.sidebar.project_folder, self.transaction_updates(changes),
+                                                  moves)
+        self.transaction_done(written, moves)
+
+    def transaction_done(self, written, moves):
+        """Pick up the files a transaction wrote and moved."""
+        changed = {}
+        for source, target in moves:
+            changed[source] = []
+            changed[target], _ = snippet_store.read_snippets(target)
+            if self.current_file and os.path.abspath(self.current_file) == os.path.abspath(source):
+                self.current_file = target
+        changed.update(written)
+        self.files_changed(changed)
+        if moves:
+            self.sidebar.refresh_tree()
+
+    def start_transaction(self, text, changes, moves=()):
+        """Write snippet changes and file moves as one transaction in the background, then make them undoable."""
+        if self.transaction_worker is not None and self.transaction_worker.isRunning():
+            self.status_bar.showMessage("Still moving the last snippets, try again in a moment.", 2000)
+            return
+        updates = self.transaction_updates(changes)
+
+        def finished(written):
+            self.transaction_done(written, moves)
+            self.push_changes(text, changes, moves)
+            if not moves:
+                self.sidebar.refresh_tree()  # Snippets may have gone into a new file
+            self.status_bar.showMessage(f"{text}: done.", 2000)
+
+        def failed(error):
+            QMessageBox.warning(self, "Error", f"{text} failed: {error}")
+
+        self.status_bar.showMessage(f"{text}...")
+        self.transaction_worker = Worker(snippet_store.apply_transaction, self.sidebar.project_folder, updates,
+                                         moves, parent=self)
+        self.transaction_worker.result.connect(finished)
+        self.transaction_worker.error.connect(failed)
+        self.transaction_worker.start()
+
+    def move_snippets_to(self, target):
+        """Move the selected snippets into a snippet file, or into a folder under the file names they had."""
+        changes = {}
+        count = 0
+        for path, snippet in self.selected_file_snippets("move"):
+            destination = target if os.path.isfile(target) else os.path.join(target, os.path.basename(path))
+            if os.path.abspath(path) != os.path.abspath(destination):
+                changes.setdefault(path, []).append((snippet, None))
+                changes.setdefault(destination, []).append((None, snippet))
+                count += 1
+        if changes:
+            self.start_transaction(f"Move {count} snippet(s)", changes)
+
+    def undo(self):
+        """Undo the last snippet or folder change."""
+        if not self.undo_stack.can_undo():
+            self.status_bar.showMessage("Nothing to undo.", 2000)
+            return
+        try:
+            text = self.undo_stack.undo()
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Error", f"Could not undo: {e}")
+            return
+        self.status_bar.showMessage(f"Undone: {text}", 2000)
+
+    def redo(self):
+        """Redo the last undone change."""
+        if not self.undo_stack.can_redo():
+            self.status_bar.showMessage("Nothing to redo.", 2000)
+            return
+        try:
+            text = self.undo_stack.redo()
+        except (OSError, ValueError) as e:
+            QMessageBox.warning(self, "Error", f"Could not redo: {e}")
+            return
+        self.status_bar.showMessage(f"Redone: {text}", 2000)
+
+    def show_history(self):
+        """Show earlier versions of the selected snippet and restore one."""
+        selected_item = self.snippet_list.currentItem()
+        if selected_item is None:
+            QMessageBox.warning(self, "No Selection", "Please select a snippet to see its history.")
+            return
+        path = selected_item.data(FILE_ROLE) or self.current_file
+        if not path or path == os.path.abspath(self.clipboard_history.path):
+            QMessageBox.information(self, "Snippet History", "This snippet has no history.")
+            return
+        snippet = selected_item.data(Qt.ItemDataRole.UserRole)
+        self.version_history.flush()
+        versions = self.version_history.versions(snippet["id"])
+        if len(versions) < 2:
+            QMessageBox.information(self, "Snippet History", "This snippet has no earlier versions.")
+            return
+        dialog = HistoryDialog(versions, self)
+        if dialog.exec():
+            _, title, body = dialog.selected_version()
+            restored = dict(snippet, title=title, snippet=body)
+            if restored == snippet:
+                return
+            try:
+                self.write_changes({path: [(snippet, restored)]})
+            except (OSError, ValueError) as e:
+                QMessageBox.warning(self, "Error", f"Failed to restore the snippet: {e}")
+                return
+            self.push_snippet_change(f"Restore '{title}'", path, snippet, restored)
+            self.status_bar.showMessage("Snippet restored.", 2000)
 
     def copy_snippet(self):
         """Copy the selected snippet to the clipboard."""
         selected_item = self.snippet_list.currentItem()
         if selected_item:
-            snippet = selected_item.text().split(":", 1)[1].strip()
-            clipboard = QApplication.clipboard()
-            clipboard.setText(snippet)
-            self.status_bar.showMessage(f"Snippet copied to clipboard:\n{snippet}", 2000)
+            self.copy_to_clipboard(selected_item.data(Qt.ItemDataRole.UserRole))
         else:
             QMessageBox.warning(self, "No Selection", "Please select a snippet to copy.")
 
+    def copy_to_clipboard(self, snippet):
+        """Put a snippet on the clipboard, with its placeholders filled in, and count the use."""
+        clipboard = QApplication.clipboard()
+        text = snippet["snippet"]
+        template = templates.compile_template(text)
+        if template.has_placeholders():
+            values = templates.default_variables(self.snippet_file_name(snippet), clipboard.text())
+            # Fields with a default just take it; only ask for the others
+            for number, default in template.fields.items():
+                if not default:
+                    value, ok = QInputDialog.getText(self, "Fill In Snippet", f"Value for ${number}:")
+                    if not ok:
+                        return
+                    values[number] = value
+            text = template.expand(values)
+
+        self.last_copied_text = text
+        clipboard.setText(text)
+        self.usage.record(snippet["id"])
+        if self.clipboard_history.add(text):
+            self.history_changed()
+        self.status_bar.showMessage(f"Snippet copied to clipboard:\n{text}", 2000)
+
+    def snippet_file_name(self, snippet):
+        """Return the name of the file a snippet is stored in, or '' if unknown."""
+        record_id = self.library.find(snippet["id"]) if self.library is not None else None
+        path = self.library.record(record_id)[0] if record_id is not None else self.current_file
+        return os.path.basename(path) if path else ""
+
+    def save_state(self, progress=None):
+        """Write snippet usage, clipboard history, snippet versions and tree stats if they changed."""
+        self.usage.flush()
+        self.clipboard_history.save()
+        self.version_history.flush()
+        self.sidebar.tree_stats.save()
+
+    def save_state_in_background(self):
+        """Write snippet usage, clipboard history, snippet versions and tree stats without blocking the window."""
+        if self.state_worker is not None and self.state_worker.isRunning():
+            return
+        if not (self.usage.pending or self.clipboard_history.dirty or self.version_history.pending or
+                self.sidebar.tree_stats.dirty):
+            return
+        self.state_worker = Worker(self.save_state, parent=self)
+        self.state_worker.start()
+
     def close_application(self):
         """Close the application."""
+        if self.state_worker is not None:
+            self.state_worker.wait()
+        self.save_state()
         QApplication.quit()
 
     def toggle_fullscreen(self):
@@ -552,9 +1967,7 @@ class SnippetManager(QMainWindow):
 
     def filter_snippets(self, text):
         """Filter snippets based on search text."""
-        for i in range(self.snippet_list.count()):
-            item = self.snippet_list.item(i)
-            item.setHidden(text.lower() not in item.text().lower())
+        self.apply_filters()
 
     def mousePressEvent(self, event: QMouseEvent):
         """Handle mouse press event for dragging the window."""
@@ -577,24 +1990,159 @@ class SnippetManager(QMainWindow):
                 del self.drag_position
         super().mouseReleaseEvent(event)
 
-    def handle_loaded_json(self, data):
+    def handle_loaded_json(self, data, file_path=None, version=None):
         """Handle the loaded JSON data."""
-        print("handle loaded json method called")
-        print(f"loaded json data: {data}")
+        # Opening a file leaves the library view
+        if self.showing_library:
+            self.showing_library = False
+            for combo in self.facet_filters.values():
+                combo.blockSignals(True)
+                combo.setCurrentIndex(0)
+                combo.blockSignals(False)
+
         # Clear the current snippet list
+        self.paged_file = None
         self.snippet_list.clear()
         
         # Add the loaded snippets to the list
-        for item in data:
-            self.snippet_list.addItem(f"{item['title']}: {item['snippet']}")
+        for item in snippet_store.ensure_ids(data):
+            self.snippet_list.addItem(self.make_snippet_item(item))
         
-        # Optionally, set the current file path
-        self.current_file = "C:/Users/User/Desktop/code-snippets/code-snippets/snippets/snippets.json"  # Update this as needed
+        # Remember which file and version the snippets came from so saving can merge
+        self.current_file = file_path
+        self.loaded_snippets = copy.deepcopy(data)
+        self.current_version = version
+
+    def handle_remote_command(self, message):
+        """Handle a request forwarded by another launch of the application."""
+        command = message.get("command")
+        if command == "pick":
+            # The picker works on its own, without bringing up the main window
+            self.quick_picker.popup()
+            return
+        if command == "open" and message.get("path"):
+            self.open_snippet_file(message["path"])
+        elif command == "search":
+            self.search_bar.setText(message.get("text", ""))
+            self.search_bar.setFocus()
+
+        # Bring the already running window to the front
+        if self.isMinimized():
+            self.showNormal()
+        self.raise_()
+        self.activateWindow()
+
+def parse_arguments(argv):
+    """Parse the command line."""
+    parser = argparse.ArgumentParser(description="Code snippet manager")
+    parser.add_argument("--open", metavar="FILE", help="open a snippet JSON file")
+    parser.add_argument("--search", metavar="TEXT", help="search the loaded snippets")
+    parser.add_argument("--pick", action="store_true",
+                        help="show the quick picker (bind this to a desktop hotkey)")
+    parser.add_argument("--dedupe-storage", action="store_true",
+                        help="store snippet bodies once in snippets/.blobs and exit")
+    parser.add_argument("--collect-garbage", action="store_true",
+                        help="remove stored bodies no snippet refers to and exit")
+    parser.add_argument("--compress-storage", action="store_true",
+                        help="train a compression dictionary over the stored bodies and exit")
+    parser.add_argument("--import", dest="import_paths", nargs="+", metavar="PATH",
+                        help="import .code-snippets, .sublime-snippet or source files and exit")
+    parser.add_argument("--import-into", metavar="FILE", default=os.path.join("snippets", "Imported", "imported.json"),
+                        help="snippet file to import into (default: %(default)s)")
+    parser.add_argument("--export", nargs=2, metavar=("FORMAT", "DEST"),
+                        help=f"export the snippet tree ({', '.join(exporter.FORMATS)}) to DEST and exit")
+    parser.add_argument("--export-filter", metavar="TEXT", help="only export snippets containing TEXT")
+    parser.add_argument("--find-duplicates", action="store_true",
+                        help="list clusters of identical and near-identical snippets and exit")
+    parser.add_argument("--expand-template", metavar="FILE",
+                        help="expand the snippet template in FILE once per row of --values and exit")
+    parser.add_argument("--values", metavar="CSV",
+                        help="CSV file whose header names template fields (1, 2...) or variables (DATE...)")
+    return parser.parse_args(argv)
+
+def build_message(args):
+    """Turn the command line into a request for the running instance."""
+    if args.open:
+        return {"command": "open", "path": os.path.abspath(args.open)}
+    if args.search is not None:
+        return {"command": "search", "text": args.search}
+    if args.pick:
+        return {"command": "pick"}
+    return {"command": "show"}
+
+def run_maintenance(args):
+    """Run the command-line-only tasks that were asked for. Return True if any ran."""
+    project_folder = os.path.join(os.getcwd(), "snippets")
+    if args.dedupe_storage:
+        converted = snippet_store.enable_blob_storage(project_folder)
+        print(f"Converted {converted} snippet file(s) to deduplicated storage.")
+    if args.collect_garbage:
+        removed = snippet_store.collect_garbage(project_folder)
+        print(f"Removed {removed} unreferenced snippet bod{'y' if removed == 1 else 'ies'}.")
+    if args.compress_storage:
+        if not os.path.isdir(os.path.join(project_folder, blob_store.BLOB_DIR)):
+            snippet_store.enable_blob_storage(project_folder)
+        compressed = blob_store.BlobStore(os.path.join(project_folder, blob_store.BLOB_DIR)).train_dictionary()
+        print(f"Compressed {compressed} snippet bod{'y' if compressed == 1 else 'ies'}.")
+    if args.import_paths:
+        def report(done, total):
+            print(f"\rParsed {done}/{total} file(s)", end="", flush=True)
+
+        added, skipped, errors, _ = importer.import_snippets(args.import_paths, args.import_into, progress=report)
+        print(f"\nImported {added} snippet(s), skipped {skipped} duplicate(s).")
+        for path, error in errors:
+            print(f"Could not import {path}: {error}")
+    if args.export:
+        export_format, destination = args.export
+        exported = exporter.export_snippets(project_folder, destination, export_format, query=args.export_filter)
+        print(f"Exported {exported} snippet(s) to {destination}.")
+    if args.find_duplicates:
+        for cluster in duplicates.find_duplicates(project_folder):
+            print(f"{len(cluster)} copies:")
+            for member in cluster:
+                print(f"  {member['similarity']:4.0%}  {os.path.relpath(member['path'], project_folder)}: "
+                      f"{member['title']}")
+    if args.expand_template:
+        with open(args.expand_template, "r", encoding="utf-8") as file:
+            template = templates.compile_template(file.read())
+        value_sets = [{}]
+        if args.values:
+            with open(args.values, "r", encoding="utf-8", newline="") as file:
+                # Short rows leave fields to their defaults; cells past the header are ignored
+                value_sets = [{int(key) if key.isdigit() else key: value for key, value in row.items()
+                               if key is not None and value is not None}
+                              for row in csv.DictReader(file)]
+        variables = templates.default_variables(os.path.basename(args.expand_template))
+        for text in template.expand_many([{**variables, **values} for values in value_sets]):
+            print(text, end="" if text.endswith("\n") else "\n")
+    return (args.dedupe_storage or args.collect_garbage or args.compress_storage
+            or bool(args.import_paths) or bool(args.export) or args.find_duplicates
+            or bool(args.expand_template))
 
 if __name__ == "__main__":
+    args = parse_arguments(sys.argv[1:])
+    if run_maintenance(args):
+        sys.exit(0)
+    message = build_message(args)
+
+    # Hand the request to an already running window instead of starting a second one
+    instance = SingleInstance()
+    if not instance.acquire():
+        sys.exit(0 if instance.send(message) else 1)
+
     app = QApplication(sys.argv)
 
     window = SnippetManager()
-    window.show()
-
-    sys.exit(app.exec())
+    instance.listen()
+    instance.message_received.connect(window.handle_remote_command)
+    if message["command"] == "pick":
+        # Started from the hotkey: stay in the background and only show the picker
+        QTimer.singleShot(0, window.quick_picker.popup)
+    else:
+        window.show()
+        if message["command"] != "show":
+            window.handle_remote_command(message)
+
+    exit_code = app.exec()
+    instance.release()
+    sys.exit(exit_code)
@@ -1,4 +1,4 @@
-import json
+import copy
 import sys
 from PyQt6.QtWidgets import (
     QApplication,
@@ -6,6 +6,7 @@ from PyQt6.QtWidgets import (
     QVBoxLayout,
     QPushButton,
     QListWidget,
+    QListWidgetItem,
     QMessageBox,
     QDialog,
     QPlainTextEdit,
@@ -18,6 +19,8 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtGui import QIcon, QFont, QMouseEvent, QKeySequence
 from PyQt6.QtCore import Qt, QPoint
 
+import snippet_store
+
 class AddSnippetDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -236,18 +239,29 @@ class SnippetManager(QMainWindow):
     def load_snippets(self):
         """Load snippets from the JSON file."""
         try:
-            with open(self.snippet_file, "r") as file:
-                snippets = json.load(file)
-                self.snippet_list.addItems([f"{item['title']}: {item['snippet']}" for item in snippets])
-        except (FileNotFoundError, json.JSONDecodeError):
-            self.snippet_list.addItems([])
+            snippets, self.snippet_version = snippet_store.read_snippets(self.snippet_file)
+        except (OSError, ValueError):
+            snippets, self.snippet_version = [], None
+        self.loaded_snippets = copy.deepcopy(snippets)
+        for item in snippets:
+            self.snippet_list.addItem(self.make_snippet_item(item))
 
     def save_snippets(self):
-        """Save snippets to the JSON file."""
-        snippets = [{"title": self.snippet_list.item(i).text().split(":")[0].strip(), 
-                     "snippet": self.snippet_list.item(i).text().split(":")[1].strip()} for i in range(self.snippet_list.count())]
-        with open(self.snippet_file, "w") as file:
-            json.dump(snippets, file, indent=4)
+        """Save snippets to the JSON file, merging changes made by other instances."""
+        snippets = [self.snippet_list.item(i).data(Qt.ItemDataRole.UserRole) for i in range(self.snippet_list.count())]
+        merged, self.snippet_version, _ = snippet_store.save_snippets(
+            self.snippet_file, snippets, self.loaded_snippets, self.snippet_version)
+        self.loaded_snippets = copy.deepcopy(merged)
+        if merged != snippets:
+            self.snippet_list.clear()
+            for item in merged:
+                self.snippet_list.addItem(self.make_snippet_item(item))
+
+    def make_snippet_item(self, snippet):
+        """Create a list item showing a snippet and carrying its data."""
+        item = QListWidgetItem(f"{snippet['title']}: {snippet['snippet']}")
+        item.setData(Qt.ItemDataRole.UserRole, snippet)
+        return item
 
     def add_snippet(self):
         """Open dialog to add a new snippet."""
@@ -255,7 +269,8 @@ class SnippetManager(QMainWindow):
         if dialog.exec():
             title, snippet = dialog.get_snippet()
             if title and snippet:
-                self.snippet_list.addItem(f"{title}: {snippet}")
+                snippet = {"id": snippet_store.new_snippet_id(), "title": title, "snippet": snippet}
+                self.snippet_list.addItem(self.make_snippet_item(snippet))
                 self.save_snippets()
                 self.status_bar.showMessage("Snippet added successfully.", 2000)
 
@@ -264,13 +279,15 @@ class SnippetManager(QMainWindow):
         selected_item = self.snippet_list.currentItem()
         if selected_item:
             dialog = AddSnippetDialog(self)
-            title, snippet = selected_item.text().split(":", 1)
-            dialog.title_edit.setText(title.strip())
-            dialog.text_edit.setPlainText(snippet.strip())
+            snippet = selected_item.data(Qt.ItemDataRole.UserRole)
+            dialog.title_edit.setText(snippet["title"])
+            dialog.text_edit.setPlainText(snippet["snippet"])
             if dialog.exec():
                 new_title, new_snippet = dialog.get_snippet()
                 if new_title and new_snippet:
+                    snippet = dict(snippet, title=new_title, snippet=new_snippet)
                     selected_item.setText(f"{new_title}: {new_snippet}")
+                    selected_item.setData(Qt.ItemDataRole.UserRole, snippet)
                     self.save_snippets()
                     self.status_bar.showMessage("Snippet edited successfully.", 2000)
         else:
@@ -290,7 +307,7 @@ class SnippetManager(QMainWindow):
         """Copy the selected snippet to the clipboard."""
         selected_item = self.snippet_list.currentItem()
         if selected_item:
-            snippet = selected_item.text().split(":", 1)[1].strip()
+            snippet = selected_item.data(Qt.ItemDataRole.UserRole)["snippet"]
             clipboard = QApplication.clipboard()
             clipboard.setText(snippet)
             self.status_bar.showMessage(f"Snippet copied to clipboard:\n{snippet}", 2000)
@@ -0,0 +1,123 @@
+import json
+import os
+import re
+from array import array
+
+import blob_store
+import snippet_store
+
+PAGE_SIZE = 500  # Snippets read and shown at a time
+RESIDENT_PAGES = 4  # Pages kept in the list; the rest are read again when scrolled back to
+PAGED_MIN_BYTES = 2 * 1024 * 1024  # Smaller files are simply read whole
+RECORD_START = b"\n    {"  # Start of every snippet in files written with indent=4, and nowhere else
+TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[\[\]{}]')
+
+
+def record_offsets(data):
+    """Return (starts, ends) byte offsets of the objects in a JSON array.
+
+    Files this app wrote are indented by four spaces, so every snippet
+    starts on a line of its own and a plain search finds them. Other files
+    are tokenized just enough to track nesting and skip strings.
+    """
+    starts = array("q")
+    ends = array("q")
+    if data.startswith(b"[" + RECORD_START):
+        position = data.find(RECORD_START)
+        while position != -1:
+            following = data.find(RECORD_START, position + 1)
+            starts.append(position + len(RECORD_START) - 1)
+            # The snippet ends at the last closing brace before the next one starts
+            ends.append(data.rfind(b"}", position, following if following != -1 else len(data)) + 1)
+            position = following
+        return starts, ends
+
+    depth = 0
+    for match in TOKEN.finditer(data):
+        token = match.group()
+        if token in (b"[", b"{"):
+            if depth == 1 and token == b"{":
+                starts.append(match.start())
+            depth += 1
+        elif token in (b"]", b"}"):
+            depth -= 1
+            if depth == 1 and token == b"}":
+                ends.append(match.end())
+    return starts, ends
+
+
+class PagedFile:
+    """Read the snippets of a big file a page at a time.
+
+    Opening the file only finds where each snippet is. A page is read by
+    seeking to its first snippet and parsing just its snippets; nothing
+    else stays in memory. The file is not kept open, so it can still be
+    replaced while it is shown.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.store = blob_store.store_for(path)
+        self.reindex()
+
+    def reindex(self):
+        """Find the snippets of the file as it is now."""
+        with snippet_store.locked(self.path):
+            self._reindex_unlocked()
+
+    def _reindex_unlocked(self):
+        info = os.stat(self.path)
+        with open(self.path, "rb") as file:
+            data = file.read()
+        self.stat = (info.st_mtime_ns, info.st_size)
+        self.starts, self.ends = record_offsets(data)
+        self.count = len(self.starts)
+
+    def changed(self):
+        """Return True if the file was written since it was indexed."""
+        try:
+            info = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        return (info.st_mtime_ns, info.st_size) != self.stat
+
+    def page_count(self):
+        return (self.count + PAGE_SIZE - 1) // PAGE_SIZE
+
+    def page(self, number):
+        """Return the snippets of a page, re-indexing first if the file changed.
+
+        The file is checked and read under its lock, so no writer can
+        replace it in between. A page that does not parse means it was
+        changed by something that does not take the lock; it is re-indexed
+        and read once more.
+        """
+        with snippet_store.locked(self.path):
+            if self.changed():
+                self._reindex_unlocked()
+            try:
+                return self._read_page(number)
+            except ValueError:
+                self._reindex_unlocked()
+                return self._read_page(number)
+
+    def _read_page(self, number):
+        first = number * PAGE_SIZE
+        last = min(first + PAGE_SIZE, self.count)
+        if first >= last:
+            return []
+        base = self.starts[first]
+        with open(self.path, "rb") as file:
+            file.seek(base)
+            data = file.read(self.ends[last - 1] - base)
+        snippets = []
+        for index in range(first, last):
+            snippet = json.loads(data[self.starts[index] - base:self.ends[index] - base])
+            if "blob" in snippet:
+                if self.store is None:
+                    raise ValueError(f"{self.path} references stored bodies but no {blob_store.BLOB_DIR} folder was found")
+                snippet["snippet"] = self.store.get(snippet.pop("blob"))
+            if not snippet.get("id"):
+                snippet["id"] = snippet_store.derived_id(index, snippet)
+            snippets.append(snippet)
+        return snippets
@@ -0,0 +1,155 @@
+import time
+
+from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtGui import QCursor, QGuiApplication
+from PyQt6.QtWidgets import QLineEdit, QListWidget, QListWidgetItem, QVBoxLayout, QWidget
+
+MAX_RESULTS = 20
+
+
+class QuickPicker(QWidget):
+    """Small always-on-top popup to find a snippet and copy it.
+
+    It is built once at startup and only hidden between uses, and it
+    searches the library index the main window already keeps loaded, so
+    showing it does no construction or file reading.
+    """
+
+    snippet_chosen = pyqtSignal(dict)
+
+    def __init__(self, parent=None):
+        super().__init__(parent, Qt.WindowType.Tool | Qt.WindowType.FramelessWindowHint |
+                         Qt.WindowType.WindowStaysOnTopHint)
+        self.library = None
+        self.usage = None
+        self.last_query = None
+        self.last_results = None
+
+        self.setStyleSheet("""
+            QWidget {
+                background-color: #2E3440;
+                color: #ECEFF4;
+            }
+            QLineEdit {
+                background-color: #3B4252;
+                border: 1px solid #81A1C1;
+                border-radius: 5px;
+                padding: 6px;
+                font-size: 16px;
+            }
+            QListWidget {
+                background-color: #3B4252;
+                border: 1px solid #4C566A;
+                border-radius: 5px;
+            }
+            QListWidget::item:selected {
+                background-color: #81A1C1;
+            }
+        """)
+        self.resize(600, 360)
+
+        layout = QVBoxLayout()
+        self.search_edit = QLineEdit(self)
+        self.search_edit.setPlaceholderText("Find a snippet...")
+        self.search_edit.textChanged.connect(self.update_results)
+        self.search_edit.returnPressed.connect(self.choose_current)
+        self.search_edit.installEventFilter(self)
+        layout.addWidget(self.search_edit)
+
+        self.result_list = QListWidget(self)
+        self.result_list.itemActivated.connect(self.choose_current)
+        layout.addWidget(self.result_list)
+        self.setLayout(layout)
+
+        # Create the native window and resolve styles now rather than on first use
+        self.ensurePolished()
+        self.winId()
+
+    def set_index(self, library, usage):
+        """Use this library and usage tracker for searching and ranking."""
+        self.library = library
+        self.usage = usage
+        self.last_query = None
+        self.last_results = None
+
+    def popup(self):
+        """Show the picker on the screen under the mouse, ready for typing."""
+        screen = QGuiApplication.screenAt(QCursor.pos()) or QGuiApplication.primaryScreen()
+        geometry = screen.availableGeometry()
+        self.move(geometry.center().x() - self.width() // 2, geometry.top() + geometry.height() // 4)
+        self.search_edit.clear()
+        self.update_results("")
+        self.show()
+        self.raise_()
+        self.activateWindow()
+        self.search_edit.setFocus()
+
+    def update_results(self, text):
+        """Show the best matches for the query."""
+        self.result_list.clear()
+        if self.library is None:
+            return
+
+        if text:
+            # A query that only grew can only match a subset of the previous matches
+            within = None
+            if self.last_query and text.lower().startswith(self.last_query):
+                within = self.last_results
+            results = self.library.search(text, within=within)
+            matches = set(results)
+        else:
+            results = iter(self.library.alive)  # Everything matches; only the first few are needed
+            matches = self.library.alive
+        self.last_query = text.lower()
+        self.last_results = results if text else None
+
+        # Used snippets first by frecency, then the rest in library order. Only the
+        # few used snippets are scored, not every match.
+        now = time.time()
+        scored = []
+        for snippet_id in self.usage.entries:
+            record_id = self.library.find(snippet_id)
+            if record_id is not None and record_id in matches:
+                scored.append((self.usage.frecency(snippet_id, now), record_id))
+        scored.sort(reverse=True)
+        ranked = [record_id for _, record_id in scored[:MAX_RESULTS]]
+        chosen = set(ranked)
+        for record_id in results:
+            if len(ranked) >= MAX_RESULTS:
+                break
+            if record_id not in chosen:
+                ranked.append(record_id)
+
+        for record_id in ranked:
+            _, snippet = self.library.record(record_id)
+            first_line = snippet["snippet"].split("\n", 1)[0]
+            item = QListWidgetItem(f"{snippet['title']}: {first_line}")
+            item.setData(Qt.ItemDataRole.UserRole, snippet)
+            self.result_list.addItem(item)
+        self.result_list.setCurrentRow(0)
+
+    def choose_current(self, *args):
+        """Hand the selected snippet over and hide."""
+        item = self.result_list.currentItem()
+        self.hide()
+        if item is not None:
+            self.snippet_chosen.emit(item.data(Qt.ItemDataRole.UserRole))
+
+    def eventFilter(self, watched, event):
+        """Let the arrow keys move through results while typing, Escape closes."""
+        if watched is self.search_edit and event.type() == event.Type.KeyPress:
+            if event.key() in (Qt.Key.Key_Down, Qt.Key.Key_Up):
+                step = 1 if event.key() == Qt.Key.Key_Down else -1
+                row = max(0, min(self.result_list.count() - 1, self.result_list.currentRow() + step))
+                self.result_list.setCurrentRow(row)
+                return True
+            if event.key() == Qt.Key.Key_Escape:
+                self.hide()
+                return True
+        return super().eventFilter(watched, event)
+
+    def changeEvent(self, event):
+        """Hide when the user clicks away, like other launcher popups."""
+        if event.type() == event.Type.ActivationChange and not self.isActiveWindow():
+            self.hide()
+        super().changeEvent(event)
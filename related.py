@@ -0,0 +1,328 @@
+import multiprocessing
+import os
+import re
+import zlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import snapshot
+
+N_FEATURES = 1 << 18  # Terms are hashed into this many columns, so there is no vocabulary to keep
+TITLE_WEIGHT = 2  # Title words count as often as this many body words
+DELTA_ROWS = 512  # Rows added since the last merge that are scored without postings
+PARALLEL_MIN_SNIPPETS = 5000  # Below this, tokenizing here is quicker than starting worker processes
+SHARD_SNIPPETS = 2000  # Snippets per task handed to a worker process
+SNAPSHOT_FILE = ".related_snapshot"
+SNAPSHOT_KIND = f"related-1-{N_FEATURES}-{TITLE_WEIGHT}"  # Features depend on both
+
+WORD = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+SUBWORD = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+
+
+def available():
+    """Return True if NumPy is installed, which related snippets need."""
+    return numpy is not None
+
+
+def terms(text):
+    """Yield the lower-cased identifiers of a text and their camelCase / snake_case parts."""
+    for word in WORD.findall(text):
+        if len(word) > 1:
+            yield word.lower()
+        if not word.islower() or "_" in word:
+            for part in SUBWORD.findall(word):
+                if len(part) > 1 and part != word:
+                    yield part.lower()
+
+
+@lru_cache(maxsize=1 << 16)
+def column(term):
+    """Return the feature column a term is hashed to."""
+    return zlib.crc32(term.encode("utf-8")) & (N_FEATURES - 1)
+
+
+def features(title, body):
+    """Return (columns, weights) of a snippet: hashed terms with sublinear term frequencies."""
+    counts = Counter(terms(body))
+    for term in terms(title):
+        counts[term] += TITLE_WEIGHT
+    by_column = {}
+    for term, count in counts.items():
+        key = column(term)
+        by_column[key] = by_column.get(key, 0) + count
+    columns = sorted(by_column)
+    weights = numpy.array([by_column[key] for key in columns], numpy.float32)
+    return numpy.array(columns, numpy.int32), 1 + numpy.log(weights)
+
+
+class RelatedIndex:
+    """TF-IDF vectors of snippets for finding the ones most similar to another.
+
+    Rows are only ever appended; a changed snippet gets a new row and its
+    old one is marked removed. Rows up to ``base_rows`` are stored as
+    column-major postings, so a query only touches the postings of its own
+    terms. Rows added later are a small delta scored directly until
+    ``merged_base`` (run in the background) folds them into the postings.
+
+    Term weights are stored without IDF; IDF comes from document
+    frequencies kept up to date on every change and is applied at query
+    time. Norms of the merged rows use the IDF of the last merge.
+    """
+
+    def __init__(self):
+        self.keys = []  # Row -> snippet id
+        self.features = []  # Row -> (columns, weights), None once removed
+        self.rows = {}  # Snippet id -> row
+        self.text_hashes = {}  # Snippet id -> hash of the indexed title and body
+        self.by_file = {}  # Path -> snippet ids
+        self.removed = set()  # Removed rows that may still be in the postings
+        self.document_frequency = numpy.zeros(N_FEATURES, numpy.int32)
+        self.count = 0
+        self.base_rows = 0
+        self.base_offsets = numpy.zeros(N_FEATURES + 1, numpy.int64)
+        self.base_postings = numpy.zeros(0, numpy.int32)
+        self.base_weights = numpy.zeros(0, numpy.float32)
+        self.base_norms = numpy.zeros(0, numpy.float32)
+
+    def add(self, snippet, known=None):
+        """Index a snippet, replacing an older version of it.
+
+        ``known`` is its (columns, weights) if they were worked out already.
+        """
+        self.remove(snippet["id"])
+        columns, weights = known if known is not None else features(snippet["title"], snippet["snippet"])
+        row = len(self.keys)
+        self.keys.append(snippet["id"])
+        self.features.append((columns, weights))
+        self.rows[snippet["id"]] = row
+        self.text_hashes[snippet["id"]] = hash((snippet["title"], snippet["snippet"]))
+        self.document_frequency[columns] += 1
+        self.count += 1
+
+    def remove(self, snippet_id):
+        """Drop a snippet from the index."""
+        row = self.rows.pop(snippet_id, None)
+        if row is None:
+            return
+        columns, _ = self.features[row]
+        self.document_frequency[columns] -= 1
+        self.features[row] = None
+        self.text_hashes.pop(snippet_id, None)
+        self.removed.add(row)
+        self.count -= 1
+
+    def set_file(self, path, snippets, known=None):
+        """Bring the snippets of one file up to date, re-indexing only changed ones.
+
+        ``known`` is a list of (columns, weights) matching ``snippets``, if
+        they were worked out already.
+        """
+        old_ids = self.by_file.get(path, set())
+        new_ids = set()
+        for position, snippet in enumerate(snippets):
+            new_ids.add(snippet["id"])
+            if self.text_hashes.get(snippet["id"]) != hash((snippet["title"], snippet["snippet"])):
+                self.add(snippet, known[position] if known is not None else None)
+        for snippet_id in old_ids - new_ids:
+            self.remove(snippet_id)
+        self.by_file[path] = new_ids
+
+    def idf(self):
+        return numpy.log((1 + self.count) / (1 + self.document_frequency)).astype(numpy.float32) + 1
+
+    def needs_merge(self):
+        return len(self.features) - self.base_rows > DELTA_ROWS
+
+    def merged_base(self, progress=None):
+        """Build postings for every row so far. Safe to run in a worker thread.
+
+        The result is handed to ``install`` on the thread that owns the index.
+        """
+        features = self.features[:]
+        removed = set(self.removed)
+        live = [(row, entry) for row, entry in enumerate(features) if entry is not None]
+        if live:
+            columns = numpy.concatenate([entry[0] for _, entry in live])
+            weights = numpy.concatenate([entry[1] for _, entry in live])
+            rows = numpy.repeat(numpy.array([row for row, _ in live], numpy.int32),
+                                [len(entry[0]) for _, entry in live])
+        else:
+            columns = numpy.zeros(0, numpy.int32)
+            weights = numpy.zeros(0, numpy.float32)
+            rows = numpy.zeros(0, numpy.int32)
+        idf = self.idf()
+        norms = numpy.sqrt(numpy.bincount(rows, weights=(weights * idf[columns]) ** 2, minlength=len(features)))
+        order = numpy.argsort(columns, kind="stable")
+        offsets = numpy.zeros(N_FEATURES + 1, numpy.int64)
+        numpy.cumsum(numpy.bincount(columns, minlength=N_FEATURES), out=offsets[1:])
+        return len(features), removed, offsets, rows[order], weights[order], norms.astype(numpy.float32)
+
+    def install(self, base):
+        """Start using postings built by ``merged_base``."""
+        self.base_rows, removed, self.base_offsets, self.base_postings, self.base_weights, self.base_norms = base
+        # Rows removed before the merge are not in the postings any more
+        self.removed -= removed
+
+    def related(self, snippet, limit=10):
+        """Return [(snippet id, similarity)] of the snippets most like this one, best first."""
+        if not self.count:
+            return []
+        idf = self.idf()
+        query_columns, query_weights = features(snippet["title"], snippet["snippet"])
+        if not len(query_columns):
+            return []
+        query_weights = query_weights * idf[query_columns]
+        query_norm = float(numpy.sqrt(numpy.dot(query_weights, query_weights)))
+        # Each document term gets IDF once more on its own side
+        query_weights = query_weights * idf[query_columns]
+        total_rows = len(self.features)
+        scores = numpy.zeros(total_rows, numpy.float32)
+
+        # Merged rows: only the postings of the query's terms
+        starts = self.base_offsets[query_columns]
+        ends = self.base_offsets[query_columns + 1]
+        hits = [(start, end, weight) for start, end, weight in zip(starts, ends, query_weights) if end > start]
+        if hits:
+            postings = numpy.concatenate([self.base_postings[start:end] for start, end, _ in hits])
+            contributions = numpy.concatenate([self.base_weights[start:end] * weight for start, end, weight in hits])
+            base_scores = numpy.bincount(postings, weights=contributions, minlength=self.base_rows)
+            norms = self.base_norms[:self.base_rows]
+            scores[:self.base_rows] = numpy.divide(base_scores, norms, out=numpy.zeros_like(base_scores),
+                                                   where=norms > 0)
+
+        # Rows added since: few enough to score all of their terms
+        delta = [(row, entry) for row, entry in enumerate(self.features[self.base_rows:], self.base_rows)
+                 if entry is not None]
+        if delta:
+            columns = numpy.concatenate([entry[0] for _, entry in delta])
+            weights = numpy.concatenate([entry[1] for _, entry in delta])
+            local = numpy.repeat(numpy.arange(len(delta)), [len(entry[0]) for _, entry in delta])
+            positions = numpy.minimum(numpy.searchsorted(query_columns, columns), len(query_columns) - 1)
+            matched = numpy.where(query_columns[positions] == columns, query_weights[positions], 0)
+            dots = numpy.bincount(local, weights=weights * matched, minlength=len(delta))
+            norms = numpy.sqrt(numpy.bincount(local, weights=(weights * idf[columns]) ** 2, minlength=len(delta)))
+            delta_rows = numpy.array([row for row, _ in delta])
+            scores[delta_rows] = numpy.divide(dots, norms, out=numpy.zeros_like(dots), where=norms > 0)
+
+        if self.removed:
+            scores[numpy.fromiter(self.removed, numpy.int64, len(self.removed))] = 0
+        own_row = self.rows.get(snippet["id"])
+        if own_row is not None:
+            scores[own_row] = 0
+        limit = min(limit, int(numpy.count_nonzero(scores)))
+        if limit <= 0:
+            return []
+        best = numpy.argpartition(-scores, limit - 1)[:limit]
+        best = best[numpy.argsort(-scores[best])]
+        return [(self.keys[row], float(scores[row]) / query_norm) for row in best]
+
+
+def pack_features(rows):
+    """Pack the (columns, weights) of a file's snippets into three flat arrays."""
+    lengths = numpy.array([len(columns) for columns, _ in rows], numpy.int64)
+    columns = numpy.concatenate([columns for columns, _ in rows]) if rows else numpy.zeros(0, numpy.int32)
+    weights = numpy.concatenate([weights for _, weights in rows]) if rows else numpy.zeros(0, numpy.float32)
+    return {"lengths": lengths, "columns": columns.astype(numpy.int32), "weights": weights.astype(numpy.float32)}
+
+
+def file_features(index, snippets):
+    """Return the packed features of a file's snippets as indexed."""
+    return pack_features([index.features[index.rows[snippet["id"]]] for snippet in snippets])
+
+
+def featurize_shard(shard):
+    """Return the packed features of each file of a shard, given as lists of (title, body). Runs in a worker process."""
+    return [pack_features([features(title, body) for title, body in texts]) for texts in shard]
+
+
+def parallel_features(snippet_lists, progress=None, max_workers=None):
+    """Work out the packed features of many files on a process pool, in order.
+
+    Files are grouped into shards of about SHARD_SNIPPETS snippets. Each
+    worker sends back flat arrays, which are cheap to pickle and are
+    merged by ``set_file`` as if they had been worked out here.
+    """
+    shards = []
+    current = []
+    size = 0
+    for snippets in snippet_lists:
+        current.append([(snippet["title"], snippet["snippet"]) for snippet in snippets])
+        size += len(snippets)
+        if size >= SHARD_SNIPPETS:
+            shards.append(current)
+            current = []
+            size = 0
+    if current:
+        shards.append(current)
+
+    packed = []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as executor:
+        for done, results in enumerate(executor.map(featurize_shard, shards), 1):
+            packed.extend(results)
+            if progress:
+                progress(done, len(shards))
+    return packed
+
+
+def snapshot_features(sections, count):
+    """Return the (columns, weights) of each snippet of a file, as views into the snapshot."""
+    lengths = numpy.frombuffer(sections["lengths"], numpy.int64)
+    if len(lengths) != count:
+        return None
+    columns = numpy.frombuffer(sections["columns"], numpy.int32)
+    weights = numpy.frombuffer(sections["weights"], numpy.float32)
+    ends = numpy.cumsum(lengths)
+    return [(columns[end - length:end], weights[end - length:end]) for end, length in zip(ends, lengths)]
+
+
+def build_related(files, progress=None, root=None, max_workers=None):
+    """Build a RelatedIndex from (path, snippets, stat) triples. Safe to run in a worker thread.
+
+    ``stat`` is the (mtime_ns, size) the snippets were read at, or None if
+    they changed since. With a ``root``, the features of files that did not
+    change are taken from the memory-mapped snapshot there instead of being
+    worked out again, and the snapshot is rewritten if any were. When many
+    snippets need tokenizing, it is spread over a process pool, falling back
+    to tokenizing here if the pool cannot be used. ``progress`` is first
+    called for the pool's shards, then for the files as they are indexed.
+    """
+    snapshot_path = os.path.join(root, SNAPSHOT_FILE) if root else None
+    old = snapshot.open_snapshot(snapshot_path, SNAPSHOT_KIND) if root else None
+    known = []
+    for path, snippets, stat in files:
+        key = snapshot.file_key(root, path) if root else None
+        sections = old.get(key, *stat) if old is not None and stat is not None else None
+        if sections is not None and snapshot_features(sections, len(snippets)) is None:
+            sections = None  # Snippet count changed without the file's mtime and size changing
+        known.append(sections)
+    stale = [position for position, sections in enumerate(known) if sections is None]
+    workers = max_workers or os.cpu_count() or 1
+    if workers > 1 and sum(len(files[position][1]) for position in stale) >= PARALLEL_MIN_SNIPPETS:
+        try:
+            packed = parallel_features([files[position][1] for position in stale], progress, workers)
+        except (BrokenProcessPool, OSError):
+            packed = []  # No worker processes here, e.g. in a frozen build; tokenize below instead
+        for position, sections in zip(stale, packed):
+            known[position] = sections
+
+    index = RelatedIndex()
+    entries = {}
+    for done, ((path, snippets, stat), sections) in enumerate(zip(files, known), 1):
+        index.set_file(path, snippets, snapshot_features(sections, len(snippets)) if sections is not None else None)
+        if root and stat is not None:
+            entries[snapshot.file_key(root, path)] = (
+                stat[0], stat[1], sections if sections is not None else file_features(index, snippets))
+        if progress and done % 100 == 0:
+            progress(done, len(files))
+    index.install(index.merged_base())
+    if root and (stale or old is None or len(old.files) != len(entries)):
+        snapshot.write_snapshot(snapshot_path, SNAPSHOT_KIND, entries)
+    return index
@@ -0,0 +1,85 @@
+import json
+import os
+
+from PyQt6.QtCore import QObject, QLockFile, QDir, QThread, pyqtSignal
+from PyQt6.QtNetwork import QLocalServer, QLocalSocket
+
+SERVER_NAME = "code-snippets-app"
+
+
+class SingleInstance(QObject):
+    """Make sure only one snippet manager runs and forward requests to it.
+
+    The first process to start takes a lock file and listens on a local
+    socket. Every later launch finds the lock taken, sends its request to the
+    running window as one line of JSON and exits without building any UI.
+    """
+
+    message_received = pyqtSignal(dict)
+
+    def __init__(self, name=SERVER_NAME, parent=None):
+        super().__init__(parent)
+        self.name = name
+        self.server = None
+        self.lock_file = QLockFile(os.path.join(QDir.tempPath(), f"{name}.lock"))
+        self.lock_file.setStaleLockTime(0)  # Only a dead owner process makes the lock stale
+
+    def acquire(self):
+        """Try to become the primary instance. Return True on success."""
+        return self.lock_file.tryLock(0)
+
+    def listen(self):
+        """Start accepting requests. Needs a running QApplication."""
+        # We own the lock, so any socket left behind belongs to a crashed instance
+        QLocalServer.removeServer(self.name)
+        self.server = QLocalServer(self)
+        self.server.newConnection.connect(self.on_new_connection)
+        return self.server.listen(self.name)
+
+    def send(self, message, timeout=2000):
+        """Send a request to the primary instance. Return True if it was delivered."""
+        socket = QLocalSocket()
+        waited = 0
+        # The primary may hold the lock but still be starting its server
+        while True:
+            socket.connectToServer(self.name)
+            if socket.waitForConnected(100):
+                break
+            waited += 100
+            if waited >= timeout:
+                return False
+            QThread.msleep(50)
+
+        socket.write((json.dumps(message) + "\n").encode("utf-8"))
+        socket.flush()
+        delivered = socket.bytesToWrite() == 0 or socket.waitForBytesWritten(timeout)
+        socket.disconnectFromServer()
+        return delivered
+
+    def on_new_connection(self):
+        """Read requests from a newly connected client."""
+        while self.server.hasPendingConnections():
+            socket = self.server.nextPendingConnection()
+            socket.setProperty("buffer", b"")
+            socket.readyRead.connect(lambda socket=socket: self.read_socket(socket))
+            socket.disconnected.connect(socket.deleteLater)
+
+    def read_socket(self, socket):
+        """Collect data from a client and emit each complete JSON line."""
+        buffer = socket.property("buffer") + bytes(socket.readAll())
+        *lines, rest = buffer.split(b"\n")
+        socket.setProperty("buffer", rest)
+        for line in lines:
+            try:
+                message = json.loads(line.decode("utf-8"))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                continue
+            if isinstance(message, dict):
+                self.message_received.emit(message)
+
+    def release(self):
+        """Stop listening and give up the lock."""
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        self.lock_file.unlock()
@@ -0,0 +1,83 @@
+import json
+import mmap
+import os
+import struct
+
+import snippet_store
+
+MAGIC = b"SNP1"
+ALIGN = 8  # Sections start at multiples of this, so arrays can be used in place
+
+
+class Snapshot:
+    """A snapshot file opened with mmap; sections are read only when asked for.
+
+    A snapshot holds named byte sections for every file it was taken from,
+    together with the (mtime, size) the file had then. The file ends with
+    a JSON header giving where each section is, then the header's offset
+    and the magic again.
+    """
+
+    def __init__(self, path, kind):
+        with open(path, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:4] != MAGIC or self.map[-4:] != MAGIC:
+            raise ValueError("not a snapshot")
+        header_offset, = struct.unpack("<Q", self.map[-12:-4])
+        header = json.loads(self.map[header_offset:len(self.map) - 12])
+        if header["kind"] != kind:
+            raise ValueError("snapshot of another kind or version")
+        self.files = header["files"]  # Key -> [mtime_ns, size, {section: [offset, length]}]
+
+    def get(self, key, mtime_ns, size):
+        """Return {section: memoryview} of a file, or None if it is not in the snapshot or changed since."""
+        entry = self.files.get(key)
+        if entry is None or entry[0] != mtime_ns or entry[1] != size:
+            return None
+        view = memoryview(self.map)
+        return {name: view[offset:offset + length] for name, (offset, length) in entry[2].items()}
+
+
+def open_snapshot(path, kind):
+    """Return the Snapshot at a path, or None if there is none or it cannot be used."""
+    try:
+        return Snapshot(path, kind)
+    except (OSError, ValueError, KeyError, struct.error):
+        return None
+
+
+def write_snapshot(path, kind, entries):
+    """Write a snapshot, replacing the old one.
+
+    ``entries`` maps a key to (mtime_ns, size, {section: bytes-like}).
+    Sections may be bytes or contiguous arrays.
+    """
+    files = {}
+    with snippet_store.locked(path):
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(MAGIC)
+            offset = len(MAGIC)
+            for key, (mtime_ns, size, sections) in entries.items():
+                spans = {}
+                for name, data in sections.items():
+                    data = memoryview(data).cast("B")
+                    padding = -offset % ALIGN
+                    file.write(b"\0" * padding)
+                    offset += padding
+                    file.write(data)
+                    spans[name] = [offset, len(data)]
+                    offset += len(data)
+                files[key] = [mtime_ns, size, spans]
+            file.write(json.dumps({"kind": kind, "files": files}, separators=(",", ":")).encode("utf-8"))
+            file.write(struct.pack("<Q", offset) + MAGIC)
+        try:
+            os.replace(temp_path, path)
+        except OSError:
+            # Windows will not replace a file that is still mapped; the old snapshot stays until next time
+            os.remove(temp_path)
+
+
+def file_key(root, path):
+    """Return the key of a file in a snapshot of the tree at root."""
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(root)).replace(os.sep, "/")
@@ -0,0 +1,412 @@
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+import uuid
+from contextlib import ExitStack, contextmanager
+
+import blob_store
+import trash
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+JOURNAL_FILE = ".transaction.json"  # Renames a transaction still has to carry out
+
+
+@contextmanager
+def locked(path):
+    """Hold an exclusive advisory lock on a snippet file while the block runs.
+
+    The lock is taken on a sidecar ``.lock`` file so the snippet file itself
+    can still be replaced atomically while we hold it.
+    """
+    with open(path + ".lock", "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def store_locked(paths):
+    """Lock the blob stores used by some snippet files, always in the same order.
+
+    Writers hold it from storing bodies until the file referencing them is
+    in place, so ``collect_garbage`` never sees a body as unreferenced that
+    a file is about to use.
+    """
+    stack = ExitStack()
+    stores = {blob_store.store_for(path) for path in paths}
+    for store_root in sorted(store.root for store in stores if store is not None):
+        stack.enter_context(locked(store_root))
+    return stack
+
+
+def content_version(data):
+    """Return the version tag of a file's raw bytes."""
+    return hashlib.sha1(data).hexdigest()
+
+
+def new_snippet_id():
+    """Return a fresh id for a snippet created in this process."""
+    return uuid.uuid4().hex[:16]
+
+
+def ensure_ids(snippets):
+    """Give every snippet an id.
+
+    Snippets written before ids existed get one derived from their position
+    and content, so two processes reading the same old file agree on it.
+    """
+    for index, snippet in enumerate(snippets):
+        if not snippet.get("id"):
+            snippet["id"] = derived_id(index, snippet)
+    return snippets
+
+
+def derived_id(index, snippet):
+    """Return the id ``ensure_ids`` gives an old snippet at a position of its file."""
+    key = f"{index}:{snippet.get('title', '')}:{snippet.get('snippet', '')}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _read_unlocked(path):
+    """Read a snippet file and return (snippets, version)."""
+    try:
+        with open(path, "rb") as file:
+            data = file.read()
+    except FileNotFoundError:
+        return [], None
+    snippets = json.loads(data.decode("utf-8")) if data.strip() else []
+    store = blob_store.store_for(path)
+    for snippet in snippets:
+        if "blob" in snippet:
+            if store is None:
+                raise ValueError(f"{path} references stored bodies but no {blob_store.BLOB_DIR} folder was found")
+            snippet["snippet"] = store.get(snippet.pop("blob"))
+    return ensure_ids(snippets), content_version(data)
+
+
+def _stage_unlocked(path, snippets):
+    """Write snippets to a temporary file next to ``path`` and return (temp path, version).
+
+    The file is flushed to disk but not put in place; that is up to the caller.
+    """
+    store = blob_store.store_for(path)
+    if store is not None:
+        # Keep the body in the blob store and only its digest in the file
+        records = []
+        for snippet in snippets:
+            record = {key: value for key, value in snippet.items() if key != "snippet"}
+            record["blob"] = store.put(snippet["snippet"])
+            records.append(record)
+    else:
+        records = snippets
+    data = json.dumps(records, indent=4).encode("utf-8")
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        # mkstemp creates private files; keep the permissions others rely on
+        try:
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(temp_path, 0o644)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return temp_path, content_version(data)
+
+
+def _write_unlocked(path, snippets):
+    """Atomically replace a snippet file and return its new version."""
+    with store_locked([path]):
+        temp_path, version = _stage_unlocked(path, snippets)
+        try:
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    return version
+
+
+def read_snippets(path):
+    """Read a snippet file under the lock and return (snippets, version)."""
+    with locked(path):
+        return _read_unlocked(path)
+
+
+def merge_snippets(base, ours, theirs):
+    """Three-way merge of snippet lists by id.
+
+    ``base`` is what we loaded, ``ours`` is what we want to write and
+    ``theirs`` is what is on disk now. Changes made on only one side are
+    kept. When both sides changed the same snippet ours wins. Returns
+    (merged, conflicts).
+    """
+    base_by_id = {snippet["id"]: snippet for snippet in base}
+    ours_by_id = {snippet["id"]: snippet for snippet in ours}
+    merged = []
+    conflicts = 0
+
+    # Keep the on-disk order and append our new snippets at the end
+    for their_snippet in theirs:
+        snippet_id = their_snippet["id"]
+        base_snippet = base_by_id.get(snippet_id)
+        our_snippet = ours_by_id.get(snippet_id)
+        if our_snippet is not None:
+            if our_snippet == base_snippet:
+                merged.append(their_snippet)
+            else:
+                if their_snippet not in (base_snippet, our_snippet):
+                    conflicts += 1
+                merged.append(our_snippet)
+        elif base_snippet is None:
+            merged.append(their_snippet)  # Added by someone else
+        elif their_snippet != base_snippet:
+            conflicts += 1
+            merged.append(their_snippet)  # We deleted it, they edited it: keep the edit
+
+    theirs_ids = {snippet["id"] for snippet in theirs}
+    for our_snippet in ours:
+        snippet_id = our_snippet["id"]
+        if snippet_id in theirs_ids:
+            continue
+        base_snippet = base_by_id.get(snippet_id)
+        if base_snippet is None:
+            merged.append(our_snippet)  # Added by us
+        elif our_snippet != base_snippet:
+            conflicts += 1
+            merged.append(our_snippet)  # They deleted it, we edited it: keep the edit
+
+    return merged, conflicts
+
+
+def save_snippets(path, snippets, base=None, base_version=None):
+    """Write snippets to a file without losing changes made by other processes.
+
+    ``base`` and ``base_version`` describe the file as it was when it was
+    loaded. If the file changed on disk since then, the changes are merged
+    by snippet id before writing. Returns (snippets, version, conflicts)
+    where ``snippets`` is what actually got written.
+    """
+    ensure_ids(snippets)
+    with locked(path):
+        theirs, version = _read_unlocked(path)
+        conflicts = 0
+        if version is not None and version != base_version:
+            snippets, conflicts = merge_snippets(base or [], snippets, theirs)
+        version = _write_unlocked(path, snippets)
+    return snippets, version, conflicts
+
+
+def _apply_updates(snippets, upserts, deletes):
+    """Return snippets with ``upserts`` replacing or appended and ``deletes`` ids left out."""
+    deletes = set(deletes)
+    replacements = {}
+    for snippet in upserts:
+        snippet.setdefault("id", new_snippet_id())
+        replacements[snippet["id"]] = snippet
+    updated = []
+    for snippet in snippets:
+        if snippet["id"] in deletes:
+            continue
+        updated.append(replacements.pop(snippet["id"], snippet))
+    updated.extend(replacements.values())
+    return updated
+
+
+def update_snippets(path, upserts=(), deletes=()):
+    """Apply snippet changes directly to the latest version of a file.
+
+    ``upserts`` replace snippets with the same id or are appended,
+    ``deletes`` is a collection of ids to remove. Returns (snippets, version).
+    """
+    with locked(path):
+        snippets, _ = _read_unlocked(path)
+        updated = _apply_updates(snippets, upserts, deletes)
+        version = _write_unlocked(path, updated)
+    return updated, version
+
+
+def _write_journal(path, renames):
+    """Durably record the renames of a transaction; once this returns it has happened."""
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        json.dump(renames, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+    if fcntl is not None:
+        # Make the rename itself durable
+        folder = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+        try:
+            os.fsync(folder)
+        finally:
+            os.close(folder)
+
+
+def _recover_unlocked(root):
+    """Finish the renames of a transaction that was interrupted. Returns the number done."""
+    journal = os.path.join(root, JOURNAL_FILE)
+    try:
+        with open(journal, "r", encoding="utf-8") as file:
+            renames = json.load(file)
+    except FileNotFoundError:
+        return 0
+    except ValueError:
+        # Torn journal: the transaction never committed and its staged files are stray
+        os.remove(journal)
+        return 0
+    done = 0
+    for source, target in renames:
+        # A rename is done once its source is gone, so replaying the journal is safe
+        if os.path.exists(source):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(source, target)
+            done += 1
+    os.remove(journal)
+    return done
+
+
+def recover(root):
+    """Complete a transaction left half done by a crash below ``root``. Returns the number of renames done."""
+    with locked(os.path.join(root, JOURNAL_FILE)):
+        return _recover_unlocked(root)
+
+
+def apply_transaction(root, changes=None, moves=(), progress=None):
+    """Apply snippet changes and file moves below ``root`` all at once or not at all.
+
+    ``changes`` maps a path to (upserts, deletes) as taken by
+    ``update_snippets``; ``moves`` is a list of (source, target) file paths,
+    carried out after the changes. Every new file is first written next to
+    the file it replaces, then the list of renames that put them in place
+    is written to a journal in ``root``. Only then are the renames done.
+    A crash before the journal is written leaves every file as it was; a
+    crash after it is finished by ``recover``. Safe to run in a worker
+    thread. Returns {path: snippets} of the changed files.
+    """
+    changes = changes or {}
+    journal = os.path.join(root, JOURNAL_FILE)
+    paths = sorted({os.path.abspath(path) for path in changes} |
+                   {os.path.abspath(path) for move in moves for path in move})
+    sources = [os.path.abspath(source) for source, _ in moves]
+    targets = [os.path.abspath(target) for _, target in moves]
+    if len(set(sources + targets)) < 2 * len(moves):
+        # One rename would undo or overwrite another, and the reverse moves could not bring it back
+        raise FileExistsError("moves must not share a source or target")
+    written = {}
+    renames = []
+    with locked(journal), ExitStack() as stack:
+        _recover_unlocked(root)
+        for path in paths:  # Always in the same order, so two transactions cannot deadlock
+            stack.enter_context(locked(path))
+        stack.enter_context(store_locked(paths))  # Until the staged files are in place
+        for source, target in moves:
+            if not os.path.isfile(source):
+                raise FileNotFoundError(f"{source} does not exist")
+            if os.path.exists(target):
+                raise FileExistsError(f"{target} already exists")
+        try:
+            for done, (path, (upserts, deletes)) in enumerate(changes.items(), 1):
+                snippets, _ = _read_unlocked(path)
+                written[path] = _apply_updates(snippets, upserts, deletes)
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                temp_path, _ = _stage_unlocked(path, written[path])
+                renames.append([temp_path, os.path.abspath(path)])
+                if progress:
+                    progress(done, len(changes))
+            renames.extend([os.path.abspath(source), os.path.abspath(target)] for source, target in moves)
+            _write_journal(journal, renames)
+        except BaseException:
+            if os.path.exists(journal):
+                raise  # Committed after all; recover will finish it
+            for temp_path, _ in renames[:len(written)]:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            raise
+        _recover_unlocked(root)
+    return written
+
+
+def update_fields(path, fields_by_id):
+    """Set fields on snippets of the latest version of a file.
+
+    ``fields_by_id`` maps a snippet id to a dict of fields to set. Snippets
+    that were deleted in the meantime are skipped. Returns (snippets, version).
+    """
+    with locked(path):
+        snippets, version = _read_unlocked(path)
+        changed = False
+        for snippet in snippets:
+            fields = fields_by_id.get(snippet["id"])
+            if fields and any(snippet.get(key) != value for key, value in fields.items()):
+                snippet.update(fields)
+                changed = True
+        if changed:
+            version = _write_unlocked(path, snippets)
+    return snippets, version
+
+
+def collect_garbage(root):
+    """Remove blobs that no snippet file references any more, trashed files included. Returns the count."""
+    store = blob_store.BlobStore(os.path.join(root, blob_store.BLOB_DIR))
+    if not os.path.isdir(store.root):
+        return 0
+
+    def trashed():
+        for folder in trash.item_folders(root):
+            yield from blob_store.snippet_files(folder)
+
+    referenced = set()
+    with locked(store.root):
+        # The trash is read on both sides of the tree, so a file moved in or out meanwhile is still seen
+        for path in itertools.chain(trashed(), blob_store.snippet_files(root), trashed()):
+            try:
+                with open(path, "r", encoding="utf-8") as file:
+                    records = json.load(file)
+            except FileNotFoundError:
+                continue  # Moved between the tree and the trash; seen on the other side
+            except (OSError, ValueError):
+                return 0  # Never delete blobs while a file cannot be checked
+            referenced.update(record["blob"] for record in records if isinstance(record, dict) and "blob" in record)
+
+        removed = 0
+        for digest in list(store.digests()):
+            if digest not in referenced:
+                os.remove(store.path_for(digest))
+                removed += 1
+    return removed
+
+
+def enable_blob_storage(root):
+    """Switch a snippet tree to deduplicated body storage and convert its files.
+
+    Returns the number of files converted.
+    """
+    os.makedirs(os.path.join(root, blob_store.BLOB_DIR), exist_ok=True)
+    blob_store.forget_stores()
+    converted = 0
+    for path in blob_store.snippet_files(root):
+        update_snippets(path)  # Rewriting moves the bodies into the blob store
+        converted += 1
+    return converted
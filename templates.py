@@ -0,0 +1,135 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+
+# Variables filled in when a snippet is copied. VS Code names work too.
+VARIABLE_ALIASES = {
+    "CURRENT_DATE": "DATE", "CURRENT_TIME": "TIME", "TM_FILENAME": "FILENAME",
+}
+VARIABLES = ("DATE", "TIME", "FILENAME", "CLIPBOARD")
+
+# Only braced placeholders count; bare $1 and $NAME are left for the shell, awk and regex snippets that use them
+TOKEN = re.compile(
+    r"\\(?P<escaped>\$)"
+    r"|\$\{(?P<braced>\d+|[A-Z_]+)(?::(?P<default>(?:\\.|[^}\\])*))?\}"
+)
+SHELL_OPERATORS = ("-", "=", "?", "+")  # ${1:-default} and the like are shell parameter expansions
+CACHE_SIZE = 512
+
+
+class Template:
+    """A snippet body parsed into literal text, fields and variables.
+
+    ``parts`` is a tuple of ("text", value), ("field", number, default) and
+    ("variable", name, default) entries, so filling it in is a single pass
+    that never looks at the original text again.
+    """
+
+    __slots__ = ("parts", "fields")
+
+    def __init__(self, parts):
+        self.parts = parts
+        fields = {}
+        for part in parts:
+            if part[0] == "field" and part[1] != 0:
+                fields.setdefault(part[1], part[2])
+        self.fields = fields  # Field number -> default, in order of first use
+
+    def has_placeholders(self):
+        """Return True if the body has fields or variables.
+
+        Bodies without any are copied as they are, so an escaped ``\\$`` in
+        ordinary code is left alone.
+        """
+        return any(part[0] != "text" for part in self.parts)
+
+    def expand(self, values=None):
+        """Fill in fields and variables.
+
+        ``values`` maps field numbers and variable names to text, e.g.
+        ``{1: "name", **default_variables()}``. A missing field gets the
+        default given where it first appears, a missing variable its own
+        default. None counts as missing, as for the short rows of a CSV file.
+        """
+        values = values or {}
+        fields = self.fields
+        pieces = []
+        for part in self.parts:
+            kind = part[0]
+            if kind == "text":
+                pieces.append(part[1])
+            elif kind == "field":
+                number = part[1]
+                value = values.get(number)
+                pieces.append(value if value is not None else fields.get(number, part[2]))
+            else:
+                value = values.get(part[1])
+                pieces.append(value if value is not None else part[2])
+        return "".join(pieces)
+
+    def expand_many(self, value_sets):
+        """Expand the template once for every set of values."""
+        return [self.expand(values) for values in value_sets]
+
+
+def parse(body):
+    """Parse a snippet body into a Template."""
+    parts = []
+    text = []
+    position = 0
+    for match in TOKEN.finditer(body):
+        text.append(body[position:match.start()])
+        position = match.end()
+        if match.group("escaped"):
+            text.append(match.group("escaped"))
+            continue
+        name = match.group("braced")
+        default = match.group("default")
+        if default and default.startswith(SHELL_OPERATORS):
+            text.append(match.group(0))
+            continue
+        default = re.sub(r"\\(.)", r"\1", default) if default else ""
+        if name.isdigit():
+            part = ("field", int(name), default)
+        else:
+            name = VARIABLE_ALIASES.get(name, name)
+            if name not in VARIABLES:
+                text.append(match.group(0))  # Not ours, e.g. a shell variable
+                continue
+            part = ("variable", name, default)
+        if "".join(text):
+            parts.append(("text", "".join(text)))
+        text = []
+        parts.append(part)
+    text.append(body[position:])
+    if "".join(text):
+        parts.append(("text", "".join(text)))
+    return Template(tuple(parts))
+
+
+_cache = OrderedDict()
+
+
+def compile_template(body):
+    """Return the parsed template of a body, parsing each distinct body only once."""
+    key = hashlib.sha1(body.encode("utf-8")).digest()
+    template = _cache.get(key)
+    if template is None:
+        template = parse(body)
+        _cache[key] = template
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    else:
+        _cache.move_to_end(key)
+    return template
+
+
+def default_variables(file_name="", clipboard=""):
+    """Return the values variables get when a snippet is copied now."""
+    return {
+        "DATE": time.strftime("%Y-%m-%d"),
+        "TIME": time.strftime("%H:%M:%S"),
+        "FILENAME": file_name,
+        "CLIPBOARD": clipboard,
+    }
@@ -0,0 +1,103 @@
+import json
+import os
+import shutil
+import time
+import uuid
+
+TRASH_DIR = ".trash"
+KEEP_DAYS = 7  # Deleted items can be restored for this long before their space is reclaimed
+INFO_FILE = "info.json"
+ITEM_DIR = "item"
+
+
+def trash_folder(root):
+    return os.path.join(root, TRASH_DIR)
+
+
+def item_folders(root):
+    """Yield the folder holding the trashed file or folder of every trash entry."""
+    try:
+        names = os.listdir(trash_folder(root))
+    except FileNotFoundError:
+        return
+    for entry_id in names:
+        yield os.path.join(trash_folder(root), entry_id, ITEM_DIR)
+
+
+def move_to_trash(root, path):
+    """Move a file or folder below ``root`` into the trash and return the id of its trash entry.
+
+    This is a single rename inside the same tree, so it takes as long for a
+    folder of thousands of files as for one file. The space is only given
+    back by ``reclaim``.
+    """
+    entry_id = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+    entry = os.path.join(trash_folder(root), entry_id)
+    os.makedirs(os.path.join(entry, ITEM_DIR))
+    with open(os.path.join(entry, INFO_FILE), "w", encoding="utf-8") as file:
+        json.dump({"path": os.path.relpath(path, root), "time": time.time()}, file)
+    try:
+        os.replace(path, os.path.join(entry, ITEM_DIR, os.path.basename(path)))
+    except OSError:
+        shutil.rmtree(entry, ignore_errors=True)
+        raise
+    return entry_id
+
+
+def entries(root):
+    """Return [(entry id, original path relative to root, time deleted)] of the trash, newest first."""
+    found = []
+    try:
+        names = os.listdir(trash_folder(root))
+    except FileNotFoundError:
+        return found
+    for entry_id in names:
+        try:
+            with open(os.path.join(trash_folder(root), entry_id, INFO_FILE), "r", encoding="utf-8") as file:
+                info = json.load(file)
+        except (OSError, ValueError):
+            continue  # Being reclaimed, or never finished moving in
+        found.append((entry_id, info["path"], info["time"]))
+    found.sort(key=lambda entry: entry[2], reverse=True)
+    return found
+
+
+def restore(root, entry_id):
+    """Put a trashed file or folder back where it was and return its path."""
+    entry = os.path.join(trash_folder(root), entry_id)
+    with open(os.path.join(entry, INFO_FILE), "r", encoding="utf-8") as file:
+        info = json.load(file)
+    path = os.path.join(root, info["path"])
+    if os.path.exists(path):
+        raise FileExistsError(f"{info['path']} exists again; move it away first")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(os.path.join(entry, ITEM_DIR, os.path.basename(path)), path)
+    shutil.rmtree(entry, ignore_errors=True)
+    return path
+
+
+def reclaim(root, max_age=KEEP_DAYS * 24 * 60 * 60, progress=None):
+    """Delete trash entries older than ``max_age`` seconds, or all of them if it is None.
+
+    Slow for big folders, so run it in a worker thread. Returns the number
+    of entries deleted.
+    """
+    try:
+        names = os.listdir(trash_folder(root))
+    except FileNotFoundError:
+        return 0
+    now = time.time()
+    # Entry ids start with the time of deletion, which also covers entries whose info is gone
+    old = [entry_id for entry_id in names
+           if max_age is None or now - int(entry_id.split("-")[0]) / 1000 > max_age]
+    for done, entry_id in enumerate(old, 1):
+        entry = os.path.join(trash_folder(root), entry_id)
+        # Drop the info first, so a half-deleted entry is never offered for restoring
+        try:
+            os.remove(os.path.join(entry, INFO_FILE))
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(entry, ignore_errors=True)
+        if progress:
+            progress(done, len(old))
+    return len(old)
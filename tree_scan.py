@@ -0,0 +1,55 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+MAX_WORKERS = 8  # Folders listed at once; listing mostly waits on the disk, so threads overlap well
+
+
+def list_folder(root, relative):
+    """Return (relative, sub-folder names, snippet file names) of one folder, names sorted.
+
+    ``relative`` is the folder's path below ``root`` with / separators, ""
+    for the root itself. Hidden entries are skipped, and so are symlinked
+    folders, which could loop.
+    """
+    folders = []
+    files = []
+    with os.scandir(os.path.join(root, relative) if relative else root) as entries:
+        for entry in entries:
+            if entry.name.startswith("."):
+                continue  # Storage, history and trash
+            if entry.is_dir(follow_symlinks=False):
+                folders.append(entry.name)
+            elif entry.name.endswith(".json") and entry.is_file():
+                files.append(entry.name)
+    return relative, sorted(folders, key=str.lower), sorted(files, key=str.lower)
+
+
+def scan_tree(root, emit=None, progress=None, max_workers=MAX_WORKERS):
+    """List every folder below ``root`` at any depth, several folders at a time.
+
+    Each folder found is listed on a pool of threads as soon as its parent
+    has been, which hides the latency of slow or network-mounted disks.
+    ``emit`` is called with a list of (relative, folders, files) entries
+    whenever some folders are done; a folder always comes after its parent.
+    Returns {relative folder: (folders, files)}.
+    """
+    tree = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(list_folder, root, "")}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            batch = []
+            for future in done:
+                try:
+                    relative, folders, files = future.result()
+                except OSError:
+                    continue  # Removed or unreadable since its parent was listed
+                tree[relative] = (folders, files)
+                batch.append((relative, folders, files))
+                for name in folders:
+                    pending.add(executor.submit(list_folder, root, f"{relative}/{name}" if relative else name))
+            if emit and batch:
+                emit(batch)
+            if progress:
+                progress(len(tree), len(tree) + len(pending))
+    return tree
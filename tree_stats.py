@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+
+import blob_store
+
+STATS_FILE = ".tree_stats.json"
+STATS_VERSION = 1
+
+
+def count_snippets(path):
+    """Return the number of snippets in a file without resolving stored bodies."""
+    with open(path, "rb") as file:
+        data = file.read()
+    return len(json.loads(data.decode("utf-8"))) if data.strip() else 0
+
+
+class TreeStats:
+    """Snippet count, size and last change of every snippet file below a folder.
+
+    Counts are kept in a small cache on disk next to the (mtime, size) of
+    the file they were taken from, so a scan only has to stat files and
+    parses just the ones that changed. Folder totals are added up from the
+    file entries when asked for.
+
+    ``scanned`` runs in a worker thread and its result is handed to
+    ``install`` on the thread that owns the stats; ``set_file`` updates
+    one file in between.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, STATS_FILE)
+        self.files = {}  # Path relative to root, with / -> [mtime_ns, size, count]
+        self.touched = set()  # Files set since the running scan started
+        self.dirty = False
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            return
+        if cache.get("version") == STATS_VERSION:
+            self.files = cache["files"]
+
+    def save(self):
+        """Write the cache if it changed. Safe to call from a worker thread."""
+        with self.lock:
+            if not self.dirty:
+                return
+            cache = {"version": STATS_VERSION, "files": dict(self.files)}
+            self.dirty = False
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(cache, file, separators=(",", ":"))
+        os.replace(temp_path, self.path)
+
+    def key(self, path):
+        """Return the cache key of a path, or None if it is not a snippet file of the tree."""
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(self.root))
+        parts = relative.split(os.sep)
+        if relative.startswith("..") or not relative.endswith(".json") or any(part.startswith(".") for part in parts):
+            return None
+        return "/".join(parts)
+
+    def scanned(self, progress=None):
+        """Stat every snippet file and count the snippets of those that changed.
+
+        Returns the new entries for ``install``.
+        """
+        with self.lock:
+            cached = dict(self.files)
+            self.touched = set()
+        paths = list(blob_store.snippet_files(self.root))
+        files = {}
+        for done, path in enumerate(paths, 1):
+            key = self.key(path)
+            try:
+                info = os.stat(path)
+                entry = cached.get(key)
+                if entry is None or entry[0] != info.st_mtime_ns or entry[1] != info.st_size:
+                    entry = [info.st_mtime_ns, info.st_size, count_snippets(path)]
+            except (OSError, ValueError):
+                continue  # Gone or being written; picked up next time
+            files[key] = entry
+            if progress and done % 100 == 0:
+                progress(done, len(paths))
+        return files
+
+    def install(self, files):
+        """Start using the entries of a scan, keeping files set since it started."""
+        with self.lock:
+            for key in self.touched:
+                if key in self.files:
+                    files[key] = self.files[key]
+                else:
+                    files.pop(key, None)
+            self.dirty = self.dirty or files != self.files
+            self.files = files
+
+    def set_file(self, path, count=None):
+        """Bring one file up to date after it was written, moved or deleted."""
+        key = self.key(path)
+        if key is None:
+            return
+        try:
+            info = os.stat(path)
+            entry = [info.st_mtime_ns, info.st_size, count_snippets(path) if count is None else count]
+        except (OSError, ValueError):
+            entry = None
+        with self.lock:
+            self.touched.add(key)
+            if entry is None:
+                self.dirty = self.files.pop(key, None) is not None or self.dirty
+            elif self.files.get(key) != entry:
+                self.files[key] = entry
+                self.dirty = True
+
+    def file_stats(self, path):
+        """Return (count, size, mtime in seconds) of a file, or None if it was not counted yet."""
+        entry = self.files.get(self.key(path))
+        if entry is None:
+            return None
+        return entry[2], entry[1], entry[0] / 1e9
+
+    def folder_totals(self):
+        """Return {folder relative to root, with /: (count, size, newest mtime)}; the root is ""."""
+        totals = {}
+        for key, (mtime_ns, size, count) in self.files.items():
+            folder = key
+            while folder:
+                folder = folder.rpartition("/")[0]
+                old_count, old_size, old_mtime = totals.get(folder, (0, 0, 0))
+                totals[folder] = (old_count + count, old_size + size, max(old_mtime, mtime_ns / 1e9))
+        return totals
+
+    def folder_key(self, path):
+        relative = os.path.relpath(os.path.abspath(path), os.path.abspath(self.root))
+        return "" if relative == "." else relative.replace(os.sep, "/")
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
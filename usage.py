@@ -0,0 +1,108 @@
+import json
+import math
+import os
+import threading
+import time
+
+import snippet_store
+
+USAGE_FILE = ".usage.json"
+HALF_LIFE_DAYS = 14  # A use counts half as much after this long
+DECAY_RATE = math.log(2) / (HALF_LIFE_DAYS * 24 * 60 * 60)
+
+
+class UsageTracker:
+    """Count how often and how recently snippets are used.
+
+    ``record`` only appends to an in-memory list, so it is cheap enough for
+    every copy. ``flush`` (run from a background thread) replays the pending
+    uses onto the file on disk under its lock, so several instances add up
+    instead of overwriting each other.
+
+    Each snippet keeps a frecency score that decays exponentially. It is
+    stored together with the time it was last brought up to date, so a use
+    updates it in O(1) and scores taken at the same moment compare
+    correctly.
+    """
+
+    def __init__(self, root):
+        self.path = os.path.join(root, USAGE_FILE)
+        self.entries = {}  # Snippet id -> {"count", "last", "score", "score_at"}
+        self.pending = []  # (snippet id, time) not written yet
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        """Read the usage file if there is one."""
+        try:
+            with open(self.path, "r") as file:
+                self.entries = json.load(file)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def record(self, snippet_id, now=None):
+        """Note one use of a snippet."""
+        now = time.time() if now is None else now
+        with self.lock:
+            apply_use(self.entries, snippet_id, now)
+            self.pending.append((snippet_id, now))
+
+    def frecency(self, snippet_id, now=None):
+        """Return the decayed use score of a snippet, 0 if never used."""
+        entry = self.entries.get(snippet_id)
+        if entry is None:
+            return 0.0
+        now = time.time() if now is None else now
+        return entry["score"] * math.exp(-DECAY_RATE * max(0.0, now - entry["score_at"]))
+
+    def most_used(self, limit=20):
+        """Return the ids of the highest-scoring snippets, best first."""
+        now = time.time()
+        ranked = sorted(self.entries, key=lambda snippet_id: self.frecency(snippet_id, now), reverse=True)
+        return ranked[:limit]
+
+    def flush(self, progress=None):
+        """Write pending uses to disk. Safe to call from a worker thread."""
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if not pending:
+            return 0
+
+        try:
+            with snippet_store.locked(self.path):
+                try:
+                    with open(self.path, "r") as file:
+                        entries = json.load(file)
+                except (OSError, ValueError):
+                    entries = {}
+                for snippet_id, when in pending:
+                    apply_use(entries, snippet_id, when)
+                temp_path = self.path + ".tmp"
+                with open(temp_path, "w") as file:
+                    json.dump(entries, file)
+                os.replace(temp_path, self.path)
+        except BaseException:
+            with self.lock:
+                # Not written; keep the uses for the next flush, ahead of newer ones
+                self.pending = pending + self.pending
+            raise
+
+        with self.lock:
+            # Uses recorded while we were writing are still pending; keep them counted
+            for snippet_id, when in self.pending:
+                apply_use(entries, snippet_id, when)
+            self.entries = entries
+        return len(pending)
+
+
+def apply_use(entries, snippet_id, when):
+    """Add one use at time ``when`` to a usage table."""
+    entry = entries.setdefault(snippet_id, {"count": 0, "last": 0, "score": 0.0, "score_at": when})
+    entry["count"] += 1
+    entry["last"] = max(entry["last"], when)
+    if when >= entry["score_at"]:
+        entry["score"] = entry["score"] * math.exp(-DECAY_RATE * (when - entry["score_at"])) + 1
+        entry["score_at"] = when
+    else:
+        # An older use replayed from another instance
+        entry["score"] += math.exp(-DECAY_RATE * (entry["score_at"] - when))
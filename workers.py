@@ -0,0 +1,45 @@
+from PyQt6.QtCore import QThread, pyqtSignal
+
+
+class Worker(QThread):
+    """Run a function off the GUI thread and report back through signals.
+
+    The function is called with the given arguments plus a ``progress``
+    keyword argument, a callable taking (done, total).
+    """
+
+    progress = pyqtSignal(int, int)
+    result = pyqtSignal(object)
+    error = pyqtSignal(str)
+
+    def __init__(self, function, *args, parent=None, **kwargs):
+        super().__init__(parent)
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    def run(self):
+        try:
+            value = self.function(*self.args, progress=self.progress.emit, **self.kwargs)
+        except Exception as e:
+            self.error.emit(str(e))
+        else:
+            self.result.emit(value)
+
+
+class StreamWorker(Worker):
+    """A Worker whose function can also hand over results as it goes.
+
+    The function gets an ``emit`` keyword argument as well, a callable
+    taking one object that is passed on through the ``partial`` signal.
+    """
+
+    partial = pyqtSignal(object)
+
+    def run(self):
+        try:
+            value = self.function(*self.args, progress=self.progress.emit, emit=self.partial.emit, **self.kwargs)
+        except Exception as e:
+            self.error.emit(str(e))
+        else:
+            self.result.emit(value)